@@ -0,0 +1,90 @@
+"""
+Compare cold and warm scans of a generated workspace.
+
+    python benchmarks/scan_index.py [--dirs 10000]
+
+The cold scan starts without a scan index, the warm one reuses the index
+written by the cold scan.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from echogit.config import Config  # noqa: E402
+from echogit.sync_folder import SyncFolder  # noqa: E402
+
+PROJECT_CONFIG = "[ECHOGIT]\nsync_type = git\n\n[BRANCHES]\n" \
+    "sync_branches = master\n"
+
+
+def create_workspace(root, nb_dirs, per_folder=100, project_every=10):
+    """
+    Create nb_dirs folders below root: folders of per_folder entries, one
+    entry out of project_every being a git project.
+    """
+    created = 0
+    folder_id = 0
+    while created < nb_dirs:
+        folder = os.path.join(root, f"folder{folder_id}")
+        os.makedirs(folder)
+        created += 1
+        for i in range(min(per_folder, nb_dirs - created)):
+            path = os.path.join(folder, f"entry{i}")
+            if i % project_every == 0:
+                os.makedirs(os.path.join(path, ".git"))
+                os.makedirs(os.path.join(path, ".echogit"))
+                with open(os.path.join(path, ".echogit", "config.ini"),
+                          "w") as f:
+                    f.write(PROJECT_CONFIG)
+            else:
+                os.makedirs(path)
+                with open(os.path.join(path, "file"), "w") as f:
+                    f.write("data")
+            created += 1
+        folder_id += 1
+
+
+def time_scan(config, jobs):
+    start = time.perf_counter()
+    folder = SyncFolder(config.projects_path, config=config)
+    folder.scan(jobs)
+    return time.perf_counter() - start, len(folder.get_projects())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--dirs", type=int, default=10000,
+                        help="number of folders to create")
+    parser.add_argument("--runs", type=int, default=3,
+                        help="number of warm scans, the best one is kept")
+    parser.add_argument("-j", "--jobs", type=int, default=4,
+                        help="number of scan threads")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["XDG_CACHE_HOME"] = os.path.join(tmp, "cache")
+        root = os.path.join(tmp, "workspace")
+        create_workspace(root, args.dirs)
+        # Like a real workspace, nothing changed in the last seconds: the
+        # index doesn't trust mtimes within the file system granularity
+        old = time.time() - 60
+        for folder, _dirs, files in os.walk(root):
+            for path in [folder] + [os.path.join(folder, f) for f in files]:
+                os.utime(path, (old, old))
+        config = Config(config_string=f"[DEFAULT]\nprojects_path = {root}\n")
+
+        cold, projects = time_scan(config, args.jobs)
+        warm = min(time_scan(config, args.jobs)[0]
+                   for _ in range(args.runs))
+
+    print(f"{args.dirs} folders, {projects} projects, {args.jobs} jobs")
+    print(f"cold scan: {cold * 1000:.0f} ms")
+    print(f"warm scan: {warm * 1000:.0f} ms ({cold / warm:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
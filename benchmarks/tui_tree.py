@@ -0,0 +1,94 @@
+"""
+Time the TUI tree walker on a large generated tree.
+
+    python benchmarks/tui_tree.py [--nodes 50000]
+
+No terminal is needed: the list box is rendered to a canvas.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from echogit.node import Node  # noqa: E402
+from echogit.sync_folder import SyncFolder  # noqa: E402
+from echogit.tui import build_ui  # noqa: E402
+
+SCREEN = (100, 50)
+
+
+def create_tree(nb_nodes, per_folder=1000):
+    """Return a root folder with folders of per_folder leaves each."""
+    root = SyncFolder("/nonexistent/workspace")
+    root.scanned = True
+    created = 1
+    folder = None
+    while created < nb_nodes:
+        if folder is None or len(folder.children) == per_folder:
+            folder = SyncFolder(os.path.join(root.path, f"folder{created}"),
+                                parent=root)
+            folder.scanned = True
+            root.add_child(folder)
+        else:
+            folder.add_child(Node(f"project{created}", path=folder.path,
+                                  parent=folder))
+        created += 1
+    return root
+
+
+def timed(label, function):
+    start = time.perf_counter()
+    function()
+    print(f"{label}: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--nodes", type=int, default=50000,
+                        help="number of nodes of the tree")
+    args = parser.parse_args()
+
+    root = create_tree(args.nodes)
+    big_folder = root.children[len(root.children) // 2]
+    print(f"{args.nodes} nodes, {len(root.children)} folders")
+
+    listbox = None
+
+    def build():
+        nonlocal listbox
+        listbox = build_ui(root)
+
+    def expand_all():
+        for folder in root.children:
+            listbox.body.expand(folder)
+
+    def render():
+        listbox.render(SCREEN, focus=True)
+
+    def focus_big_folder():
+        listbox.body.set_focus(big_folder)
+
+    def page_down():
+        listbox.keypress(SCREEN, "page down")
+
+    timed("startup (top level)", build)
+    timed("render", render)
+    timed("expand all folders", expand_all)
+    timed("render", render)
+    timed("focus a folder in the middle", focus_big_folder)
+    timed("render", render)
+    timed("page down", page_down)
+    timed("render", render)
+    timed("collapse the focused folder",
+          lambda: listbox.body.collapse(big_folder))
+    timed("render", render)
+    timed("expand it again", lambda: listbox.body.expand(big_folder))
+    timed("render", render)
+    timed("count visible rows",
+          lambda: print(f"  {sum(1 for _ in listbox.body.rows())} rows"))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,24 @@
+import contextlib
 import os
+import sys
+import json
+import time
 import subprocess
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from echogit.config import Config
 from echogit.tui import run_ui
 from echogit.node_factory import NodeFactory
 from echogit.version import Version
 from echogit.sync_node_config import SyncNodeConfig
 from echogit.node import Node
+from echogit.peer_probe import PeerProbe
+from echogit.agent import Agent
+from echogit.manifest import Manifest
+from echogit.watcher import Watcher
+from echogit.scheduler import Scheduler, SchedulerClient
+from echogit.sync_order import SyncOrder
+from echogit.sync_pool import SyncPool
 
 
 def main():
@@ -22,6 +34,18 @@ def main():
                              help="Verbose output")
     sync_parser.add_argument("-p", "--peer", default=None,
                              help="Specify a peer to sync with")
+    sync_parser.add_argument("-j", "--jobs", type=int, default=1,
+                             help="Number of projects synced concurrently")
+    sync_parser.add_argument(
+        "--deadline", type=SyncOrder.parse_duration, default=None,
+        help="Stop starting projects after this time (60s, 5m, 1h), "
+             "syncing the most useful ones first")
+    sync_parser.add_argument(
+        "--plan", action="store_true",
+        help="Show what would be synced, without syncing")
+    sync_parser.add_argument(
+        "-f", "--format", choices=["table", "json"], default="table",
+        help="Output format of --plan")
 
     # clone command
     clone_parser = subparsers.add_parser("clone", help="Clone a project")
@@ -48,9 +72,68 @@ def main():
                              help="Specify a peer for remote listing")
     list_parser.add_argument(
         "-c", "--cached", action="store_true", help="Use cached data")
+    list_parser.add_argument(
+        "-f", "--format", choices=["text", "json", "ndjson"], default="text",
+        help="Output format")
+    list_parser.add_argument(
+        "--token", action="store_true",
+        help="Only print a token that changes when projects change")
+
+    # watch command
+    watch_parser = subparsers.add_parser(
+        "watch", help="Sync projects as soon as they change")
+    watch_parser.add_argument("folder", nargs="?", default=None,
+                              help="Folder to watch")
+    watch_parser.add_argument("-v", "--verbose", action="store_true",
+                              help="Verbose output")
+    watch_parser.add_argument("-j", "--jobs", type=int, default=1,
+                              help="Number of projects synced concurrently")
+    watch_parser.add_argument(
+        "--debounce", type=float, default=2.0,
+        help="Seconds without changes before syncing")
+    watch_parser.add_argument(
+        "--full-sync", type=float, default=3600,
+        help="Seconds between two syncs of all projects, 0 to disable")
+    watch_parser.add_argument(
+        "--poll", action="store_true",
+        help="Poll folders instead of using inotify")
+
+    # scheduler command
+    scheduler_parser = subparsers.add_parser(
+        "scheduler", help="Run or query the sync scheduler daemon")
+    scheduler_parser.add_argument(
+        "action", choices=["run", "enqueue", "status"],
+        help="run the daemon, queue a sync on it or show its status")
+    scheduler_parser.add_argument(
+        "folder", nargs="?", default=None,
+        help="Folder to schedule (run) or project or folder to sync (enqueue)")
+    scheduler_parser.add_argument("-p", "--peer", default=None,
+                                  help="Only sync with this peer (enqueue)")
+    scheduler_parser.add_argument("-j", "--jobs", type=int, default=2,
+                                  help="Number of jobs run concurrently")
+    scheduler_parser.add_argument(
+        "--interval", type=float, default=600,
+        help="Seconds between two queueings of all projects")
+    scheduler_parser.add_argument("-v", "--verbose", action="store_true",
+                                  help="Verbose output")
+
+    # status command
+    status_parser = subparsers.add_parser(
+        "status", help="Show the status of the last sync, without syncing")
+    status_parser.add_argument("folder", nargs="?", default=None,
+                               help="Folder or project to show")
+    status_parser.add_argument(
+        "-f", "--format", choices=["tree", "table", "json"], default="tree",
+        help="Output format")
 
     # tui command
-    subparsers.add_parser("tui", help="Launch TUI interface")
+    tui_parser = subparsers.add_parser("tui", help="Launch TUI interface")
+    tui_parser.add_argument(
+        "--no-sync", action="store_true",
+        help="Only show the status of the last sync")
+    tui_parser.add_argument(
+        "-j", "--jobs", type=int, default=4,
+        help="Number of projects synced concurrently")
 
     # version command
     version_parser = subparsers.add_parser("version", help="Print version")
@@ -59,6 +142,33 @@ def main():
     version_parser.add_argument(
         "-c", "--cached", action="store_true", help="Use cached data")
 
+    # handshake command
+    handshake_parser = subparsers.add_parser(
+        "handshake", help="Print config, version, projects and capabilities")
+    handshake_parser.add_argument(
+        "--json", action="store_true", help="Print as a single JSON line")
+    handshake_parser.add_argument(
+        "--if-token", default=None,
+        help="Omit projects if their token didn't change")
+
+    # agent command
+    agent_parser = subparsers.add_parser(
+        "agent", help="Answer peer requests (used through ssh)")
+    agent_parser.add_argument(
+        "--stdio", action="store_true", help="Serve requests on stdin/stdout")
+
+    # manifest command
+    manifest_parser = subparsers.add_parser(
+        "manifest", help="Maintain the manifest of projects served to peers")
+    manifest_parser.add_argument(
+        "--refresh", action="store_true", help="Rebuild the manifest")
+    manifest_parser.add_argument(
+        "--update", default=None, metavar="REPO",
+        help="Update one repository (used by the post-receive hook)")
+    manifest_parser.add_argument(
+        "--install-hooks", action="store_true",
+        help="Install a post-receive hook in bare git repositories")
+
     # peers command
     peers_parser = subparsers.add_parser("peers", help="List available peers")
     peers_parser.add_argument(
@@ -74,18 +184,44 @@ def main():
     elif args.command == "sync":
         config = Config.get_local_instance()
         folder = args.folder or config.projects_path
-        handle_sync_command(folder, args.verbose)
+        if args.plan:
+            handle_plan_command(folder, args.format)
+        else:
+            handle_sync_command(folder, args.verbose, args.jobs,
+                                args.deadline)
     elif args.command == "clone":
         folder = args.folder
         handle_clone_command(folder, args.peer)
+    elif args.command == "watch":
+        config = Config.get_local_instance()
+        folder = args.folder or config.projects_path
+        Watcher(folder, config=config, jobs=args.jobs,
+                debounce=args.debounce, full_sync=args.full_sync,
+                poll=args.poll, verbose=args.verbose).run()
+    elif args.command == "scheduler":
+        handle_scheduler_command(args)
+    elif args.command == "status":
+        config = Config.get_local_instance()
+        folder = args.folder or config.projects_path
+        handle_status_command(folder, args.format)
     elif args.command == "tui":
-        run_ui()
+        run_ui(not args.no_sync, args.jobs)
     elif args.command == "list":
         config = Config.get_local_instance()
         folder = args.folder or config.git_path or config.projects_path
-        handle_list_command(folder, args.remote, args.peer, args.cached)
+        if args.token:
+            print(Agent().token())
+        else:
+            handle_list_command(folder, args.remote, args.peer, args.cached,
+                                args.format)
     elif args.command == "peers":
         handle_peers_command(args.verbose)
+    elif args.command == "handshake":
+        handle_handshake_command(args.json, args.if_token)
+    elif args.command == "agent":
+        handle_agent_command(args.stdio)
+    elif args.command == "manifest":
+        handle_manifest_command(args)
     else:
         print("Unknown command")
         print_usage()
@@ -98,8 +234,13 @@ def print_usage():
     print("  clone          - Clone a project")
     print("  config         - Show configuration")
     print("  list           - List projects (local or remote)")
+    print("  status         - Show the status of the last sync")
+    print("  watch          - Sync projects as soon as they change")
+    print("  scheduler      - Run or query the sync scheduler daemon")
     print("  peers          - List available peers")
     print("  version        - Print version")
+    print("  handshake      - Print what peers need to know in one call")
+    print("  manifest       - Maintain the manifest of served projects")
 
 
 def _parse_set_string(set_string):
@@ -199,17 +340,131 @@ def handle_version_command(peer_str, cached):
     print(version)
 
 
+def handle_handshake_command(as_json, if_token=None):
+    """
+    Print in one response everything a peer needs: config, version,
+    project manifest and capabilities. Used by Peer to save round trips.
+    """
+    handshake = Agent().handshake(if_token)
+
+    if as_json:
+        print(json.dumps(handshake))
+    else:
+        print(f"version={handshake['version']}")
+        print(f"capabilities={','.join(handshake['capabilities'])}")
+        print(f"token={handshake['token']}")
+        if handshake["projects"] is not None:
+            print(f"projects={len(handshake['projects'])}")
+
+
+def handle_agent_command(stdio):
+    if not stdio:
+        print("Only --stdio is supported")
+        return
+    Agent().serve()
+
+
+def handle_manifest_command(args):
+    config = Config.get_local_instance()
+    manifest = Manifest(config)
+    if args.update:
+        manifest.update_repo(os.path.abspath(args.update))
+    elif args.install_hooks:
+        manifest.install_hooks(os.path.abspath(sys.argv[0]))
+    else:
+        if args.refresh and os.path.exists(manifest.path):
+            os.remove(manifest.path)
+        token = manifest.get_token()
+        print(f"manifest={manifest.path}")
+        print(f"token={token}")
+        print(f"projects={len(manifest.records)}")
+
+
+def _probe_peers(peers):
+    """Mark unreachable peers down before doing any real work."""
+    config = Config.get_local_instance()
+    return PeerProbe(config.probe_timeout).probe_all(peers)
+
+
 def _get_root_node(folder):
     node = NodeFactory.from_folder(folder)
     node.scan()
     return node
 
 
-def handle_sync_command(folder, verbose):
+def _sync_before_deadline(node, verbose, jobs, deadline):
+    """
+    Sync the most useful projects first and stop starting projects at
+    deadline. Projects not synced in time go first next time.
+    """
+    projects = node.get_projects() if node.is_folder() else [node]
+    order = SyncOrder()
+    projects = order.sort(projects)
+    pool = SyncPool(jobs, verbose=verbose)
+    success, total = pool.sync(projects, deadline=deadline)
+    order.save_deferred(pool.deferred, projects)
+    if pool.deferred:
+        print(f"deferred {len(pool.deferred)} projects: "
+              f"{', '.join(project.name for project in pool.deferred)}")
+    return success, total
+
+
+def handle_sync_command(folder, verbose, jobs=1, deadline=None):
+    if deadline is not None:
+        deadline += time.monotonic()
+    _probe_peers(Config.get_local_instance().get_peers().values())
     node = _get_root_node(folder)
     print(f"Syncing {node.name}...")
-    success, total = node.sync(verbose=verbose)
+    if deadline is not None:
+        success, total = _sync_before_deadline(node, verbose, jobs, deadline)
+    elif node.is_folder():
+        success, total = node.sync(verbose=verbose, jobs=jobs)
+    else:
+        success, total = node.sync(verbose=verbose)
     print(f"done on {success}/{total}...")
+    projects = node.get_projects() if node.is_folder() else [node]
+    Manifest(node.config).update_projects(projects)
+
+    if verbose:
+        for peer in node.config.get_peers().values():
+            print(f"{peer.name}: {peer.get_ssh_stats_str()}")
+
+
+def handle_plan_command(folder, output_format="table"):
+    """
+    Show what a sync would do for each project, peer and branch. Only
+    local refs, the project listings of the peers and rsync --dry-run are
+    used: nothing is fetched or changed.
+    """
+    config = Config.get_local_instance()
+    _probe_peers(config.get_peers().values())
+    node = _get_root_node(folder)
+    projects = node.get_projects() if node.is_folder() else [node]
+    with ThreadPoolExecutor(max_workers=config.scan_jobs) as executor:
+        records = [record for project_records in
+                   executor.map(lambda p: p.get_plan_records(), projects)
+                   for record in project_records]
+
+    if output_format == "json":
+        print(json.dumps(records))
+        return
+
+    rows = [(r["path"], r["peer"], r["branch"] or "-", r["state"],
+             "-" if r["ahead"] is None else str(r["ahead"]),
+             "-" if r["behind"] is None else str(r["behind"]),
+             "-" if r["bytes"] is None else str(r["bytes"]))
+            for r in records]
+    header = ("PROJECT", "PEER", "BRANCH", "STATE", "AHEAD", "BEHIND",
+              "BYTES")
+    widths = [max(len(row[i]) for row in rows + [header])
+              for i in range(len(header))]
+    for row in [header] + rows:
+        print("  ".join(value.ljust(width)
+                        for value, width in zip(row, widths)).rstrip())
+    to_sync = [r for r in records if r["state"] != "up-to-date"]
+    total_bytes = sum(r["bytes"] or 0 for r in records)
+    print(f"{len(to_sync)}/{len(records)} to sync, "
+          f"{total_bytes} bytes of rsync transfers")
 
 
 def _clone_project(folder, peers):
@@ -232,7 +487,8 @@ def _clone_project(folder, peers):
             sync_type = SyncNodeConfig.SYNC_TYPE_GIT
             command = ["git", "clone", "--origin", peer.name, remote_url, folder]
         elif remote_url.endswith('.rsync'):
-            command = ["rsync", "-avz", f"{remote_url}/", folder]
+            command = ["rsync", "-avz"] + peer.get_rsync_options() + \
+                [f"{remote_url}/", folder]
             sync_type = SyncNodeConfig.SYNC_TYPE_RSYNC
         else:
             print(f"Unknown sync type for {remote_url}, skipping peer {peer.name}")
@@ -240,7 +496,8 @@ def _clone_project(folder, peers):
 
         try:
             result = subprocess.run(
-                command, capture_output=True, text=True, check=True)
+                command, capture_output=True, text=True, check=True,
+                env=peer.get_git_env())
             if result.returncode == 0:
                 print(f"Successfully cloned {folder} from {peer.name}")
                 return  sync_type
@@ -258,33 +515,134 @@ def handle_clone_command(folder, peer):
     if os.path.exists(folder):
         raise FileExistsError(f"Cannot clone into existing folder: {folder}")
 
+    _probe_peers(peers)
+
     sync_type = _clone_project(folder, peers)
     if sync_type != SyncNodeConfig.SYNC_TYPE_UNKNOWN:
         SyncNodeConfig.create_default_config(folder, sync_type)
+        Manifest(config).update_projects(
+            [NodeFactory.from_folder(os.path.abspath(folder), config)])
     else:
         print(f"Error: Could not clone {folder} from any peer")
 
 
-def handle_list_command(folder, remote, peer, cached):
+def _print_records(records, output_format):
+    if output_format == "json":
+        print(json.dumps(records))
+    else:
+        for record in records:
+            print(json.dumps(record))
+
+
+def handle_list_command(folder, remote, peer, cached, output_format="text"):
     config = Config.get_local_instance()
     node = _get_root_node(folder)
-    node.scan()
     ours = node.get_children_tree_by_path()
-    print(f"Local projects: {ours}")
+
+    if output_format == "text":
+        print(f"Local projects: {ours}")
+    elif not remote:
+        _print_records(node.get_project_records(), output_format)
 
     if not remote:
         return
 
     available = {}
+    records = []
     peers = [config.get_peer(peer)] if peer else config.get_peers().values()
+    if not cached:
+        _probe_peers(peers)
 
     for p in peers:
         remote_projects = list_remote_projects(p, cached)
         filtered = {pth: name for pth,
                     name in remote_projects.items() if pth not in ours}
         available.update(filtered)
+        for pth in filtered:
+            record = p.get_remote_record(pth)
+            records.append(dict(record, peer=p.name))
 
-    print(f"Available remote projects: {available}")
+    if output_format == "text":
+        print(f"Available remote projects: {available}")
+    else:
+        _print_records(node.get_project_records() + records, output_format)
+
+
+def handle_scheduler_command(args):
+    config = Config.get_local_instance()
+    if args.action == "run":
+        folder = args.folder or config.projects_path
+        Scheduler(folder, config=config, jobs=args.jobs,
+                  interval=args.interval, verbose=args.verbose).run()
+        return
+
+    client = SchedulerClient()
+    try:
+        if args.action == "enqueue":
+            folder = os.path.abspath(args.folder or config.projects_path)
+            count = client.enqueue(folder, args.peer)
+            print(f"{count} jobs queued")
+            return
+        status = client.request("status")
+    except OSError as e:
+        print(f"No scheduler running: {e}", file=sys.stderr)
+        sys.exit(1)
+    except RuntimeError as e:
+        print(f"Scheduler error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"queued: {status['queued']}")
+    for path in status["running"]:
+        print(f"running: {path}")
+    for name, peer in status["peers"].items():
+        print(f"{name}: {peer['state']}, {peer['failures']} failures, "
+              f"retry in {peer['retry_in']}s")
+
+
+def _format_status(record):
+    status = f"[{record['state']}]"
+    status += f" last sync: {record['last_sync'] or 'never'}"
+    if record["peers_down"]:
+        status += f" down: {', '.join(record['peers_down'])}"
+    return status
+
+
+def _print_status_tree(node, depth=0):
+    indent = "  " * depth
+    if node.is_folder():
+        print(f"{indent}{node.name}/")
+        for child in node.children:
+            _print_status_tree(child, depth + 1)
+    elif hasattr(node, "get_status_record"):
+        print(f"{indent}{node.name} {_format_status(node.get_status_record())}")
+
+
+def handle_status_command(folder, output_format="tree"):
+    """
+    Show the cached status of the last sync. Nothing is synced: no git,
+    rsync or ssh command is run.
+    """
+    if output_format == "tree":
+        _print_status_tree(_get_root_node(folder))
+        return
+
+    # Messages printed while building the tree would corrupt the json
+    redirect = contextlib.redirect_stdout(sys.stderr) \
+        if output_format == "json" else contextlib.nullcontext()
+    with redirect:
+        node = _get_root_node(folder)
+        projects = node.get_projects() if node.is_folder() else [node]
+        records = [project.get_status_record() for project in projects]
+    if output_format == "json":
+        print(json.dumps(records))
+        return
+
+    width = max([len("PROJECT")] + [len(r["path"]) for r in records])
+    print(f"{'PROJECT':<{width}}  {'STATE':<10}  {'LAST SYNC':<19}  DOWN")
+    for record in records:
+        last_sync = (record["last_sync"] or "never")[:19]
+        print(f"{record['path']:<{width}}  {record['state']:<10}  "
+              f"{last_sync:<19}  {','.join(record['peers_down'])}")
 
 
 def list_remote_projects(peer, cached):
@@ -297,9 +655,13 @@ def handle_peers_command(verbose):
     config = Config.get_local_instance()
     path = os.path.abspath(os.path.expanduser(config.projects_path))
     node = NodeFactory.from_folder(path)
-    for _, peer in node.config.get_peers().items():
+    peers = _probe_peers(node.config.get_peers().values())
+    for peer in peers:
         status = ": is down" if peer.is_down else ""
         print(f"{peer.name}{status}")
+        if verbose and not peer.is_down:
+            print(f"  latency: {peer.latency * 1000:.1f}ms")
+            print(f"  {peer.get_ssh_stats_str(measure=True)}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,112 @@
+import contextlib
+import json
+import os
+import sys
+from echogit.config import Config
+from echogit.git_refs import GitRefs
+from echogit.manifest import Manifest
+from echogit.version import Version
+
+
+class Agent:
+    """
+    Remote end of a peer session, answering framed JSON requests.
+
+    Requests and responses are JSON objects, one per line:
+        {"id": 1, "op": "version", "args": {}}
+        {"id": 1, "result": "0.0.1"}  or  {"id": 1, "error": "..."}
+    """
+
+    def __init__(self, config=None):
+        self.config = config or Config.get_local_instance()
+
+    def serve(self, stdin=sys.stdin, stdout=sys.stdout):
+        """Answer requests until stdin is closed."""
+        for line in stdin:
+            if not line.strip():
+                continue
+            response = self.handle(line)
+            stdout.write(json.dumps(response) + "\n")
+            stdout.flush()
+
+    @staticmethod
+    def dispatch(target, line):
+        """
+        Answer one request line by calling the _op_<op> method of target
+        with the args of the request, and return the response.
+        """
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            op = request["op"]
+            args = request.get("args", {})
+        except (ValueError, KeyError, AttributeError) as e:
+            return {"id": None, "error": f"invalid request: {e}"}
+
+        handler = getattr(target, f"_op_{op}", None)
+        if handler is None:
+            return {"id": request_id, "error": f"unknown op: {op}"}
+
+        try:
+            result = handler(**args)
+        except Exception as e:
+            return {"id": request_id, "error": str(e)}
+        return {"id": request_id, "result": result}
+
+    def handle(self, line):
+        # Anything printed while handling would corrupt the stream
+        with contextlib.redirect_stdout(sys.stderr):
+            return Agent.dispatch(self, line)
+
+    def handshake(self, if_token=None):
+        """
+        Return everything a peer needs to know in one response: config,
+        version, project manifest and capabilities.
+        Projects are omitted if their token is still if_token.
+        """
+        manifest = Manifest(self.config)
+        token = manifest.get_token()
+        projects = None if token == if_token else manifest.records
+        return {
+            "version": self._op_version(),
+            "capabilities": Version.CAPABILITIES,
+            "config": self._op_config(),
+            "token": token,
+            "projects": projects,
+        }
+
+    def token(self):
+        """
+        Return a token that changes when a project is added, removed or
+        modified.
+        """
+        return Manifest(self.config).get_token()
+
+    def _op_version(self):
+        return Version.full_version()
+
+    def _op_config(self):
+        with open(self.config.config_file, "r") as f:
+            return f.read()
+
+    def _op_list(self):
+        return Manifest(self.config).get_records()
+
+    def _op_token(self):
+        return self.token()
+
+    def _op_dir_exists(self, path):
+        return os.path.isdir(os.path.expanduser(path))
+
+    def _op_refs(self, paths):
+        """
+        Return the branch heads of the given bare repositories, relative to
+        git_path: {path: {branch: sha}}.
+        """
+        refs = {}
+        for path in paths:
+            repo_path = os.path.join(self.config.git_path, path)
+            if not os.path.isdir(repo_path):
+                continue
+            refs[path] = GitRefs.get_heads(repo_path, bare=True)
+        return refs
@@ -0,0 +1,112 @@
+import json
+import os
+import select
+import subprocess
+import threading
+import time
+
+
+class AgentError(Exception):
+    """The session to the agent is broken: no answer, EOF or bad framing."""
+    pass
+
+
+class AgentOpError(AgentError):
+    """The agent answered with an error: only this request failed."""
+    pass
+
+
+class AgentClient:
+    """
+    Client side of a remote 'echogit agent --stdio' session.
+
+    The agent is started once through ssh and then answers every query of
+    the run, so remote queries don't pay ssh setup, a cold python start and
+    a config parse each time.
+    """
+    # Seconds to wait for an answer before giving up on the agent
+    TIMEOUT = 60
+
+    def __init__(self, command, timeout=TIMEOUT):
+        self.command = command
+        self.timeout = timeout
+        self._process = None
+        self._next_id = 0
+        self._buffer = b""
+        self._lock = threading.Lock()
+
+    def _start(self):
+        try:
+            self._process = subprocess.Popen(
+                self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL, bufsize=0)
+        except OSError as e:
+            raise AgentError(f"cannot start agent: {e}")
+        self._buffer = b""
+
+    def _read_line(self, deadline):
+        """
+        Read one response line before deadline (a time.monotonic() value).
+        Return b"" if the agent closed the session.
+        """
+        fd = self._process.stdout.fileno()
+        while b"\n" not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [],
+                                                   remaining)[0]:
+                # A late answer would be out of sequence: drop the session
+                self._process.kill()
+                self._process.wait()
+                self._process = None
+                raise AgentError(f"no answer after {self.timeout}s")
+            data = os.read(fd, 65536)
+            if not data:
+                return b""
+            self._buffer += data
+        line, _, self._buffer = self._buffer.partition(b"\n")
+        return line
+
+    def request(self, op, **args):
+        """
+        Send a request to the agent and return its result.
+        Raise AgentError if the agent is gone or doesn't answer within
+        timeout seconds, AgentOpError if the request failed.
+        """
+        with self._lock:
+            if self._process is None:
+                self._start()
+
+            self._next_id += 1
+            request = {"id": self._next_id, "op": op, "args": args}
+            deadline = time.monotonic() + self.timeout
+            try:
+                self._process.stdin.write(
+                    (json.dumps(request) + "\n").encode())
+                line = self._read_line(deadline)
+            except (OSError, ValueError) as e:
+                raise AgentError(f"agent connection lost: {e}")
+
+            if not line:
+                raise AgentError("agent connection closed")
+            try:
+                response = json.loads(line)
+            except ValueError:
+                raise AgentError(f"invalid agent response: {line!r}")
+
+        if response.get("id") != request["id"]:
+            raise AgentError("agent response out of sequence")
+        if "error" in response:
+            raise AgentOpError(response["error"])
+        return response.get("result")
+
+    def close(self):
+        """Stop the agent session."""
+        with self._lock:
+            if self._process is None:
+                return
+            try:
+                self._process.stdin.close()
+                self._process.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self._process.kill()
+            self._process = None
@@ -1,4 +1,6 @@
 from echogit.node import Node
+from echogit.git_refs import GitRefs
+from echogit.sync_node_config import SyncNodeConfig
 
 
 class BareGitRepo(Node):
@@ -6,6 +8,18 @@ class BareGitRepo(Node):
         name = self._get_folder_name(path).removesuffix(".git")
         super().__init__(name, path=path, parent=parent, config=config)
 
+    def get_type(self):
+        return Node.NodeType.BARE_GIT_REPO
+
+    def get_sync_type(self):
+        return SyncNodeConfig.SYNC_TYPE_GIT
+
+    def get_heads(self):
+        return GitRefs.get_heads(self.path, bare=True)
+
+    def get_mtime(self):
+        return GitRefs.get_mtime(self.path)
+
     def scan(self):
         pass
 
@@ -1,4 +1,5 @@
 from echogit.node import Node
+from echogit.sync_node_config import SyncNodeConfig
 
 
 class BareRsyncRepo(Node):
@@ -6,6 +7,12 @@ class BareRsyncRepo(Node):
         name = self._get_folder_name(path).removesuffix(".rsync")
         super().__init__(name, path=path, parent=parent, config=config)
 
+    def get_type(self):
+        return Node.NodeType.BARE_RSYNC_REPO
+
+    def get_sync_type(self):
+        return SyncNodeConfig.SYNC_TYPE_RSYNC
+
     def scan(self):
         pass
 
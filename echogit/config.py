@@ -31,6 +31,15 @@ class Config(BaseConfig):
             'DEFAULT', 'echogit_bin', fallback=None)
         self.ignore_peers_down = self.config.getboolean(
             'DEFAULT', 'ignore_peers_down', fallback=False)
+        # share one ssh connection per peer for the whole run
+        self.ssh_multiplexing = self.config.getboolean(
+            'DEFAULT', 'ssh_multiplexing', fallback=True)
+        # number of threads scanning sibling folders concurrently
+        self.scan_jobs = self.config.getint(
+            'DEFAULT', 'scan_jobs', fallback=4)
+        # seconds to wait for a peer to answer before marking it down
+        self.probe_timeout = self.config.getfloat(
+            'DEFAULT', 'probe_timeout', fallback=2.0)
 
         # list of folder that are collapsed at startup. Needed on UI for example.
         # collapsed folder contains projects we are not interested in.
@@ -92,11 +101,11 @@ class Config(BaseConfig):
         # Get list of peer strings from the config
         peer_strings = self.get_list('PEERS', 'peers', fallback=[])
 
-        print(f"load peers f{peer_strings}")
         peers = {}
         for peer_data in peer_strings:
             peer = Peer()
             peer.load_from_string(peer_data)
+            peer.load_options(self)
             peers[peer.name] = peer
         return peers
 
@@ -0,0 +1,186 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+# inotify(7) event masks
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | \
+    IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ATTRIB
+
+
+class InotifyWatcher:
+    """
+    Watch directories with inotify, through ctypes.
+
+    Watches are not recursive: each directory is added with add_watch.
+    read_events returns (wd, name, mask) tuples, name being relative to
+    the directory of wd, or "" for an event on the directory itself.
+    """
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        # Raises AttributeError where there is no inotify
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                    ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def add_watch(self, path):
+        """Watch a directory. Return its watch descriptor, or None."""
+        wd = self._add_watch(self.fd, os.fsencode(path),
+                             WATCH_MASK | IN_ONLYDIR | IN_DONT_FOLLOW)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                print("Too many inotify watches, raise "
+                      "fs.inotify.max_user_watches", file=sys.stderr)
+            return None
+        return wd
+
+    def rm_watch(self, wd):
+        self._rm_watch(self.fd, wd)
+
+    def read_events(self, timeout=None):
+        """Wait up to timeout seconds for events, and return them."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset + self._EVENT.size <= len(data):
+            wd, mask, _cookie, length = self._EVENT.unpack_from(data, offset)
+            offset += self._EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            events.append((wd, os.fsdecode(name), mask))
+        return events
+
+    def drain(self):
+        """Return the events already queued, without waiting."""
+        events = []
+        while True:
+            new_events = self.read_events(0)
+            if not new_events:
+                return events
+            events.extend(new_events)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollWatcher:
+    """
+    Fallback of InotifyWatcher for systems without inotify: the watched
+    directories are listed again every interval seconds, and differences
+    are reported with the same masks as inotify.
+    """
+
+    def __init__(self, interval=5.0):
+        self.interval = interval
+        # wd => (path, {name: (is_dir, mtime_ns, size)})
+        self._watches = {}
+        self._next_wd = 1
+        self._next_poll = time.monotonic() + interval
+
+    @staticmethod
+    def _list(path):
+        entries = {}
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                entries[entry.name] = (is_dir, stat.st_mtime_ns,
+                                       0 if is_dir else stat.st_size)
+        return entries
+
+    def add_watch(self, path):
+        try:
+            entries = self._list(path)
+        except OSError:
+            return None
+        wd = self._next_wd
+        self._next_wd += 1
+        self._watches[wd] = (path, entries)
+        return wd
+
+    def rm_watch(self, wd):
+        self._watches.pop(wd, None)
+
+    def read_events(self, timeout=None):
+        delay = self._next_poll - time.monotonic()
+        if timeout is not None and timeout < delay:
+            time.sleep(max(0, timeout))
+            return []
+        time.sleep(max(0, delay))
+        return self.drain()
+
+    def drain(self):
+        """List the watched directories now and return their changes."""
+        self._next_poll = time.monotonic() + self.interval
+        events = []
+        for wd, (path, old) in list(self._watches.items()):
+            try:
+                new = self._list(path)
+            except OSError:
+                del self._watches[wd]
+                events.append((wd, "", IN_DELETE_SELF))
+                events.append((wd, "", IN_IGNORED))
+                continue
+            self._watches[wd] = (path, new)
+            for name, (is_dir, mtime, size) in new.items():
+                isdir = IN_ISDIR if is_dir else 0
+                if name not in old:
+                    events.append((wd, name, IN_CREATE | isdir))
+                elif old[name] != (is_dir, mtime, size) and not is_dir:
+                    events.append((wd, name, IN_CLOSE_WRITE))
+            for name, (is_dir, _mtime, _size) in old.items():
+                if name not in new:
+                    events.append((wd, name,
+                                   IN_DELETE | (IN_ISDIR if is_dir else 0)))
+        return events
+
+    def close(self):
+        self._watches = {}
+
+
+def create_watcher(poll=False, interval=5.0):
+    """Return an InotifyWatcher, or a PollWatcher if there is no inotify."""
+    if not poll:
+        try:
+            return InotifyWatcher()
+        except (AttributeError, OSError) as e:
+            print(f"inotify unavailable ({e}), polling every {interval}s",
+                  file=sys.stderr)
+    return PollWatcher(interval)
@@ -1,6 +1,9 @@
+import os
 import argparse
 from echogit.git_repository_peer import GitRepositoryPeer
 from echogit.config import Config
+from echogit.node import Node
+from echogit.git_refs import GitRefs
 from echogit.project import Project
 
 
@@ -13,6 +16,13 @@ class GitProject(Project):
     def get_type(self):
         return Node.NodeType.GIT_PROJECT
 
+    def get_heads(self):
+        return GitRefs.get_heads(self.path)
+
+    def get_mtime(self):
+        return max(super().get_mtime(),
+                   GitRefs.get_mtime(os.path.join(self.path, ".git")))
+
     def createRepositoryPeer(self, peer):
         return GitRepositoryPeer(path=self.path, peer=peer,
                                   config=self.config, parent=self)
@@ -0,0 +1,101 @@
+import os
+import subprocess
+
+
+class GitRefs:
+    """
+    Helpers reading the state of a git repository with a single git call.
+    """
+
+    @staticmethod
+    def get_heads(path, bare=False):
+        """
+        Return the local branches of the repository at path as a dictionary
+        of branch name => commit sha, with a single git call.
+        """
+        return GitRefs._for_each_ref(path, "refs/heads", bare)
+
+    @staticmethod
+    def get_remote_heads(path):
+        """
+        Return the remote-tracking branches of the repository at path as a
+        dictionary of peer/branch => commit sha, with a single git call.
+        """
+        return GitRefs._for_each_ref(path, "refs/remotes")
+
+    @staticmethod
+    def _for_each_ref(path, pattern, bare=False):
+        # Don't let git look for a repository in parent folders
+        git = ["git", f"--git-dir={path}"] if bare else ["git"]
+        result = subprocess.run(
+            git + ["for-each-ref", "--format=%(refname:short) %(objectname)",
+                   pattern], cwd=path, capture_output=True, text=True)
+        if result.returncode != 0:
+            return {}
+        return dict(line.split(" ", 1) for line in result.stdout.splitlines())
+
+    @staticmethod
+    def get_mtime(git_dir):
+        """
+        Return the last modification time of the branches of a repository.
+        A push or a commit updates refs, not the repository folder itself.
+        Branches with a slash, like feature/x, live in sub-folders of
+        refs/heads, which are checked too.
+        """
+        mtimes = [os.stat(git_dir).st_mtime]
+        packed_refs = os.path.join(git_dir, "packed-refs")
+        if os.path.exists(packed_refs):
+            mtimes.append(os.stat(packed_refs).st_mtime)
+        for root, _dirs, _files in os.walk(os.path.join(git_dir, "refs",
+                                                        "heads")):
+            mtimes.append(os.stat(root).st_mtime)
+        return max(mtimes)
+
+    @staticmethod
+    def is_clean(path):
+        """Return True if the work tree at path has no local change."""
+        result = subprocess.run(["git", "status", "--porcelain"], cwd=path,
+                                capture_output=True, text=True)
+        return result.returncode == 0 and not result.stdout
+
+    @staticmethod
+    def resolve(path, ref):
+        """Return the commit sha of ref, or None if it doesn't exist."""
+        result = subprocess.run(["git", "rev-parse", "--verify", "--quiet",
+                                 f"{ref}^{{commit}}"], cwd=path,
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            return None
+        return result.stdout.strip()
+
+    @staticmethod
+    def is_ancestor(path, ancestor, commit):
+        """Return True if ancestor is reachable from commit."""
+        result = subprocess.run(["git", "merge-base", "--is-ancestor",
+                                 ancestor, commit], cwd=path,
+                                capture_output=True, text=True)
+        return result.returncode == 0
+
+    @staticmethod
+    def get_current_branch(path):
+        """Return the checked out branch, or None on a detached HEAD."""
+        result = subprocess.run(["git", "symbolic-ref", "--short", "-q",
+                                 "HEAD"], cwd=path,
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            return None
+        return result.stdout.strip()
+
+    @staticmethod
+    def count_ahead_behind(path, local, remote):
+        """
+        Return the number of commits of local not in remote and of remote
+        not in local, or None if one of them is not in the repository.
+        """
+        result = subprocess.run(["git", "rev-list", "--left-right", "--count",
+                                 f"{local}...{remote}"], cwd=path,
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            return None
+        ahead, behind = result.stdout.split()
+        return int(ahead), int(behind)
@@ -1,7 +1,10 @@
 from echogit.config import Config
 from echogit.peer import Peer
 from echogit.sync_branch import SyncBranch
+from echogit.git_refs import GitRefs
 import argparse
+import re
+import subprocess
 from echogit.node import Node
 
 
@@ -20,11 +23,45 @@ class GitRepositoryPeer(Node):
             child.scan()
             self.add_child(child)
 
+    def get_plan_records(self):
+        """
+        Return the plan record of each branch, see
+        SyncBranch.get_plan_record. Remote heads come from the bulk listing
+        of the peer, or else from the last fetch.
+        """
+        if self.peer.is_down:
+            return [{"peer": self.peer.name, "branch": branch,
+                     "sync_type": "git", "state": "peer-down", "ahead": None,
+                     "behind": None, "bytes": None}
+                    for branch in self.node_config.sync_branches]
+
+        local_heads = GitRefs.get_heads(self.path)
+        remote_heads = self.peer.get_remote_heads(self.path)
+        if remote_heads is None:
+            remote_heads = {}
+            for child in self.children:
+                head = GitRefs.resolve(self.path, child._get_remote_ref())
+                if head is not None:
+                    remote_heads[child.name] = head
+        current_branch = GitRefs.get_current_branch(self.path)
+        clean = GitRefs.is_clean(self.path)
+        return [child.get_plan_record(local_heads, remote_heads,
+                                      current_branch, clean)
+                for child in self.children]
+
     def sync(self, verbose=False):
+        # Wait for the peer to accept one more session
+        with self.peer.session():
+            return self._sync(verbose)
+
+    def _sync(self, verbose):
         if self.peer.config is None and self.peer.is_down == False:
-            self.peer.fetch_config()
+            self.peer._fetch_config_if_needed()
 
         config = Config.get_local_instance()
+        if self.peer.is_down:
+            for child in self.children:
+                child.report_progress()
         if self.peer.is_down and config.ignore_peers_down:
             if verbose:
                 print(f"Ignore peer {self.peer.name}: is down")
@@ -32,13 +69,147 @@ class GitRepositoryPeer(Node):
         elif self.peer.is_down:
             return 0, 1
 
+        # Compare refs first: branches identical on both sides are skipped.
+        # No heads at all may come from a failed listing: trust none then.
+        remote_heads = self.peer.get_remote_heads(self.path) or None
+        # Only the checked out branch can be dirty: one status per project
+        clean = GitRefs.is_clean(self.path)
+        if remote_heads is not None and clean:
+            local_heads = GitRefs.get_heads(self.path)
+        else:
+            local_heads = {}
+
         success = 1
+        to_sync = []
         for child in self.children:
-            child_success, child_total = child.sync(verbose=verbose)
+            if child.is_up_to_date(local_heads, remote_heads):
+                child_success, child_total = child.skip_sync(verbose)
+                if child_success == 0:
+                    success = 0
+            else:
+                to_sync.append(child)
+
+        if not to_sync:
+            return success, 1
+
+        # One remote setup and one fetch shared by all the branches
+        to_sync[0]._add_remote(verbose)
+        for child in to_sync[1:]:
+            child.copy_logs("remote_add", to_sync[0])
+        fetch_result = self._fetch(to_sync, remote_heads, verbose)
+
+        if self.node_config.checkout_free:
+            return self._sync_checkout_free(
+                to_sync, fetch_result, clean, verbose) and success, 1
+
+        for child in to_sync:
+            child_success, child_total = child.sync(
+                verbose=verbose, fetch_result=fetch_result)
             if child_success == 0:
                 success = 0
         return success, 1
 
+    def _fetch(self, branches, remote_heads, verbose):
+        """
+        Fetch the given branches from the peer with a single git fetch.
+        Only the synced branches are fetched; branches the peer is known
+        not to have are left out since an explicit refspec would fail, and
+        nothing is fetched if the peer has none of them.
+        remote_heads is None if the heads of the peer are unknown.
+        """
+        if remote_heads is not None:
+            branches = [branch for branch in branches
+                        if branch.name in remote_heads]
+
+        result = subprocess.CompletedProcess([], 0, "", "")
+        while branches:
+            refspecs = [branch.get_refspec() for branch in branches]
+            result = subprocess.run(
+                ["git", "fetch", self.peer.name] + refspecs, cwd=self.path,
+                text=True, capture_output=True, env=self.peer.get_git_env())
+            missing = re.findall(r"couldn't find remote ref refs/heads/(\S+)",
+                                 result.stderr)
+            if result.returncode == 0 or not missing:
+                break
+            # The listing was stale: fetch the branches still on the peer
+            branches = [branch for branch in branches
+                        if branch.name not in missing]
+            result = subprocess.CompletedProcess([], 0, "", "")
+        if verbose:
+            print(f"fetch ret={result.returncode} stderr={result.stderr}")
+        return result
+
+    def _push(self, branches, verbose):
+        """
+        Push several branches with a single git push and record the result
+        of each ref on its branch.
+        """
+        pushed = {branch.name: branch for branch in branches}
+        result = subprocess.run(
+            ["git", "push", "--porcelain", self.peer.name] + list(pushed),
+            cwd=self.path, text=True, capture_output=True,
+            env=self.peer.get_git_env())
+
+        # Porcelain lines: <flag>\t<from>:<to>\t<summary>
+        ref_results = {}
+        for line in result.stdout.splitlines():
+            fields = line.split("\t")
+            if len(fields) < 3 or ":" not in fields[1]:
+                continue
+            name = fields[1].split(":", 1)[0][len("refs/heads/"):]
+            ref_results[name] = (fields[0] == "!", line)
+
+        for name, branch in pushed.items():
+            rejected, line = ref_results.get(
+                name, (result.returncode != 0, ""))
+            branch._save_logs("push", 1 if rejected else 0, line,
+                              result.stderr if rejected else "", verbose)
+
+    def _sync_checkout_free(self, branches, fetch_result, clean, verbose):
+        """
+        Sync branches without checking them out: fast-forward of the
+        branches which are not checked out by updating their refs, a merge
+        of the checked out branch only, and one push for all of them.
+        clean tells if the work tree had no local change before the sync:
+        the work tree status is only read again for the checked out branch
+        of a dirty work tree.
+        """
+        current_branch = branches[0]._branch()
+        to_push = []
+        for branch in branches:
+            if fetch_result.returncode != 0:
+                branch._save_result_logs("pull", fetch_result, verbose)
+                continue
+            if branch.name != current_branch:
+                if branch.fast_forward(verbose):
+                    to_push.append(branch)
+                continue
+
+            if self.node_config.auto_commit and not clean:
+                branch._commit()
+            branch.merge(verbose)
+            if branch.errors["pull"] == 0 and \
+                    GitRefs.resolve(self.path, "HEAD") != GitRefs.resolve(
+                        self.path, branch._get_remote_ref()):
+                to_push.append(branch)
+
+        for branch in branches:
+            if branch not in to_push:
+                branch._save_logs("push", 0, "", "", verbose)
+        if to_push:
+            self._push(to_push, verbose)
+
+        success = 1
+        for branch in branches:
+            if branch.name == current_branch and not clean:
+                branch._status(verbose)
+            else:
+                branch._save_logs("status", 0, "", "", verbose)
+            branch.save_status()
+            if self.peer.is_down or branch.has_error():
+                success = 0
+        return success
+
 
 if __name__ == "__main__":
     # Setup argument parser
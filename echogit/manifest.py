@@ -0,0 +1,307 @@
+import contextlib
+import fcntl
+import json
+import os
+import stat
+import sys
+import tempfile
+import time
+import uuid
+from echogit.git_refs import GitRefs
+from echogit.node_factory import NodeFactory
+
+
+class Manifest:
+    """
+    On-disk list of the projects served by this peer.
+
+    Remote listings and sync type detection read this small file instead of
+    walking the whole tree. The manifest is checked against the mtimes of
+    the folders and repositories it lists, which costs a few stats each, and
+    is rebuilt when one of them changed. After a sync, only the records of
+    the synced repositories are read again. Updates hold a lock on the
+    file, since post-receive hooks and syncs may update it at the same
+    time.
+
+    As in ScanIndex, an mtime read less than MTIME_GRANULARITY seconds
+    after it was set doesn't prove that a later change would move it:
+    such records are read again, and such folders trigger a rebuild.
+    """
+    HOOK_MARKER = "# echogit manifest hook"
+    MTIME_GRANULARITY = 2
+
+    def __init__(self, config):
+        self.config = config
+        self.root = config.git_path or config.projects_path
+        self.path = os.path.join(self._get_cache_dir(), "manifest.json")
+        self.id = None
+        self.generation = 0
+        self.records = []
+        # relative folder => mtime, used to detect added or removed projects
+        self.folders = {}
+        # Time the folder mtimes were read
+        self.folders_checked = 0
+        # record path => time its mtime was read
+        self.checked = {}
+
+    @staticmethod
+    def _get_cache_dir():
+        xdg_cache_home = os.getenv(
+            "XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+        cache_dir = os.path.join(xdg_cache_home, "echogit")
+        os.makedirs(cache_dir, exist_ok=True)
+        return cache_dir
+
+    @contextlib.contextmanager
+    def _lock(self):
+        """Hold the lock of the manifest file while updating it."""
+        with open(f"{self.path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def load(self):
+        """Load the manifest file. Return False if there is none."""
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if data.get("root") != self.root:
+            return False
+        self.id = data["id"]
+        self.generation = data["generation"]
+        self.records = data["records"]
+        self.folders = data["folders"]
+        self.folders_checked = data.get("folders_checked", 0)
+        self.checked = data.get("checked", {})
+        return True
+
+    def save(self):
+        """Write the manifest file atomically."""
+        data = {
+            "root": self.root,
+            "id": self.id,
+            "generation": self.generation,
+            "records": self.records,
+            "folders": self.folders,
+            "folders_checked": self.folders_checked,
+            "checked": self.checked,
+        }
+        try:
+            with tempfile.NamedTemporaryFile(
+                    "w", dir=os.path.dirname(self.path), delete=False,
+                    prefix=".manifest_", suffix=".tmp") as f:
+                json.dump(data, f)
+            os.replace(f.name, self.path)
+        except OSError as e:
+            print(f"Failed to write manifest {self.path}: {e}",
+                  file=sys.stderr)
+
+    def _get_record_mtime(self, record):
+        path = os.path.join(self.root, record["path"])
+        if record["sync_type"] != "git":
+            return os.stat(path).st_mtime
+        if path.rstrip("/").endswith(".git"):
+            return GitRefs.get_mtime(path)
+        return max(os.stat(path).st_mtime,
+                   GitRefs.get_mtime(os.path.join(path, ".git")))
+
+    @staticmethod
+    def _is_recent(mtime, checked):
+        """
+        True if mtime was read too soon after it was set to be sure that
+        a later change would have moved it.
+        """
+        return mtime > checked - Manifest.MTIME_GRANULARITY
+
+    def is_valid(self):
+        """
+        Check that no project was added, removed or modified since the
+        manifest was written. Records whose mtime was recent when read
+        must be read again, see get_recent_records.
+        """
+        try:
+            for folder, mtime in self.folders.items():
+                if self._is_recent(mtime, self.folders_checked) or \
+                        os.stat(os.path.join(self.root, folder)).st_mtime \
+                        != mtime:
+                    return False
+            for record in self.records:
+                if self._get_record_mtime(record) != record["mtime"]:
+                    return False
+        except OSError:
+            return False
+        return True
+
+    def get_recent_records(self):
+        """Return the records whose mtime was recent when read."""
+        return [record for record in self.records
+                if self._is_recent(record["mtime"],
+                                   self.checked.get(record["path"], 0))]
+
+    def _read_record(self, record):
+        """
+        Read the mtime and heads of a record again. Return True if its
+        heads changed.
+        """
+        path = os.path.join(self.root, record["path"])
+        # Read before the mtime, the mtime before the heads: a change in
+        # between shows up as a newer mtime
+        self.checked[record["path"]] = time.time()
+        record["mtime"] = self._get_record_mtime(record)
+        if record["sync_type"] != "git":
+            return False
+        is_bare = path.rstrip("/").endswith(".git")
+        heads = GitRefs.get_heads(path, bare=is_bare)
+        changed = heads != record["heads"]
+        record["heads"] = heads
+        return changed
+
+    def _read_records(self, records):
+        """Read records again, and save the manifest."""
+        changed = [self._read_record(record) for record in records]
+        if any(changed):
+            self.generation += 1
+        self.save()
+
+    def _get_folders(self):
+        """
+        Return the mtime of every folder that may contain projects. Projects
+        and bare repositories are not walked into.
+        """
+        folders = {}
+        for root, dirs, _files in os.walk(self.root):
+            if root != self.root and (
+                    root.endswith(".git") or root.endswith(".rsync") or
+                    ".echogit" in dirs or ".git" in dirs):
+                dirs.clear()
+                continue
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            folder = os.path.relpath(root, self.root)
+            folders[folder] = os.stat(root).st_mtime
+        return folders
+
+    def refresh(self):
+        """Rebuild the manifest from the tree if something changed."""
+        with self._lock():
+            self._refresh()
+
+    def _refresh(self):
+        if self.load() and self.is_valid():
+            recent = self.get_recent_records()
+            if recent:
+                self._read_records(recent)
+            return
+
+        checked = time.time()
+        node = NodeFactory.from_folder(self.root, self.config)
+        node.scan()
+        records = node.get_project_records()
+        folders = self._get_folders()
+
+        if self.id is None:
+            self.id = uuid.uuid4().hex[:8]
+        if records != self.records:
+            self.generation += 1
+        self.records = records
+        self.folders = folders
+        self.folders_checked = checked
+        self.checked = {record["path"]: checked for record in records}
+        self.save()
+
+    def update_repo(self, repo_path):
+        """
+        Update the record of one repository, after a push for example.
+        """
+        self.update_repos([repo_path])
+
+    def update_repos(self, repo_paths):
+        """
+        Update the records of the given repositories only, instead of
+        checking the whole tree. The manifest is rebuilt if one of them is
+        new.
+        """
+        with self._lock():
+            self._update_repos(repo_paths)
+
+    def _update_repos(self, repo_paths):
+        if not self.load():
+            self._refresh()
+            return
+
+        records = {record["path"]: record for record in self.records}
+        updated = []
+        for repo_path in repo_paths:
+            relative_path = os.path.relpath(repo_path, self.root) + "/"
+            if relative_path.startswith(".."):
+                continue  # not served
+            record = records.get(relative_path)
+            if record is not None:
+                updated.append(record)
+            elif os.path.isdir(repo_path):
+                # New repository
+                self._refresh()
+                return
+        if updated:
+            self._read_records(updated)
+
+    def get_repo_path(self, project):
+        """
+        Return the path of the record of a local project: its bare
+        repository under git_path, or the project itself.
+        """
+        if not self.config.git_path:
+            return project.path
+        suffix = ".git" if project.get_sync_type() == "git" else ".rsync"
+        relative_path = project.get_relative_path().rstrip(os.sep)
+        return os.path.join(self.root, relative_path + suffix)
+
+    def update_projects(self, projects):
+        """
+        Update the records of synced projects, see update_repos. Projects
+        out of projects_path are not served, and skipped.
+        """
+        repo_paths = []
+        for project in projects:
+            try:
+                repo_paths.append(self.get_repo_path(project))
+            except ValueError:
+                continue
+        self.update_repos(repo_paths)
+
+    def get_records(self):
+        """Return the up to date project records."""
+        self.refresh()
+        return self.records
+
+    def get_token(self):
+        """Return a token that changes whenever the records change."""
+        self.refresh()
+        return f"{self.id}-{self.generation}"
+
+    def install_hooks(self, echogit_bin):
+        """
+        Install a post-receive hook in every bare git repository so that
+        pushes update the manifest. Existing hooks are left untouched.
+        """
+        hook = (f"#!/bin/sh\n{Manifest.HOOK_MARKER}\n"
+                f"python3 {echogit_bin} manifest --update \"$(pwd)\" "
+                ">/dev/null 2>&1\n")
+
+        self.refresh()
+        for record in self.records:
+            if not record["path"].endswith(".git/"):
+                continue
+            hook_path = os.path.join(self.root, record["path"], "hooks",
+                                     "post-receive")
+            if os.path.exists(hook_path):
+                with open(hook_path, "r") as f:
+                    if Manifest.HOOK_MARKER not in f.read():
+                        print(f"Skipping {hook_path}: hook already exists")
+                        continue
+            os.makedirs(os.path.dirname(hook_path), exist_ok=True)
+            with open(hook_path, "w") as f:
+                f.write(hook)
+            os.chmod(hook_path, os.stat(hook_path).st_mode | stat.S_IXUSR)
+            print(f"Installed {hook_path}")
@@ -1,4 +1,5 @@
 import os
+import threading
 from enum import Enum
 from echogit.sync_node_config import SyncNodeConfig
 
@@ -12,6 +13,10 @@ class Node:
         BARE_RSYNC_REPO = "BareRsyncRepo"
         UNKNOWN = "Unknown"
 
+    _progress_lock = threading.Lock()
+    # Guards the errors cached by folders, see SyncFolder.get_errors
+    _errors_lock = threading.Lock()
+
     def __init__(self, name, *, path=None, parent=None, config=None):
         self.name = name
         self.path = path
@@ -19,7 +24,23 @@ class Node:
         self.parent = parent
         self.config = config
         self.collapse = False
+        # Branches synced so far out of sync_total, during a sync
+        self.sync_done = 0
+        self.sync_total = 0
+        # Called with the node that finished syncing, see report_progress
+        self.progress_listener = None
+        # Errors of the subtree, cached by folders until invalidate_errors
+        self._errors = None
+        self._errors_version = 0
+
+        if parent and parent.path == path:
+            # Peers and branches share the path and config of their project
+            self.node_config = parent.node_config
+        else:
+            self.node_config = self._load_node_config(path, parent)
 
+    @staticmethod
+    def _load_node_config(path, parent):
         config_file = os.path.join(path, ".echogit/config.ini")
 
         # Convert relative path to absolute if necessary. (mainly for unit test)
@@ -28,14 +49,12 @@ class Node:
             config_file = os.path.abspath(os.path.join(
                 os.path.dirname(__file__), "../", config_file))
 
-        if os.path.exists(config_file):
-            self.node_config = SyncNodeConfig(path, config_file)
-        elif parent:
+        node_config = SyncNodeConfig.from_file(path, config_file)
+        if node_config is None and parent:
             # if current node has no echogit config then
             # inherit from parent's config
-            self.node_config = parent.node_config
-        else:
-            self.node_config = None
+            node_config = parent.node_config
+        return node_config
 
     def get_type(self):
         return Node.NodeType.UNKNOWN
@@ -104,25 +123,76 @@ class Node:
         else:
             return Node.NodeType.SYNC_FOLDER
 
-    def get_children_tree_by_path(self):
-        tree = {}
-
-        start_path = self.config.git_path
-        if start_path is None:
-            start_path = self.config.projects_path
+    @staticmethod
+    def get_type_from_subdirs(folder_path, subdirs):
+        """
+        Same as get_type_from_folder for a folder known to exist, given the
+        names of its sub-folders, so that no other stat is needed.
+        """
+        folder_name = os.path.basename(folder_path)
+        if folder_name == ".echogit":
+            return Node.NodeType.UNKNOWN
+        elif folder_path.endswith(".git"):
+            return Node.NodeType.BARE_GIT_REPO
+        elif folder_path.endswith(".rsync"):
+            return Node.NodeType.BARE_RSYNC_REPO
+        elif ".echogit" in subdirs and ".git" in subdirs:
+            return Node.NodeType.GIT_PROJECT
+        elif ".echogit" in subdirs and \
+                Node.get_type_from_config(folder_path) == \
+                Node.NodeType.RSYNC_PROJECT:
+            return Node.NodeType.RSYNC_PROJECT
+        elif ".git" in subdirs:
+            return Node.NodeType.UNKNOWN
+        else:
+            return Node.NodeType.SYNC_FOLDER
 
+    def get_relative_path(self):
         # FIXME
         path = self.config._ensure_trailing_slash(self.path)
 
+        start_path = self.config.git_path
+        if start_path is None or not path.startswith(start_path):
+            start_path = self.config.projects_path
+
         if path.startswith(start_path):
             # Remove git_path and the leading slash from the full_path
-            path = path[len(start_path):].lstrip(os.sep)
+            return path[len(start_path):].lstrip(os.sep)
         else:
             raise ValueError(
                 f"The path '{path}' does not start with '{start_path}'.")
-        tree[path] = self.name
+
+    def get_children_tree_by_path(self):
+        tree = {}
+        tree[self.get_relative_path()] = self.name
         return tree
 
+    def get_sync_type(self):
+        if self.node_config is None:
+            return SyncNodeConfig.SYNC_TYPE_UNKNOWN
+        return self.node_config.sync_type
+
+    def get_heads(self):
+        """Return the branch heads of the node as branch => sha."""
+        return {}
+
+    def get_mtime(self):
+        """Return the last modification time of the node."""
+        return os.stat(self.path).st_mtime
+
+    def get_project_records(self):
+        """
+        Return the machine-readable description of the projects of this
+        node, as used by 'list --format json'.
+        """
+        return [{
+            "path": self.get_relative_path(),
+            "name": self.name,
+            "sync_type": self.get_sync_type(),
+            "heads": self.get_heads(),
+            "mtime": self.get_mtime(),
+        }]
+
     def print_path(self):
         tree = self.get_children_tree_by_path()
         for path, node in tree.items():
@@ -131,6 +201,16 @@ class Node:
     def add_child(self, child):
         child.parent = self
         self.children.append(child)
+        self.invalidate_errors()
+
+    def invalidate_errors(self):
+        """Drop the errors cached by the node and its parents."""
+        node = self
+        while node is not None:
+            with Node._errors_lock:
+                node._errors = None
+                node._errors_version += 1
+            node = node.parent
 
     def get_project_state_str(self):
         key_flag = {"remote_add": "R", "push": "P", "pull": "L", "status": "D"}
@@ -165,6 +245,32 @@ class Node:
     def is_folder(self):
         return False
 
+    def start_progress(self):
+        """
+        Reset the progress counters of the subtree before a sync and return
+        the number of branches (or rsync peers) it is going to sync.
+        """
+        self.sync_done = 0
+        self.sync_total = sum(child.start_progress()
+                              for child in self.children)
+        return self.sync_total
+
+    def report_progress(self):
+        """
+        Called by a branch or an rsync peer when it is done syncing, after
+        its status was stored: count it on every parent still syncing and
+        notify the listeners.
+        """
+        self.invalidate_errors()
+        node = self
+        while node is not None:
+            with Node._progress_lock:
+                if node.sync_done < node.sync_total:
+                    node.sync_done += 1
+            if node.progress_listener:
+                node.progress_listener(self)
+            node = node.parent
+
     def scan(self):
         pass
 
@@ -10,8 +10,8 @@ from echogit.rsync_project import RsyncProject
 
 class NodeFactory:
     @staticmethod
-    def from_folder(folder_path):
-        config = Config.get_local_instance()
+    def from_folder(folder_path, config=None):
+        config = config or Config.get_local_instance()
         node_type = Node.get_type_from_folder(folder_path)
         if node_type == Node.NodeType.GIT_PROJECT:
             return GitProject(folder_path, config=config)
@@ -1,15 +1,41 @@
 import ast
+import atexit
+import contextlib
 import json
 import os
 import re
+import select
+import shlex
 import socket
 import sys
 import subprocess
+import tempfile
+import threading
+import time
 from echogit.config import Config
+from echogit.ssh_master import SshMaster
+from echogit.agent_client import AgentClient, AgentError, AgentOpError
 from echogit.version import Version
+from echogit.git_refs import GitRefs
 
 
 class Peer:
+    REMOTE_CONFIG_PATH = "~/.config/echogit/config.ini"
+
+    # echogit_bin is only known from the remote config. Read it on the peer
+    # so that commands run before the config is fetched cost a single call.
+    BOOTSTRAP_COMMAND = (
+        "eval python3 $(sed -n 's/^echogit_bin[ ]*=[ ]*//p' "
+        f"{REMOTE_CONFIG_PATH} | head -n 1)")
+
+    # Default time (in seconds) remote listings are trusted without asking
+    # the peer if they changed
+    CACHE_TTL = 300
+    # Seconds a streamed remote command may stay silent before it is killed
+    STREAM_TIMEOUT = 60
+    # Proxy limiting the bandwidth of git over ssh, see get_git_env
+    THROTTLE_PATH = os.path.join(os.path.dirname(__file__), "throttle.py")
+
     def __init__(self, name=None, host=None, git_path=None, config=None):
         self.priority = 0
         self.host = host  # IP or hostname
@@ -18,6 +44,31 @@ class Peer:
         self.version = "0.0.1"
         self.config = config
         self.is_down = False
+        self.cache_ttl = Peer.CACHE_TTL
+        # Maximum number of concurrent git/rsync sessions, 0 for no limit
+        self.max_sessions = 0
+        # Bandwidth cap in KiB/s of each session, 0 for no limit
+        self.bwlimit = 0
+        self._sessions = None
+        self.remote_version = None
+        # ssh connection time in seconds, measured by PeerProbe
+        self.latency = None
+        self.capabilities = []
+        # Remote projects fetched during this run
+        self._remote_projects = None
+        self._remote_records = {}
+        # Sync type of each project path, resolved once per run
+        self._sync_types = None
+        self._sync_types_lock = threading.Lock()
+        # Heads of the projects read by the agent, False without agent
+        self._agent_heads = None
+        self._heads_lock = threading.Lock()
+        # Peers are shared by all projects, which may sync concurrently
+        self._config_lock = threading.Lock()
+        self._ssh_lock = threading.Lock()
+        self._ssh_master = None
+        # Remote agent session, False once it failed
+        self._agent = None
 
         # Cache directory based on XDG specification
         self.cache_dir = self._get_cache_dir()
@@ -70,6 +121,140 @@ class Peer:
             self._is_localhost = False
             return False
 
+    @staticmethod
+    def _get_ssh_options():
+        """Return the ssh options used for all connections to peers."""
+        timeout = Config.get_local_instance().probe_timeout
+        return ["-o", f"ConnectTimeout={max(1, round(timeout))}"]
+
+    def _get_ssh_master(self):
+        """
+        Return the multiplexed ssh connection of this peer, or None if
+        multiplexing is disabled.
+        """
+        if not Config.get_local_instance().ssh_multiplexing:
+            return None
+        with self._ssh_lock:
+            if self._ssh_master is None:
+                self._ssh_master = SshMaster(self.name, self.host,
+                                             self._get_ssh_options())
+        return self._ssh_master
+
+    def get_ssh_command(self):
+        """Return the ssh command (as a list) used to reach this peer."""
+        master = self._get_ssh_master()
+        if master is None:
+            return ["ssh"] + self._get_ssh_options()
+        return master.ssh_command()
+
+    def get_git_env(self):
+        """
+        Return the environment for git commands talking to this peer, so
+        that git goes through the peer's ssh connection.
+        """
+        if self.is_localhost():
+            return None
+        ssh_command = self.get_ssh_command()
+        if self.bwlimit:
+            # git has no bandwidth limit: throttle its ssh connection
+            ssh_command = [sys.executable, Peer.THROTTLE_PATH,
+                           str(self.bwlimit)] + ssh_command
+        env = dict(os.environ)
+        env["GIT_SSH_COMMAND"] = shlex.join(ssh_command)
+        return env
+
+    def get_rsync_options(self):
+        """Return the rsync options to reach this peer."""
+        options = [f"--bwlimit={self.bwlimit}"] if self.bwlimit else []
+        if self.is_localhost():
+            return options
+        return options + ["-e", shlex.join(self.get_ssh_command())]
+
+    def _get_agent(self):
+        """
+        Return the session to the remote echogit agent, or None if the peer
+        doesn't support it.
+        """
+        if self.is_localhost() or "agent" not in self.capabilities:
+            return None
+        with self._ssh_lock:
+            if self._agent is None:
+                agent_command = \
+                    f"python3 {self.config.echogit_bin} agent --stdio"
+                self._agent = AgentClient(
+                    self.get_ssh_command() + [self.host, agent_command])
+                atexit.register(self._agent.close)
+        return self._agent or None
+
+    def _query_agent(self, op, **args):
+        """
+        Run a query on the remote agent.
+        Return (True, result), or (False, None) if the agent can't answer
+        and the caller must fallback to a plain remote command.
+        """
+        agent = self._get_agent()
+        if agent is None:
+            return False, None
+        try:
+            return True, agent.request(op, **args)
+        except AgentOpError as e:
+            # The session is fine, only this query falls back
+            print(f"Agent of peer {self.name} failed on {op}: {e}",
+                  file=sys.stderr)
+            return False, None
+        except AgentError as e:
+            print(f"Agent of peer {self.name} failed: {e}", file=sys.stderr)
+            self._agent = False
+            agent.close()
+            return False, None
+
+    def get_ssh_stats_str(self, measure=False):
+        """
+        Return the handshake statistics of the ssh connection.
+        If measure is set, the cost of a multiplexed session is measured
+        to estimate the time saved by multiplexing.
+        """
+        if self.is_localhost():
+            return "ssh: no multiplexing"
+        master = self._get_ssh_master()
+        if master is None:
+            return "ssh: no multiplexing"
+        if measure:
+            master.measure()
+        return master.get_stats_str()
+
+    def load_options(self, config):
+        """
+        Load the options of this peer from the [PEERS] section of config,
+        overridden by its own [PEER:<name>] section.
+        """
+        section = f"PEER:{self.name}"
+        default_ttl = config.config.getfloat(
+            "PEERS", "cache_ttl", fallback=Peer.CACHE_TTL)
+        self.cache_ttl = config.config.getfloat(
+            section, "cache_ttl", fallback=default_ttl)
+        self.max_sessions = config.config.getint(
+            section, "max_sessions",
+            fallback=config.config.getint("PEERS", "max_sessions",
+                                          fallback=0))
+        self.bwlimit = config.config.getint(
+            section, "bwlimit",
+            fallback=config.config.getint("PEERS", "bwlimit", fallback=0))
+        self._sessions = threading.BoundedSemaphore(self.max_sessions) \
+            if self.max_sessions > 0 else None
+
+    @contextlib.contextmanager
+    def session(self):
+        """
+        Hold one of the max_sessions sessions of the peer while syncing
+        with it, waiting for one to be free.
+        """
+        if self._sessions is None:
+            yield
+            return
+        with self._sessions:
+            yield
+
     def load_from_string(self, peer_data):
         """
         Load peer data from a formatted string.
@@ -82,28 +267,74 @@ class Peer:
         else:
             raise ValueError("Peer data is not in the correct format")
 
+    def _set_remote_config(self, config_content):
+        self.config = Config(config_string=config_content)
+        self.config.add_ssh_prefix_to_git_path(self.name)
+
+    def _check_remote_version(self, remote_version_str):
+        if remote_version_str is None:
+            self.is_down = True
+            return
+        self.remote_version = remote_version_str.strip()
+        if not Version.is_compatible(self.remote_version):
+            print(f"peer {self.name} is incompatible: {remote_version_str}")
+            self.is_down = False
+
+    def _fetch_handshake(self):
+        """
+        Fetch config, version, projects and capabilities of the remote peer
+        with a single SSH call. Return False if the peer doesn't support it.
+        Projects are only sent if they changed since they were cached.
+        """
+        command = f"{Peer.BOOTSTRAP_COMMAND} handshake --json"
+        cache = self._load_cache()
+        if cache and cache["token"]:
+            command += f" --if-token {shlex.quote(cache['token'])}"
+
+        # Older peers fail on the unknown command: fallback quietly
+        output = self._execute_remote_command(command, quiet=True)
+        if not output:
+            return False
+
+        # The handshake is printed as the last line of the output
+        try:
+            handshake = json.loads(output.strip().splitlines()[-1])
+            config_content = handshake["config"]
+            remote_version_str = handshake["version"]
+            projects = handshake["projects"]
+        except (ValueError, KeyError, IndexError, TypeError):
+            return False
+
+        self._set_remote_config(config_content)
+        self._check_remote_version(remote_version_str)
+        self.capabilities = handshake.get("capabilities", [])
+
+        if projects is None:
+            # Projects didn't change since they were cached
+            projects = cache["records"]
+        self._set_remote_projects(projects)
+        self._save_cache(handshake.get("token"))
+        return True
+
     def _fetch_remote_config(self):
         """
         Fetches the config file from the remote peer via SSH.
         """
-        remote_config_path = "~/.config/echogit/config.ini"
-        fetch_command = f"cat {remote_config_path}"
+        if self._fetch_handshake() or self.is_down:
+            return
+
+        # Peer without handshake support
+        fetch_command = f"cat {Peer.REMOTE_CONFIG_PATH}"
         config_content = self._execute_remote_command(fetch_command)
 
         if config_content:
-            self.config = Config(config_string=config_content)
-            self.config.add_ssh_prefix_to_git_path(self.name)
+            self._set_remote_config(config_content)
         else:
             self.is_down = True
 
         # get remote version
         remote_version_str = self._execute_echogit_remote_command("version")
-
-        if remote_version_str is None:
-            self.is_down = True
-        elif not Version.is_compatible(remote_version_str):
-            print(f"peer {self.name} is incompatible: {remote_version_str}")
-            self.is_down = False
+        self._check_remote_version(remote_version_str)
 
     def fetch_config(self):
         if self.is_localhost():
@@ -112,6 +343,10 @@ class Peer:
             self._fetch_remote_config()
 
     def get_version(self):
+        self._fetch_config_if_needed()
+        if self.remote_version is not None:
+            return self.remote_version
+
         result = self._execute_echogit_remote_command("version")
         if result is None:
             return None
@@ -136,15 +371,11 @@ class Peer:
         if self.config is None:
             return None
 
-        data_path = Config.get_local_instance().projects_path
-        if not path.startswith(data_path):
-            raise ValueError(f"project_path {path} must start with data_path: {data_path}")
-
-        # Determine the relative project path
-        relative_project_path = os.path.relpath(path, data_path)
+        relative_project_path = self._get_relative_project_path(path)
         project_base_path = os.path.join(self.config.git_path, relative_project_path)
 
-        sync_type = self._determine_sync_type(project_base_path)
+        sync_type = self._determine_sync_type(relative_project_path,
+                                              project_base_path)
         if sync_type is None:
             raise ValueError(f"No .git or .rsync directory found for the project at {project_base_path}")
 
@@ -155,12 +386,147 @@ class Peer:
 
         return f"{project_base_path}.{sync_type}"
 
+    @staticmethod
+    def _get_relative_project_path(path):
+        data_path = Config.get_local_instance().projects_path
+        if not path.startswith(data_path):
+            raise ValueError(f"project_path {path} must start with data_path: {data_path}")
+
+        # Determine the relative project path
+        return os.path.relpath(path, data_path)
+
+    def get_remote_heads(self, path):
+        """
+        Return the branch heads (branch => sha) the peer advertises for the
+        git project at path, or None if they are unknown.
+        Heads come from the peer's bulk project listing, so this costs no
+        network round trip once the listing was fetched.
+        """
+        if self.is_down:
+            return None
+
+        self._fetch_config_if_needed()
+        if self.config is None:
+            return None
+
+        relative_project_path = self._get_relative_project_path(path)
+        if self.is_localhost():
+            repo_path = os.path.join(self.config.git_path,
+                                     f"{relative_project_path}.git")
+            if not os.path.isdir(repo_path):
+                return None
+            return GitRefs.get_heads(repo_path, bare=True)
+
+        self.get_remote_projects(cached=False)
+        repo_path = f"{relative_project_path}.git/"
+        agent_heads = self._get_agent_heads()
+        if agent_heads is not None:
+            return agent_heads.get(repo_path)
+        return self.get_remote_record(repo_path).get("heads")
+
+    def _get_agent_heads(self):
+        """
+        Return the heads of all the git projects of the peer as
+        {path: {branch: sha}}, read by the remote agent in one request per
+        run, or None without agent. Unlike the listing, which may come from
+        the cache, they are read from the repositories.
+        """
+        with self._heads_lock:
+            if self._agent_heads is None:
+                paths = [path for path in self._remote_records
+                         if path.endswith(".git/")]
+                answered, heads = self._query_agent("refs", paths=paths)
+                self._agent_heads = heads if answered else False
+            if self._agent_heads is False:
+                return None
+            return self._agent_heads
+
+    def get_remote_mtime(self, path):
+        """
+        Return the last modification time of the bare repository of the
+        project at path on the peer, or None if it is unknown. Like
+        get_remote_heads, this uses the bulk project listing.
+        """
+        if self.is_down:
+            return None
+
+        self._fetch_config_if_needed()
+        if self.config is None:
+            return None
+
+        relative_project_path = self._get_relative_project_path(path)
+        if self.is_localhost():
+            repo_path = os.path.join(self.config.git_path,
+                                     relative_project_path)
+            if os.path.isdir(f"{repo_path}.git"):
+                return GitRefs.get_mtime(f"{repo_path}.git")
+            if os.path.isdir(f"{repo_path}.rsync"):
+                return os.stat(f"{repo_path}.rsync").st_mtime
+            return None
+
+        self.get_remote_projects(cached=True)
+        for extension in (".git/", ".rsync/"):
+            record = self.get_remote_record(
+                f"{relative_project_path}{extension}")
+            if "mtime" in record:
+                return record["mtime"]
+        return None
+
     def _fetch_config_if_needed(self):
         """Fetch config if it's not already loaded."""
-        if self.config is None:
-            self.fetch_config()
+        with self._config_lock:
+            if self.config is None:
+                self.fetch_config()
 
-    def _determine_sync_type(self, project_base_path):
+    def _determine_sync_type(self, relative_project_path, project_base_path):
+        """
+        Determine the sync type ('git' or 'rsync') of a project.
+        Sync types of all the peer's projects are resolved in bulk on first
+        call and memoized for the run.
+        """
+        with self._sync_types_lock:
+            if self._sync_types is None:
+                self._sync_types = self._get_sync_types()
+
+            if self._sync_types:
+                return self._sync_types.get(relative_project_path)
+
+        # No bulk answer: check this project alone
+        return self._probe_sync_type(project_base_path)
+
+    def _get_sync_types(self):
+        """
+        Return a dictionary of relative project path => sync type, built
+        from the peer's project listing.
+        """
+        if self.is_localhost():
+            bare_repos = self._list_local_bare_repos(self.config.git_path)
+        else:
+            bare_repos = self.get_remote_projects(cached=False)
+
+        sync_types = {}
+        for path in bare_repos:
+            base_path, extension = os.path.splitext(path.rstrip('/'))
+            sync_types[base_path] = extension[1:]
+        return sync_types
+
+    @staticmethod
+    def _list_local_bare_repos(git_path):
+        """
+        Return the .git and .rsync folders found under git_path, with the
+        same keys as a remote projects listing.
+        """
+        bare_repos = {}
+        for root, dirs, _files in os.walk(git_path):
+            for folder in list(dirs):
+                if folder.endswith(".git") or folder.endswith(".rsync"):
+                    path = os.path.relpath(os.path.join(root, folder), git_path)
+                    bare_repos[path + "/"] = os.path.splitext(folder)[0]
+                    # Don't walk inside bare repositories
+                    dirs.remove(folder)
+        return bare_repos
+
+    def _probe_sync_type(self, project_base_path):
         """
         Determine the sync type ('git' or 'rsync') by checking the folder's existence
         locally or remotely depending on whether the peer is localhost.
@@ -181,6 +547,9 @@ class Peer:
         """Check if a directory exists on a remote peer via SSH."""
         # ssh_directory_path start with ssh://peer_name:. Remove it
         directory_path = ssh_directory_path.split(":")[-1]
+        answered, exists = self._query_agent("dir_exists", path=directory_path)
+        if answered:
+            return exists
         return self._execute_remote_command(f"test -d {directory_path}") is not None
 
     def get_remote_projects(self, cached):
@@ -188,25 +557,85 @@ class Peer:
         Retrieve the remote projects, either from cache or by running the
         command remotely.
         """
+        # Already fetched during this run, by the handshake for example
+        if self._remote_projects is not None:
+            return self._remote_projects
+
         if cached:
-            cached_projects = self._load_cached_projects()
-            if cached_projects:
+            cached_projects = self._get_cached_projects()
+            if cached_projects is not None:
                 return cached_projects
 
         self._fetch_config_if_needed()
+        if self._remote_projects is not None:
+            return self._remote_projects
 
         # If not using cache or cache is missing, fetch remote projects
         projects = self._fetch_remote_projects()
         if projects:
-            self._save_projects_to_cache(projects)
+            self._save_cache(self._fetch_remote_token())
 
         return projects
 
+    def _get_cached_projects(self):
+        """
+        Return the cached projects, or None if the cache must be refreshed.
+        The cache is trusted for cache_ttl seconds. After that, the peer is
+        asked for its projects token and the cache is kept if the token
+        didn't change.
+        """
+        cache = self._load_cache()
+        if cache is None:
+            return None
+
+        if time.time() - cache["fetched"] > self.cache_ttl:
+            token = self._fetch_remote_token()
+            if token is None or token != cache["token"]:
+                return None
+            self._set_remote_projects(cache["records"])
+            self._save_cache(token)
+            return self._remote_projects
+
+        return self._set_remote_projects(cache["records"])
+
+    def _fetch_remote_token(self):
+        """
+        Return the token of the remote projects, which changes when a
+        project is added, removed or modified.
+        """
+        answered, token = self._query_agent("token")
+        if answered:
+            return token
+
+        if self.config is None:
+            command = f"{Peer.BOOTSTRAP_COMMAND} list --token"
+            output = self._execute_remote_command(command)
+        elif "token" in self.capabilities:
+            output = self._execute_echogit_remote_command("list --token")
+        else:
+            return None
+
+        if not output:
+            return None
+        return output.strip().splitlines()[-1]
+
     def _fetch_remote_projects(self):
         """
         Fetch remote bare repositories using SSH and return them as a
         dictionary.
         """
+        answered, records = self._query_agent("list")
+        if answered:
+            return self._set_remote_projects(records)
+
+        if "list-json" in self.capabilities:
+            lines = self._stream_echogit_remote_command("list --format ndjson")
+            records = self._parse_project_records(lines)
+            if self.is_down:
+                return {}
+            return self._set_remote_projects(records)
+
+        # Peer without machine-readable listing
         result = self._execute_echogit_remote_command("list")
 
         if not result:
@@ -225,18 +654,73 @@ class Peer:
             self.is_down = True
             return {}
 
-        # Rebuild the dictionary with paths ending in .git or .rsync
-        bare_repo_dict = {
-            path: project_name
-            for path, project_name in repo_dict.items()
-            if path.endswith('.git/') or path.endswith('.rsync/')
+        return self._set_remote_projects(repo_dict)
+
+    @staticmethod
+    def _parse_project_records(lines):
+        """
+        Parse the output of 'list --format ndjson' line by line. Lines that
+        are not project records are ignored.
+        """
+        records = []
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and "path" in record:
+                records.append(record)
+        return records
+
+    def _set_remote_projects(self, listing):
+        """
+        Keep the bare repositories (paths ending in .git or .rsync) of a
+        remote listing. The listing is either a list of project records or,
+        for older peers, a dictionary of path => name.
+        Return the projects as a dictionary of path => name.
+        """
+        if isinstance(listing, dict):
+            listing = [{"path": path, "name": name}
+                       for path, name in listing.items()]
+
+        self._remote_records = {
+            record["path"]: record
+            for record in listing
+            if record["path"].endswith('.git/') or
+            record["path"].endswith('.rsync/')
         }
+        self._remote_projects = {
+            path: record["name"]
+            for path, record in self._remote_records.items()
+        }
+        return self._remote_projects
 
-        return bare_repo_dict
+    def reset(self):
+        """
+        Forget what was learnt about the peer during a run: its down flag
+        and its project listing. Used by long running processes before
+        each sync, so that they see changes of the peer.
+        """
+        self.is_down = False
+        with self._sync_types_lock:
+            self._sync_types = None
+        self._remote_projects = None
+        self._remote_records = {}
+        with self._heads_lock:
+            self._agent_heads = None
+
+    def get_remote_record(self, path):
+        """
+        Return the record (sync type, heads, mtime...) of a remote bare
+        repository, as fetched during this run.
+        """
+        return self._remote_records.get(path, {"path": path})
 
-    def _load_cached_projects(self):
+    def _load_cache(self):
         """
         Load cached projects from the local cache file.
+        Return a dictionary with the projects token, the time they were
+        fetched and their records, or None.
         """
         cache_file = self._get_cache_file()
 
@@ -244,33 +728,51 @@ class Peer:
             try:
                 with open(cache_file, "r") as f:
                     cached_data = json.load(f)
-                    return cached_data
             except (json.JSONDecodeError, IOError):
                 print(
                     f"Failed to load cache from {cache_file}. Ignoring cache", file=sys.stderr)
+                return None
+
+            if "records" not in cached_data:
+                # Old cache format: path => name, always stale
+                return {"token": None, "fetched": 0,
+                        "records": [{"path": path, "name": name}
+                                    for path, name in cached_data.items()]}
+            return cached_data
 
         return None
 
-    def _save_projects_to_cache(self, projects):
+    def _save_cache(self, token):
         """
         Save the projects to a local cache file.
+        The file is replaced atomically so concurrent runs can't corrupt it.
         """
         cache_file = self._get_cache_file()
+        cached_data = {
+            "token": token,
+            "fetched": time.time(),
+            "records": list(self._remote_records.values()),
+        }
 
         try:
-            with open(cache_file, "w") as f:
-                json.dump(projects, f)
+            with tempfile.NamedTemporaryFile(
+                    "w", dir=self.cache_dir, delete=False,
+                    prefix=f".{self.name}_", suffix=".tmp") as f:
+                json.dump(cached_data, f)
+            os.replace(f.name, cache_file)
         except IOError:
             print(f"Failed to write cache to {cache_file}.", file=sys.stderr)
 
-    def _execute_remote_command(self, command):
+    def _execute_remote_command(self, command, quiet=False):
         """
         Executes a remote command via SSH and returns the output.
+        If quiet is set, a failure of the command is not reported: the
+        caller has a fallback.
         """
         if self.is_down:
             return None
 
-        ssh_command = ['ssh', self.host, command]
+        ssh_command = self.get_ssh_command() + [self.host, command]
 
         try:
             result = subprocess.run(
@@ -286,10 +788,64 @@ class Peer:
 
         except subprocess.CalledProcessError as e:
             # Handle other errors (command executed but failed)
+            if quiet:
+                return None
             host = self.host
             print(f"Error executing remote command '{command}' on {host}: {e}", file=sys.stderr)
             return None
 
+    def _stream_remote_command(self, command, timeout=STREAM_TIMEOUT):
+        """
+        Executes a remote command via SSH and yields its output line by
+        line as it arrives. The command is killed if it prints nothing for
+        timeout seconds. Its stderr goes to a temporary file, so a chatty
+        command can't block on a full pipe.
+        """
+        if self.is_down:
+            return
+
+        ssh_command = self.get_ssh_command() + [self.host, command]
+        with tempfile.TemporaryFile() as stderr:
+            try:
+                process = subprocess.Popen(ssh_command,
+                                           stdout=subprocess.PIPE,
+                                           stderr=stderr)
+            except OSError as e:
+                self.is_down = True
+                print(f"Network error: Peer {self.host} is unreachable: {e}", file=sys.stderr)
+                return
+
+            with process:
+                fd = process.stdout.fileno()
+                buffer = b""
+                while True:
+                    if not select.select([fd], [], [], timeout)[0]:
+                        process.kill()
+                        print(f"Remote command '{command}' on {self.host} "
+                              f"sent nothing for {timeout}s", file=sys.stderr)
+                        return
+                    data = os.read(fd, 65536)
+                    if not data:
+                        break
+                    buffer += data
+                    *lines, buffer = buffer.split(b"\n")
+                    for line in lines:
+                        yield line.decode() + "\n"
+                if buffer:
+                    yield buffer.decode()
+
+            if process.returncode != 0:
+                stderr.seek(0)
+                errors = stderr.read().decode(errors="replace")
+                print(f"Error executing remote command '{command}' on {self.host}: {errors}", file=sys.stderr)
+
+    def _stream_echogit_remote_command(self, command):
+        if self.is_down:
+            return iter(())
+
+        full_command = f"python3 {self.config.echogit_bin} {command}"
+        return self._stream_remote_command(full_command)
+
     def _execute_echogit_remote_command(self, command):
         if self.is_down:
             return None
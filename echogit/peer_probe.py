@@ -0,0 +1,104 @@
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PeerProbe:
+    """
+    Check that peers are reachable before doing any real work.
+
+    All peers are probed in parallel with a TCP connect and a read of the
+    SSH banner, both bounded by a short timeout. Peers behind a ProxyJump
+    or ProxyCommand are probed with a no-op ssh command instead. Unreachable
+    peers are marked down so they can't stall the first remote call of each
+    project.
+    """
+    SSH_PORT = 22
+
+    def __init__(self, timeout=2.0):
+        self.timeout = timeout
+
+    def _resolve(self, peer):
+        """
+        Return the (hostname, port, proxied) ssh really connects to, so
+        that host aliases of ~/.ssh/config are honored. proxied is True if
+        ssh goes through a ProxyJump or ProxyCommand.
+        """
+        hostname, port, proxied = peer.host, PeerProbe.SSH_PORT, False
+        try:
+            result = subprocess.run(["ssh", "-G", peer.host],
+                                    capture_output=True, text=True,
+                                    timeout=self.timeout)
+        except (OSError, subprocess.TimeoutExpired):
+            return hostname, port, proxied
+
+        for line in result.stdout.splitlines():
+            key, _, value = line.partition(" ")
+            if key == "hostname":
+                hostname = value
+            elif key == "port":
+                port = int(value)
+            elif key in ("proxyjump", "proxycommand") and value != "none":
+                proxied = True
+        return hostname, port, proxied
+
+    def _connect(self, hostname, port):
+        """Connect to the ssh server and read its banner."""
+        with socket.create_connection((hostname, port),
+                                      timeout=self.timeout) as sock:
+            latency = time.monotonic()
+            banner = sock.recv(256)
+        if not banner.startswith(b"SSH-"):
+            raise OSError("no ssh banner")
+        return latency
+
+    def _run_ssh(self, peer):
+        """
+        Run a no-op through ssh, for peers only reachable through a proxy.
+        The timeout covers two connections and the authentication.
+        """
+        command = ["ssh", "-o", "BatchMode=yes",
+                   "-o", f"ConnectTimeout={max(1, round(self.timeout))}",
+                   peer.host, "true"]
+        try:
+            result = subprocess.run(command, stdin=subprocess.DEVNULL,
+                                    stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.DEVNULL,
+                                    timeout=self.timeout * 3)
+        except subprocess.TimeoutExpired:
+            raise OSError("timed out")
+        if result.returncode != 0:
+            raise OSError(f"ssh failed with code {result.returncode}")
+        return time.monotonic()
+
+    def probe(self, peer):
+        """
+        Probe one peer and set its latency and is_down flag.
+        """
+        if peer.is_localhost():
+            peer.latency = 0.0
+            return peer
+
+        hostname, port, proxied = self._resolve(peer)
+        start = time.monotonic()
+        try:
+            if proxied:
+                connected = self._run_ssh(peer)
+            else:
+                connected = self._connect(hostname, port)
+            peer.latency = connected - start
+        except OSError as e:
+            peer.latency = None
+            peer.is_down = True
+            print(f"Peer {peer.name} is down: {e}", file=sys.stderr)
+        return peer
+
+    def probe_all(self, peers):
+        """Probe all peers in parallel and return them."""
+        peers = list(peers)
+        if not peers:
+            return peers
+        with ThreadPoolExecutor(max_workers=len(peers)) as executor:
+            return list(executor.map(self.probe, peers))
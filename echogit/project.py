@@ -33,3 +33,37 @@ class Project(Node):
         # Success is 1 if all children succeeded, otherwise 0
         return int(success == total and total > 0), 1
 
+
+    def get_status_record(self):
+        """
+        Return the cached status of the project, without any git or network
+        call: flags of get_project_state_str, date of the last sync, peers
+        which were down and the status of each branch.
+        """
+        branches = [branch.get_status_record()
+                    for repository in self.children
+                    for branch in repository.children
+                    if hasattr(branch, "get_status_record")]
+        dates = [branch["cache_date"] for branch in branches
+                 if branch["cache_date"]]
+        return {
+            "path": self.get_relative_path(),
+            "name": self.name,
+            "sync_type": self.get_sync_type(),
+            "state": self.get_project_state_str(),
+            "has_error": self.has_error(),
+            "last_sync": max(dates) if dates else None,
+            "peers_down": sorted({branch["peer"] for branch in branches
+                                  if branch["peer_down"]}),
+            "branches": branches,
+        }
+
+    def get_plan_records(self):
+        """
+        Return what a sync of the project would do with each peer and
+        branch, without changing anything.
+        """
+        path = self.get_relative_path()
+        return [{"path": path, **record}
+                for repository in self.children
+                for record in repository.get_plan_records()]
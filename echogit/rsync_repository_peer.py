@@ -1,4 +1,5 @@
 import subprocess
+import sys
 from echogit.config import Config
 from echogit.node import Node
 
@@ -9,7 +10,86 @@ class RsyncRepositoryPeer(Node):
         super().__init__(peer.name, path=path, parent=parent, config=config)
         self.peer = peer
 
+    def start_progress(self):
+        self.sync_done = 0
+        self.sync_total = 1
+        return 1
+
+    def _get_rsync_command(self, options, source, destination):
+        return ['rsync'] + options + self.peer.get_rsync_options() + \
+            ["--exclude=.echogit/", source, destination]
+
+    # rsync 3.1 and later count regular files, older versions all files
+    FILES_TRANSFERRED_KEYS = ["Number of regular files transferred",
+                              "Number of files transferred"]
+
+    @staticmethod
+    def _parse_stats(output):
+        """
+        Return (files, bytes) to transfer from the output of --stats.
+        Raise ValueError if the number of files is missing.
+        """
+        stats = {}
+        for line in output.splitlines():
+            key, _, value = line.partition(":")
+            if value.strip():
+                stats[key.strip()] = value.split()[0].replace(",", "")
+        for key in RsyncRepositoryPeer.FILES_TRANSFERRED_KEYS:
+            if key in stats:
+                return (int(stats[key]),
+                        int(stats.get("Total transferred file size", 0)))
+        raise ValueError("no number of files transferred in rsync stats")
+
+    def get_plan_records(self):
+        """
+        Return what a sync would transfer, from an rsync --dry-run --stats
+        pass in each direction. ahead and behind are the numbers of files
+        to push and to pull.
+        """
+        record = {"peer": self.peer.name, "branch": None,
+                  "sync_type": "rsync", "state": "peer-down", "ahead": None,
+                  "behind": None, "bytes": None}
+        if self.peer.is_down:
+            return [record]
+
+        options = ['-aur', '--dry-run', '--stats']
+        try:
+            rsync_path = self.peer.get_remote_project_url(self.path)
+            counts = []
+            for source, destination in [(self.path + "/", rsync_path),
+                                        (rsync_path + "/", self.path)]:
+                with self.peer.session():
+                    result = subprocess.run(
+                        self._get_rsync_command(options, source,
+                                                destination),
+                        check=True, text=True, capture_output=True)
+                counts.append(self._parse_stats(result.stdout))
+        except (OSError, TypeError, ValueError,
+                subprocess.CalledProcessError) as e:
+            print(f"{self.path}: rsync --dry-run failed: {e}",
+                  file=sys.stderr)
+            record["state"] = "error"
+            return [record]
+
+        (ahead, push_bytes), (behind, pull_bytes) = counts
+        record.update({
+            "state": "diverged" if ahead and behind else
+                     "ahead" if ahead else
+                     "behind" if behind else "up-to-date",
+            "ahead": ahead,
+            "behind": behind,
+            "bytes": push_bytes + pull_bytes,
+        })
+        return [record]
+
     def sync(self, verbose=False):
+        # Wait for the peer to accept one more session
+        with self.peer.session():
+            result = self._sync(verbose)
+        self.report_progress()
+        return result
+
+    def _sync(self, verbose):
         """
         Perform a bidirectional sync between self.path and rsync_path
         """
@@ -21,7 +101,7 @@ class RsyncRepositoryPeer(Node):
             rsync_options.append('-v')
 
         if self.peer.config is None and not self.peer.is_down:
-            self.peer.fetch_config()
+            self.peer._fetch_config_if_needed()
 
         config = Config.get_local_instance()
         if self.peer.is_down and config.ignore_peers_down:
@@ -32,8 +112,6 @@ class RsyncRepositoryPeer(Node):
             return 0, 1
 
         try:
-            exclusion_options = ["--exclude=.echogit/"]
-
             # Sync self.path to rsync_path (local to remote)
             # Add extra / at the end of the source.
             # source and source/ create different results:
@@ -41,19 +119,23 @@ class RsyncRepositoryPeer(Node):
             # - source/ — copy the contents of source into destination.
             if verbose:
                 print(f"Syncing {self.path} -> {rsync_path}")
-            subprocess.run(['rsync'] + rsync_options + exclusion_options + [self.path + "/", rsync_path], check=True)
+            result = subprocess.run(self._get_rsync_command(rsync_options, self.path + "/", rsync_path),
+                                    check=True, text=True, capture_output=True)
+            print(result.stdout, end="")
 
             # Sync rsync_path to self.path (remote to local)
             if verbose:
                 print(f"Syncing {rsync_path}/ -> {self.path}")
-            subprocess.run(['rsync'] + rsync_options + exclusion_options + [rsync_path + "/", self.path], check=True)
+            result = subprocess.run(self._get_rsync_command(rsync_options, rsync_path + "/", self.path),
+                                    check=True, text=True, capture_output=True)
+            print(result.stdout, end="")
 
             if verbose:
                 print("Bidirectional sync completed successfully.")
 
             return 1, 1
         except subprocess.CalledProcessError as e:
-            print(f"Rsync error: {e}")
+            print(f"Rsync error: {e}\n{e.stderr}")
             return 0, 1
         except Exception as e:
             print(f"An unexpected error occurred: {e}")
@@ -0,0 +1,211 @@
+import json
+import os
+import sys
+import tempfile
+import time
+from echogit.node import Node
+
+
+class ScanIndex:
+    """
+    On-disk index of the folders scanned by SyncFolder.scan.
+
+    For every folder, the index keeps its mtime and the type of each of its
+    sub-folders. A folder whose mtime didn't change is not listed again, and
+    each of its entries only costs one stat to check that its type is still
+    valid, instead of the isdir probes and config reads of
+    Node.get_type_from_folder. Changed folders are listed with os.scandir
+    and an entry is classified from its own listing, which is reused when
+    the entry is scanned in turn.
+
+    An mtime read less than MTIME_GRANULARITY before a later change may not
+    move: FAT file systems, common on SD cards, have a 2 seconds mtime
+    resolution. Such recent mtimes are not trusted, and their folders are
+    checked again by the next scan.
+
+    The mtime of the .echogit folder of an entry is kept along with the one
+    of its config.ini, so that a config.ini added to an existing .echogit
+    folder is seen.
+    """
+    VERSION = 3
+    MTIME_GRANULARITY = 2 * 10**9
+
+    def __init__(self):
+        self.path = os.path.join(self._get_cache_dir(), "scan_index.json")
+        # folder => {"mtime": ns, "scanned": ns,
+        #            "entries": {name: [type, mtime, echogit, config,
+        #                               checked]}}
+        self.folders = {}
+        self.visited = set()
+        # folder => (mtime, sub-folders, time) listed while classifying it
+        self._listings = {}
+        self.changed = False
+
+    @staticmethod
+    def _get_cache_dir():
+        xdg_cache_home = os.getenv(
+            "XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+        cache_dir = os.path.join(xdg_cache_home, "echogit")
+        os.makedirs(cache_dir, exist_ok=True)
+        return cache_dir
+
+    def load(self):
+        """Load the index file. Return False if there is none."""
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if data.get("version") != ScanIndex.VERSION:
+            return False
+        self.folders = data["folders"]
+        return True
+
+    def save(self, root=None):
+        """
+        Write the index atomically if it changed. If root is given, folders
+        below root which were not seen by the last scan are dropped.
+        """
+        if root is not None:
+            self._prune(os.path.abspath(root))
+        if not self.changed:
+            return
+
+        data = {"version": ScanIndex.VERSION, "folders": self.folders}
+        try:
+            with tempfile.NamedTemporaryFile(
+                    "w", dir=os.path.dirname(self.path), delete=False,
+                    prefix=".scan_index_", suffix=".tmp") as f:
+                json.dump(data, f)
+            os.replace(f.name, self.path)
+            self.changed = False
+        except OSError as e:
+            print(f"Failed to write scan index {self.path}: {e}",
+                  file=sys.stderr)
+
+    def _prune(self, root):
+        prefix = os.path.join(root, "")
+        for folder in list(self.folders):
+            if folder not in self.visited and \
+                    (folder == root or folder.startswith(prefix)):
+                del self.folders[folder]
+                self.changed = True
+
+    @staticmethod
+    def _get_mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    @staticmethod
+    def _get_config_mtimes(path):
+        """
+        Return the mtimes of the .echogit folder of path and of its
+        config.ini, None for the missing ones.
+        """
+        echogit_path = os.path.join(path, ".echogit")
+        return (ScanIndex._get_mtime(echogit_path),
+                ScanIndex._get_mtime(os.path.join(echogit_path,
+                                                  "config.ini")))
+
+    def _list_subdirs(self, path):
+        """
+        Return the sub-folder names of path with a single os.scandir pass.
+        DirEntry.is_dir() uses the file type returned by the directory
+        listing, so entries don't need a stat of their own.
+        """
+        with os.scandir(path) as it:
+            return [entry.name for entry in it if entry.is_dir()]
+
+    @staticmethod
+    def _is_recent(mtime, checked):
+        """
+        True if mtime was read too soon after it was set to be sure that
+        a later change would have moved it.
+        """
+        return mtime is not None and \
+            mtime > checked - ScanIndex.MTIME_GRANULARITY
+
+    def _classify(self, path):
+        """
+        Return the index entry [type, mtime, .echogit mtime, config mtime,
+        time checked] of the folder at path, or None if it is gone.
+        The sub-folders read to classify a plain folder are kept for its own
+        scan, so every folder is only listed once.
+        """
+        checked = time.time_ns()
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            if path.endswith(".git") or path.endswith(".rsync"):
+                subdirs = []
+            else:
+                subdirs = self._list_subdirs(path)
+        except OSError:
+            return None
+        node_type = Node.get_type_from_subdirs(path, subdirs)
+        if node_type == Node.NodeType.SYNC_FOLDER:
+            self._listings[path] = (mtime, subdirs, checked)
+        echogit_mtime, config_mtime = None, None
+        if ".echogit" in subdirs:
+            echogit_mtime, config_mtime = ScanIndex._get_config_mtimes(path)
+        return [node_type.value, mtime, echogit_mtime, config_mtime, checked]
+
+    @staticmethod
+    def _is_valid(path, entry):
+        _node_type, mtime, echogit_mtime, config_mtime, checked = entry
+        if any(ScanIndex._is_recent(value, checked)
+               for value in (mtime, echogit_mtime, config_mtime)):
+            return False
+        try:
+            if os.stat(path).st_mtime_ns != mtime:
+                return False
+        except OSError:
+            return False
+        return echogit_mtime is None or \
+            ScanIndex._get_config_mtimes(path) == (echogit_mtime,
+                                                   config_mtime)
+
+    def get_entries(self, folder_path):
+        """
+        Return the sub-folders of folder_path as a list of
+        (name, Node.NodeType), reusing the index where possible.
+        """
+        folder_path = os.path.abspath(folder_path)
+        self.visited.add(folder_path)
+        scanned = time.time_ns()
+        mtime = os.stat(folder_path).st_mtime_ns
+        folder = self.folders.get(folder_path)
+
+        listing = self._listings.pop(folder_path, None)
+
+        if folder is None or folder["mtime"] != mtime or \
+                self._is_recent(folder["mtime"], folder["scanned"]):
+            # Folder content changed: list it again
+            if listing is not None and listing[0] == mtime:
+                _mtime, subdirs, scanned = listing
+            else:
+                subdirs = self._list_subdirs(folder_path)
+            entries = {}
+            for item in subdirs:
+                entry = self._classify(os.path.join(folder_path, item))
+                if entry is not None:
+                    entries[item] = entry
+            folder = {"mtime": mtime, "scanned": scanned,
+                      "entries": entries}
+            self.folders[folder_path] = folder
+            self.changed = True
+        else:
+            entries = folder["entries"]
+            for item, entry in entries.items():
+                full_path = os.path.join(folder_path, item)
+                if not self._is_valid(full_path, entry):
+                    entries[item] = self._classify(full_path)
+                    self.changed = True
+            for item in [item for item, entry in entries.items()
+                         if entry is None]:
+                del entries[item]
+
+        return [(item, Node.NodeType(entry[0]))
+                for item, entry in entries.items()]
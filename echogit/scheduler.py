@@ -0,0 +1,447 @@
+import heapq
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from echogit.agent import Agent
+from echogit.config import Config
+from echogit.node_factory import NodeFactory
+from echogit.peer import Peer
+from echogit.peer_probe import PeerProbe
+from echogit.status_store import StatusStore
+
+
+class PeerCircuit:
+    """
+    Exponential backoff and circuit breaker of one peer.
+
+    After a failure the peer is not tried again before a delay, doubling
+    at each failure in a row up to max_delay. Once threshold failures in a
+    row are reached the circuit is open: jobs of the peer are dropped
+    instead of waiting, until the delay expires and one probe is allowed
+    (half open). A success closes the circuit.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, threshold=3, base_delay=30.0, max_delay=3600.0):
+        self.threshold = threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failures = 0
+        self.retry_at = 0.0
+
+    def get_state(self, now):
+        if self.failures < self.threshold:
+            return PeerCircuit.CLOSED
+        if now < self.retry_at:
+            return PeerCircuit.OPEN
+        return PeerCircuit.HALF_OPEN
+
+    def is_available(self, now):
+        return now >= self.retry_at
+
+    def record_success(self):
+        self.failures = 0
+        self.retry_at = 0.0
+
+    def record_failure(self, now):
+        self.failures += 1
+        delay = self.base_delay * 2 ** (self.failures - 1)
+        self.retry_at = now + min(delay, self.max_delay)
+
+
+class Scheduler:
+    """
+    Long running process syncing (project, peer) jobs from a priority
+    queue.
+
+    All jobs are queued every interval seconds, and more can be queued
+    through a unix socket (see SchedulerClient). Jobs queued through the
+    socket go first, then jobs are ordered by their score: seconds since
+    the last successful sync with the peer, a bonus for projects changed
+    recently or since that sync, and the peer priority (higher first).
+    Peers are probed before their first job and after a failure, with a
+    PeerCircuit each. A project is synced by one job at a time. The
+    listings of the peers are read again each round, once no job uses
+    them.
+    """
+    # Scores are in seconds, capped so that old projects don't starve
+    # recent ones
+    MAX_IDLE = 24 * 3600
+    PEER_PRIORITY_WEIGHT = 3600
+    # Seconds during which a successful probe is trusted
+    PROBE_INTERVAL = 60
+
+    def __init__(self, folder, *, config=None, jobs=2, interval=600,
+                 socket_path=None, verbose=False):
+        self.folder = folder
+        self.config = config or Config.get_local_instance()
+        self.jobs = max(1, jobs)
+        self.interval = interval
+        self.socket_path = socket_path or self.get_socket_path()
+        self.verbose = verbose
+        # path => project
+        self.projects = {}
+        # heap of (not urgent, -score, seq, (path, peer name))
+        self._heap = []
+        self._seq = 0
+        # (path, peer name) => urgent, for jobs in the heap
+        self._queued = {}
+        # project paths being synced
+        self._running = set()
+        # peer name => number of jobs running with it
+        self._peer_jobs = {}
+        # Peers to reset once their running jobs are done
+        self._stale_peers = set()
+        self._circuits = {}
+        # peer name => time of its last successful probe
+        self._probed = {}
+        self._cond = threading.Condition()
+        self._server = None
+        self._workers = []
+        # Set at shutdown: queued jobs are not started anymore
+        self._stopping = False
+
+    @staticmethod
+    def get_socket_path():
+        runtime_dir = os.getenv("XDG_RUNTIME_DIR")
+        if not runtime_dir:
+            return os.path.join(StatusStore.get_state_dir(), "scheduler.sock")
+        socket_dir = os.path.join(runtime_dir, "echogit")
+        os.makedirs(socket_dir, exist_ok=True)
+        return os.path.join(socket_dir, "scheduler.sock")
+
+    def load(self):
+        """Scan the folder for projects."""
+        root = NodeFactory.from_folder(self.folder, self.config)
+        root.scan()
+        projects = root.get_projects() if root.is_folder() else [root]
+        with self._cond:
+            self.projects = {os.path.normpath(project.path): project
+                             for project in projects}
+
+    def _get_circuit(self, peer_name):
+        circuit = self._circuits.get(peer_name)
+        if circuit is None:
+            circuit = self._circuits[peer_name] = PeerCircuit()
+        return circuit
+
+    def get_score(self, path, peer, now=None):
+        """Return the score of a job, the highest is synced first."""
+        now = now or time.time()
+        last_success = StatusStore.get_instance().get_last_success(
+            path, peer.name)
+        try:
+            mtime = self.projects[path].get_mtime()
+        except OSError:
+            mtime = now
+        idle = Scheduler.MAX_IDLE if last_success is None else \
+            now - last_success
+        score = min(idle, Scheduler.MAX_IDLE)
+        # Recent local activity, and changes not synced yet
+        score += max(0, Scheduler.MAX_IDLE - (now - mtime))
+        if last_success is None or mtime > last_success:
+            score += Scheduler.MAX_IDLE
+        return score + peer.priority * Scheduler.PEER_PRIORITY_WEIGHT
+
+    def enqueue(self, path, peer_name=None, urgent=False):
+        """
+        Queue the jobs of the projects below path, with peer_name or all
+        their peers. Return the number of jobs queued.
+        """
+        path = os.path.normpath(os.path.abspath(os.path.expanduser(path)))
+        prefix = os.path.join(path, "")
+        with self._cond:
+            projects = [(project_path, project)
+                        for project_path, project in self.projects.items()
+                        if project_path == path or
+                        project_path.startswith(prefix)]
+        count = 0
+        for project_path, project in projects:
+            for remote in project.node_config.sync_remotes:
+                peer = self.config.get_peer(remote)
+                if peer is None or peer_name not in (None, remote):
+                    continue
+                score = self.get_score(project_path, peer)
+                if self._push((project_path, remote), score, urgent):
+                    count += 1
+        return count
+
+    def _push(self, key, score, urgent=False):
+        with self._cond:
+            queued_urgent = self._queued.get(key)
+            if queued_urgent is not None and (queued_urgent or not urgent):
+                return False
+            # An urgent job replaces the same job queued normally: the
+            # stale heap entry is skipped when popped
+            self._queued[key] = urgent
+            self._seq += 1
+            heapq.heappush(self._heap, (not urgent, -score, self._seq, key))
+            self._cond.notify()
+            return True
+
+    def _has_free_session(self, peer_name):
+        """
+        False if max_sessions jobs already run with the peer: its jobs
+        wait, and jobs of other peers run meanwhile.
+        """
+        peer = self.config.get_peer(peer_name)
+        if peer is None or not peer.max_sessions:
+            return True
+        return self._peer_jobs.get(peer_name, 0) < peer.max_sessions
+
+    def _pop(self, now):
+        """
+        Return the first runnable job as (path, peer name), or the time to
+        wait for one.
+        """
+        skipped = []
+        job = None
+        wait = None
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            not_urgent, _score, _seq, key = entry
+            if self._queued.get(key) != (not not_urgent):
+                continue  # replaced by an urgent entry
+            path, peer_name = key
+            circuit = self._get_circuit(peer_name)
+            if circuit.get_state(now) == PeerCircuit.OPEN and not_urgent:
+                del self._queued[key]
+                continue
+            # Jobs queued by hand don't wait for the backoff delay
+            waiting = not_urgent and not circuit.is_available(now)
+            if path in self._running or waiting or \
+                    not self._has_free_session(peer_name):
+                if waiting:
+                    retry_in = circuit.retry_at - now
+                    wait = retry_in if wait is None else min(wait, retry_in)
+                skipped.append(entry)
+                continue
+            del self._queued[key]
+            job = key
+            break
+        for entry in skipped:
+            heapq.heappush(self._heap, entry)
+        return job, wait
+
+    def _next_job(self):
+        """Wait for a job to run, or return None when stopping."""
+        with self._cond:
+            while not self._stopping:
+                job, wait = self._pop(time.monotonic())
+                if job is not None:
+                    self._running.add(job[0])
+                    self._peer_jobs[job[1]] = \
+                        self._peer_jobs.get(job[1], 0) + 1
+                    return job
+                self._cond.wait(wait)
+            return None
+
+    def _check_peer(self, peer):
+        """Probe the peer if needed, and return True if it is up."""
+        now = time.monotonic()
+        circuit = self._get_circuit(peer.name)
+        probed = self._probed.get(peer.name)
+        if circuit.failures == 0 and not peer.is_down and probed and \
+                now - probed < Scheduler.PROBE_INTERVAL:
+            return True
+        # Probe a copy: the peer and its listings may be in use by other
+        # jobs
+        probe = PeerProbe(self.config.probe_timeout).probe(
+            Peer(peer.name, peer.host, peer.git_path))
+        if probe.is_down:
+            circuit.record_failure(now)
+            return False
+        peer.latency = probe.latency
+        peer.is_down = False
+        circuit.record_success()
+        self._probed[peer.name] = now
+        return True
+
+    def run_job(self, path, peer_name):
+        """Sync one project with one peer. Return True on success."""
+        project = self.projects.get(path)
+        peer = self.config.get_peer(peer_name)
+        if project is None or peer is None:
+            return False
+        if not self._check_peer(peer):
+            print(f"{project.name}: peer {peer_name} is down")
+            self._push((path, peer_name), self.get_score(path, peer))
+            return False
+
+        repository = project.createRepositoryPeer(peer=peer)
+        repository.scan()
+        success, total = repository.sync(verbose=self.verbose)
+        if peer.is_down:
+            self._get_circuit(peer_name).record_failure(time.monotonic())
+            self._push((path, peer_name), self.get_score(path, peer))
+        print(f"{project.name} with {peer_name}: {success}/{total}")
+        return success == total
+
+    def reset_peers(self):
+        """
+        Forget the listings of the peers at the start of a round, so that
+        its jobs see the changes of the peers. A peer is reset when no job
+        runs with it, since running jobs read its listing.
+        """
+        with self._cond:
+            for name, peer in self.config.get_peers().items():
+                if self._peer_jobs.get(name):
+                    self._stale_peers.add(name)
+                else:
+                    peer.reset()
+
+    def _job_done(self, path, peer_name):
+        with self._cond:
+            self._running.discard(path)
+            self._peer_jobs[peer_name] -= 1
+            if not self._peer_jobs[peer_name] and \
+                    peer_name in self._stale_peers:
+                self._stale_peers.discard(peer_name)
+                self.config.get_peer(peer_name).reset()
+            self._cond.notify_all()
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            path, peer_name = job
+            try:
+                self.run_job(path, peer_name)
+            except Exception as e:
+                print(f"{path} with {peer_name}: sync failed: {e}")
+            finally:
+                self._job_done(path, peer_name)
+
+    def start_workers(self):
+        self._stopping = False
+        self._workers = [threading.Thread(target=self._worker)
+                         for _ in range(self.jobs)]
+        for worker in self._workers:
+            worker.start()
+
+    def stop_workers(self):
+        """
+        Wait for the running jobs, without starting the queued ones, so
+        that no git command is killed halfway.
+        """
+        with self._cond:
+            self._stopping = True
+            running = len(self._running)
+            self._cond.notify_all()
+        if running:
+            print(f"Waiting for {running} running jobs")
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    def get_status(self):
+        now = time.monotonic()
+        with self._cond:
+            return {
+                "queued": len(self._queued),
+                "running": sorted(self._running),
+                "peers": {
+                    name: {
+                        "state": circuit.get_state(now),
+                        "failures": circuit.failures,
+                        "retry_in": max(0, round(circuit.retry_at - now)),
+                    } for name, circuit in self._circuits.items()
+                },
+            }
+
+    def _op_enqueue(self, path, peer=None):
+        return self.enqueue(path, peer, urgent=True)
+
+    def _op_status(self):
+        return self.get_status()
+
+    def handle(self, line):
+        """Answer one request of the control socket, see Agent.handle."""
+        return Agent.dispatch(self, line)
+
+    def start_server(self):
+        """Answer the control socket on a background thread."""
+        if os.path.exists(self.socket_path):
+            try:
+                SchedulerClient(self.socket_path).request("status")
+                raise RuntimeError(
+                    f"A scheduler is already running on {self.socket_path}")
+            except OSError:
+                os.remove(self.socket_path)
+
+        scheduler = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    response = scheduler.handle(line.decode())
+                    self.wfile.write(json.dumps(response).encode() + b"\n")
+
+        self._server = socketserver.ThreadingUnixStreamServer(
+            self.socket_path, Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever,
+                         daemon=True).start()
+
+    def stop_server(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            os.remove(self.socket_path)
+            self._server = None
+
+    def run(self):
+        self.load()
+        self.start_server()
+        self.start_workers()
+        print(f"Scheduling {len(self.projects)} projects, "
+              f"control socket: {self.socket_path}")
+        try:
+            while True:
+                self.reset_peers()
+                self.enqueue(self.folder)
+                time.sleep(self.interval)
+                self.load()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop_server()
+            self.stop_workers()
+
+
+class SchedulerClient:
+    """Send requests to a running Scheduler through its unix socket."""
+
+    def __init__(self, socket_path=None, timeout=5.0):
+        self.socket_path = socket_path or Scheduler.get_socket_path()
+        self.timeout = timeout
+
+    def request(self, op, **args):
+        """
+        Send one request and return its result. Raise OSError if no
+        scheduler is running, RuntimeError if the request failed.
+        """
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            request = {"id": 1, "op": op, "args": args}
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            data = b""
+            while not data.endswith(b"\n"):
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+        response = json.loads(data)
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response["result"]
+
+    def enqueue(self, path, peer=None):
+        return self.request("enqueue", path=path, peer=peer)
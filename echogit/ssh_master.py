@@ -0,0 +1,139 @@
+import atexit
+import os
+import shlex
+import subprocess
+import tempfile
+import threading
+import time
+
+
+class SshMaster:
+    """
+    Persistent multiplexed SSH connection (OpenSSH ControlMaster) to a peer.
+
+    The master is started on first use and every ssh, git and rsync call
+    made for the peer goes through its control socket, so the key exchange
+    is paid once per run instead of once per command.
+    """
+    # Seconds the master outlives its last session, so that it exits on its
+    # own if echogit is killed before stopping it
+    CONTROL_PERSIST = 60
+
+    def __init__(self, name, host, options=None):
+        self.name = name
+        self.host = host
+        # extra ssh options, for example timeouts
+        self.options = options or []
+        self.control_path = os.path.join(
+            self._get_runtime_dir(), f"{name}-{os.getpid()}.sock")
+        self.is_running = False
+        self._started = False
+        self._lock = threading.Lock()
+
+        # Statistics used to report handshake savings
+        self.handshake_time = None
+        self.session_time = None
+        self.sessions = 0
+
+    @staticmethod
+    def _get_runtime_dir():
+        """
+        Get the XDG runtime directory, or fallback to a private temp folder.
+        """
+        runtime_dir = os.getenv("XDG_RUNTIME_DIR")
+        if runtime_dir:
+            runtime_dir = os.path.join(runtime_dir, "echogit")
+        else:
+            runtime_dir = os.path.join(
+                tempfile.gettempdir(), f"echogit-{os.getuid()}")
+        os.makedirs(runtime_dir, mode=0o700, exist_ok=True)
+        return runtime_dir
+
+    def _control_options(self):
+        return ["-o", f"ControlPath={self.control_path}"]
+
+    def _session_command(self):
+        return ["ssh", "-o", "ControlMaster=no"] + \
+            self._control_options() + self.options
+
+    def start(self):
+        """
+        Start the master connection. Return True if it is running.
+        """
+        with self._lock:
+            if self._started:
+                return self.is_running
+            self._started = True
+
+            persist = f"ControlPersist={SshMaster.CONTROL_PERSIST}"
+            command = ["ssh", "-M", "-N", "-f",
+                       "-o", "ControlMaster=yes", "-o", persist] + \
+                self._control_options() + self.options + [self.host]
+            start = time.monotonic()
+            try:
+                # The master forks in background: don't keep pipes on it
+                result = subprocess.run(command, stdin=subprocess.DEVNULL,
+                                        stdout=subprocess.DEVNULL,
+                                        stderr=subprocess.DEVNULL)
+            except OSError:
+                return False
+            self.handshake_time = time.monotonic() - start
+            self.is_running = result.returncode == 0
+            if self.is_running:
+                atexit.register(self.stop)
+            return self.is_running
+
+    def stop(self):
+        """Tear down the master connection and its control socket."""
+        with self._lock:
+            if not self.is_running:
+                return
+            self.is_running = False
+            subprocess.run(["ssh", "-O", "exit"] + self._control_options() +
+                           [self.host], stdin=subprocess.DEVNULL,
+                           stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL)
+            if os.path.exists(self.control_path):
+                os.remove(self.control_path)
+
+    def ssh_command(self):
+        """
+        Return the ssh command (as a list) to use for a new session.
+        Fallback to a plain ssh command if the master can't be started.
+        """
+        if not self.start():
+            return ["ssh"] + self.options
+        # Called by the threads syncing projects concurrently
+        with self._lock:
+            self.sessions += 1
+        return self._session_command()
+
+    def ssh_command_string(self):
+        """Same as ssh_command but as a shell string for git and rsync."""
+        return shlex.join(self.ssh_command())
+
+    def measure(self):
+        """
+        Measure the cost of a multiplexed session by running a no-op on
+        the master. The full handshake cost is measured by start().
+        """
+        if not self.start():
+            return None
+        start = time.monotonic()
+        subprocess.run(self._session_command() + [self.host, "true"],
+                       stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+        self.session_time = time.monotonic() - start
+        return self.session_time
+
+    def get_stats_str(self):
+        if not self.is_running:
+            return "ssh: no multiplexing"
+        stats = f"ssh: handshake {self.handshake_time:.3f}s"
+        if self.session_time is not None:
+            saved = (self.handshake_time - self.session_time) * self.sessions
+            stats += f", multiplexed session {self.session_time:.3f}s"
+            stats += f", {self.sessions} sessions, saved ~{saved:.1f}s"
+        else:
+            stats += f", {self.sessions} sessions"
+        return stats
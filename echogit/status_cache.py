@@ -1,53 +1,68 @@
-import os
-import configparser
 from datetime import datetime
+from echogit.status_store import StatusStore
 
 
 class StatusCache:
-    def __init__(self, project_path):
-        self.cache_path = os.path.join(
-            project_path, ".echogit/status_cache.ini")
+    """
+    Status of the last sync of one branch with one peer, kept in the
+    StatusStore database.
+    """
+    STATE_SYNCED = "synced"
+    # Nothing to do: local and peer branches were already identical
+    STATE_UP_TO_DATE = "up-to-date"
+
+    def __init__(self, project_path, peer_name, branch):
+        self.project_path = project_path
+        self.peer_name = peer_name
+        self.branch = branch
         self.errors = {}
         self.stderr = {}
         self.stdout = {}
         self.peer_down = False
         self.cache_date = None
+        self.state = StatusCache.STATE_SYNCED
 
-    def cache_status(self, errors, stderr, stdout, peer_down):
-        """Store the status information in the cache file."""
+    def cache_status(self, errors, stderr, stdout, peer_down,
+                     state=STATE_SYNCED):
+        """Store the status information in the status database."""
 
         self.cache_date = datetime.now().isoformat()
+        self.state = state
         self.peer_down = peer_down
         self.stdout = stdout
         self.stderr = stderr
         self.errors = errors
 
-        config = configparser.ConfigParser()
-        config['Errors'] = errors
-        config['Stderr'] = stderr
-        config['Stdout'] = stdout
-        config['Meta'] = {
-            'peer_down': str(peer_down),
-            'cache_date': self.cache_date
-        }
-
-        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
-        with open(self.cache_path, 'w') as cache_file:
-            config.write(cache_file)
+        StatusStore.get_instance().put(
+            self.project_path, self.peer_name, self.branch, {
+                "errors": dict(errors),
+                "stderr": dict(stderr),
+                "stdout": dict(stdout),
+                "peer_down": peer_down,
+                "cache_date": self.cache_date,
+                "state": state,
+            })
 
     def load_status(self):
-        """Load status from the cache file."""
-        if not os.path.exists(self.cache_path):
+        """
+        Load status from the status database. Status files of older
+        versions are imported the first time.
+        """
+        store = StatusStore.get_instance()
+        status = store.get(self.project_path, self.peer_name, self.branch)
+        if status is None and store.import_status_cache(
+                self.project_path, self.peer_name, [self.branch]):
+            status = store.get(self.project_path, self.peer_name,
+                               self.branch)
+        if status is None:
             return False  # Cache does not exist
 
-        config = configparser.ConfigParser()
-        config.read(self.cache_path)
-
-        self.errors = dict(config['Errors'])
-        self.stderr = dict(config['Stderr'])
-        self.stdout = dict(config['Stdout'])
-        self.peer_down = config['Meta'].getboolean('peer_down', False)
-        self.cache_date = config['Meta'].get('cache_date')
+        self.errors = dict(status["errors"])
+        self.stderr = dict(status["stderr"])
+        self.stdout = dict(status["stdout"])
+        self.peer_down = status["peer_down"]
+        self.cache_date = status["cache_date"]
+        self.state = status["state"]
 
         if self.peer_down:
             return False
@@ -0,0 +1,200 @@
+import configparser
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+
+class StatusStore:
+    """
+    Status of the last sync of every branch, in one SQLite database under
+    $XDG_STATE_HOME/echogit.
+
+    Statuses are keyed by project path, peer and branch. All of them are
+    read with a single query the first time one is needed, so building a
+    tree of nodes doesn't cost one file read per project. They are read
+    again once another echogit process changed the database, so that long
+    running processes see its syncs. The threads of a process share one
+    connection under a lock: the data version of a connection only
+    changes with the commits of other connections, so it tells the
+    changes of other processes from those of the parallel syncs of this
+    one. The database is in WAL mode, so several echogit processes can
+    write at the same time.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS status (
+            project TEXT NOT NULL,
+            peer TEXT NOT NULL,
+            branch TEXT NOT NULL,
+            errors TEXT NOT NULL,
+            stderr TEXT NOT NULL,
+            stdout TEXT NOT NULL,
+            peer_down INTEGER NOT NULL,
+            cache_date TEXT,
+            state TEXT,
+            PRIMARY KEY (project, peer, branch)
+        )
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(self.get_state_dir(), "status.db")
+        self._lock = threading.Lock()
+        # (project, peer, branch) => status, loaded on first use and when
+        # the database changed, at data version _data_version
+        self._statuses = None
+        self._data_version = None
+        # project => status read from its legacy status_cache.ini
+        self._status_caches = {}
+        self._conn = sqlite3.connect(self.path, timeout=30,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(StatusStore.SCHEMA)
+
+    @classmethod
+    def get_instance(cls):
+        """Return the store shared by the whole process."""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    @staticmethod
+    def get_state_dir():
+        xdg_state_home = os.getenv(
+            "XDG_STATE_HOME", os.path.expanduser("~/.local/state"))
+        state_dir = os.path.join(xdg_state_home, "echogit")
+        os.makedirs(state_dir, exist_ok=True)
+        return state_dir
+
+    @staticmethod
+    def _get_project_key(project_path):
+        return os.path.abspath(os.path.expanduser(project_path))
+
+    def _load(self):
+        """Load all statuses with a single query, with the lock held."""
+        statuses = {}
+        rows = self._conn.execute(
+            "SELECT project, peer, branch, errors, stderr, stdout, "
+            "peer_down, cache_date, state FROM status")
+        for project, peer, branch, errors, stderr, stdout, peer_down, \
+                cache_date, state in rows:
+            statuses[(project, peer, branch)] = {
+                "errors": json.loads(errors),
+                "stderr": json.loads(stderr),
+                "stdout": json.loads(stdout),
+                "peer_down": bool(peer_down),
+                "cache_date": cache_date,
+                "state": state,
+            }
+        return statuses
+
+    def _get_statuses(self):
+        with self._lock:
+            version = self._conn.execute(
+                "PRAGMA data_version").fetchone()[0]
+            if self._statuses is None or version != self._data_version:
+                self._data_version = version
+                self._statuses = self._load()
+            return self._statuses
+
+    def get(self, project_path, peer, branch):
+        """Return the status of a branch, or None if it was never synced."""
+        key = (self._get_project_key(project_path), peer, branch)
+        return self._get_statuses().get(key)
+
+    def get_all(self, path=None):
+        """
+        Return {(project, peer, branch): status} for all the projects below
+        path, or all projects.
+        """
+        statuses = self._get_statuses()
+        if path is None:
+            return dict(statuses)
+        root = self._get_project_key(path)
+        prefix = os.path.join(root, "")
+        return {key: status for key, status in statuses.items()
+                if key[0] == root or key[0].startswith(prefix)}
+
+    def get_last_success(self, project_path, peer=None):
+        """
+        Return the time (seconds since epoch) of the last sync without
+        error of all the branches of a project, with peer or with all its
+        peers, or None if some were never synced or failed.
+        """
+        dates = []
+        for (_project, status_peer, _branch), status in \
+                self.get_all(project_path).items():
+            if peer is not None and status_peer != peer:
+                continue
+            if any(status["errors"].values()) or not status["cache_date"]:
+                return None
+            dates.append(datetime.fromisoformat(
+                status["cache_date"]).timestamp())
+        return min(dates) if dates else None
+
+    def put(self, project_path, peer, branch, status):
+        """Store the status of a branch in its own transaction."""
+        key = (self._get_project_key(project_path), peer, branch)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO status VALUES "
+                "(?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                key + (json.dumps(status["errors"]),
+                       json.dumps(status["stderr"]),
+                       json.dumps(status["stdout"]),
+                       int(status["peer_down"]), status["cache_date"],
+                       status["state"]))
+            # Statuses changed by others are read at the next check
+            if self._statuses is not None:
+                self._statuses[key] = status
+
+    def _read_status_cache(self, project_path):
+        """
+        Read the .echogit/status_cache.ini file written by older versions,
+        once per project. Return None if there is none.
+        """
+        project = self._get_project_key(project_path)
+        with self._lock:
+            if project in self._status_caches:
+                return self._status_caches[project]
+
+        status = None
+        cache_path = os.path.join(project, ".echogit/status_cache.ini")
+        config = configparser.ConfigParser()
+        try:
+            if config.read(cache_path):
+                meta = config["Meta"]
+                status = {
+                    "errors": {key: int(value)
+                               for key, value in config["Errors"].items()},
+                    "stderr": dict(config["Stderr"]),
+                    "stdout": dict(config["Stdout"]),
+                    "peer_down": meta.getboolean("peer_down", False),
+                    "cache_date": meta.get("cache_date"),
+                    "state": meta.get("state", "synced"),
+                }
+        except (configparser.Error, KeyError, ValueError):
+            pass
+
+        with self._lock:
+            self._status_caches[project] = status
+        return status
+
+    def import_status_cache(self, project_path, peer, branches):
+        """
+        Import the status_cache.ini file of a project, which was shared by
+        all its branches, as the status of the given branches.
+        Return False if there is no such file.
+        """
+        status = self._read_status_cache(project_path)
+        if status is None:
+            return False
+        for branch in branches:
+            self.put(project_path, peer, branch, dict(status))
+        return True
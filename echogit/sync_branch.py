@@ -5,12 +5,13 @@ from echogit.node import Node
 from echogit.config import Config
 from echogit.peer import Peer
 from echogit.status_cache import StatusCache
+from echogit.git_refs import GitRefs
 
 
 class SyncBranch(Node):
     def __init__(self, branch_name, *, path, peer, config=None, parent=None):
         super().__init__(branch_name, path=path, config=config, parent=parent)
-        self.cache = StatusCache(path)
+        self.cache = StatusCache(path, peer.name, branch_name)
         if self.cache.load_status():
             self.stderr = self.cache.stderr
             self.stdout = self.cache.stdout
@@ -31,6 +32,11 @@ class SyncBranch(Node):
     def scan(self):
         pass
 
+    def start_progress(self):
+        self.sync_done = 0
+        self.sync_total = 1
+        return 1
+
     def _save_result_logs(self, key, result, verbose):
         self.errors[key] = result.returncode
         self.stderr[key] = result.stderr
@@ -48,9 +54,9 @@ class SyncBranch(Node):
 
         # Get existing remotes
         result = subprocess.run(["git", "remote", "get-url", self.peer.name],
-                                cwd=self.path, stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE)
-        remote_url = result.stdout.decode("utf-8").strip()
+                                cwd=self.path, text=True,
+                                capture_output=True)
+        remote_url = result.stdout.strip()
 
         if result.returncode == 0:  # Remote exists
             if remote_url == git_path:
@@ -61,29 +67,30 @@ class SyncBranch(Node):
                     print(f"Remote {self.peer.name} => {git_path}")
                 result = subprocess.run(["git", "remote", "set-url",
                                          self.peer.name, git_path],
-                                        cwd=self.path)
+                                        cwd=self.path, text=True,
+                                        capture_output=True)
         else:
             if verbose:
                 print(f"Adding remote {self.peer.name} = {git_path}")
             result = subprocess.run(["git", "remote", "add", self.peer.name,
-                                     git_path], cwd=self.path)
+                                     git_path], cwd=self.path, text=True,
+                                    capture_output=True)
 
         self._save_result_logs("remote_add", result, verbose)
 
     def _push(self, verbose):
         branch = self.name
         result = subprocess.run(["git", "push", self.peer.name, branch],
-                                cwd=self.path, text=True, capture_output=True)
+                                cwd=self.path, text=True, capture_output=True,
+                                env=self.peer.get_git_env())
         self._save_result_logs("push", result, verbose)
 
-    def _pull(self, verbose):
-        branch = self.name
-        result = subprocess.run(["git", "pull", self.peer.name, branch],
-                                cwd=self.path, text=True, capture_output=True)
-        self._save_result_logs("pull", result, verbose)
-
     def _fetch(self):
-        subprocess.run(["git", "fetch", self.peer.name], cwd=self.path)
+        # Output is captured so that concurrent syncs don't interleave
+        return subprocess.run(["git", "fetch", self.peer.name,
+                               self.get_refspec()], cwd=self.path,
+                              text=True, capture_output=True,
+                              env=self.peer.get_git_env())
 
     def _status(self, verbose=False):
         result = subprocess.run(["git", "status", "--porcelain"],
@@ -108,6 +115,17 @@ class SyncBranch(Node):
                 return True
         return False
 
+    def get_status_record(self):
+        """Return the cached status of the last sync of the branch."""
+        return {
+            "peer": self.peer.name,
+            "branch": self.name,
+            "errors": dict(self.errors),
+            "state": self.cache.state,
+            "cache_date": self.cache.cache_date,
+            "peer_down": self.cache.peer_down,
+        }
+
     def nb_children(self):
         return len(self.children)
 
@@ -136,21 +154,171 @@ class SyncBranch(Node):
         current_branch = self._branch()
         if current_branch == branch:
             return current_branch
-        subprocess.run(["git", "checkout", branch], cwd=self.path)
+        subprocess.run(["git", "checkout", branch], cwd=self.path,
+                       text=True, capture_output=True)
         return current_branch
 
 
-    def sync(self, verbose=False):
+    def is_up_to_date(self, local_heads, remote_heads):
+        """
+        Return True if the branch points to the same commit locally and on
+        the peer, in which case there is nothing to sync. remote_heads is
+        None if the heads of the peer are unknown.
+        """
+        if remote_heads is None:
+            return False
+        local_head = local_heads.get(self.name)
+        return local_head is not None and \
+            local_head == remote_heads.get(self.name)
+
+    def skip_sync(self, verbose=False):
+        """Record the branch as up to date without running any git command."""
+        if verbose:
+            print(f"{self.name}: up-to-date with {self.peer.name}")
+        for key in self.errors:
+            self.errors[key] = 0
+            self.stderr[key] = ""
+            self.stdout[key] = ""
+        self.cache.cache_status(self.errors, self.stderr, self.stdout,
+                                self.peer.is_down,
+                                StatusCache.STATE_UP_TO_DATE)
+        self.report_progress()
+        return 1, 1
+
+    def get_plan_record(self, local_heads, remote_heads,
+                        current_branch=None, clean=True):
+        """
+        Return what a sync of the branch would do, from the local heads and
+        the heads of the peer, without changing anything. The state is one
+        of ahead, behind, diverged, dirty (checked out with local changes)
+        or up-to-date.
+        """
+        local = local_heads.get(self.name)
+        remote = remote_heads.get(self.name)
+        ahead = behind = None
+        if local is None and remote is None:
+            state = "missing"
+        elif local is None:
+            state = "behind"
+        elif remote is None:
+            state = "ahead"
+        elif local == remote:
+            state = "up-to-date"
+        else:
+            counts = GitRefs.count_ahead_behind(self.path, local, remote)
+            if counts is None:
+                # The peer has commits never fetched: it is behind only if
+                # there was no local commit since the last fetch
+                fetched = GitRefs.resolve(self.path, self._get_remote_ref())
+                behind_only = fetched is not None and \
+                    GitRefs.is_ancestor(self.path, local, fetched)
+                state = "behind" if behind_only else "diverged"
+            else:
+                ahead, behind = counts
+                state = "diverged" if ahead and behind else \
+                    "ahead" if ahead else "behind"
+        if not clean and self.name == current_branch:
+            state = "dirty"
+        return {
+            "peer": self.peer.name,
+            "branch": self.name,
+            "sync_type": "git",
+            "state": state,
+            "ahead": ahead,
+            "behind": behind,
+            "bytes": None,
+        }
+
+    def _get_remote_ref(self):
+        return f"refs/remotes/{self.peer.name}/{self.name}"
+
+    def get_refspec(self):
+        """Return the refspec fetching only this branch from the peer."""
+        return f"+refs/heads/{self.name}:{self._get_remote_ref()}"
+
+    def _save_logs(self, key, returncode, stdout, stderr, verbose):
+        result = subprocess.CompletedProcess([], returncode, stdout, stderr)
+        self._save_result_logs(key, result, verbose)
+
+    def copy_logs(self, key, other):
+        """Record the result of a command run once for several branches."""
+        self.errors[key] = other.errors[key]
+        self.stderr[key] = other.stderr[key]
+        self.stdout[key] = other.stdout[key]
+
+    def fast_forward(self, verbose=False):
+        """
+        Update a branch which is not checked out to the fetched peer branch,
+        without touching the work tree. Diverged branches are reported as
+        pull conflicts.
+        Return True if the branch has local commits to push.
+        """
+        local = GitRefs.resolve(self.path, f"refs/heads/{self.name}")
+        remote = GitRefs.resolve(self.path, self._get_remote_ref())
+
+        if remote is None:
+            # Branch not on the peer yet
+            self._save_logs("pull", 0, "", "", verbose)
+            return local is not None
+
+        if local == remote:
+            self._save_logs("pull", 0, "Already up to date.", "", verbose)
+            return False
+
+        if local is None or GitRefs.is_ancestor(self.path, local, remote):
+            command = ["git", "update-ref", "-m", "echogit: fast-forward",
+                       f"refs/heads/{self.name}", remote]
+            if local is not None:
+                command.append(local)
+            result = subprocess.run(command, cwd=self.path, text=True,
+                                    capture_output=True)
+            self._save_result_logs("pull", result, verbose)
+            return False
+
+        if GitRefs.is_ancestor(self.path, remote, local):
+            self._save_logs("pull", 0, "Already up to date.", "", verbose)
+            return True
+
+        self._save_logs("pull", 1, "",
+                        f"non-fast-forward: {self.name} diverged from "
+                        f"{self.peer.name}, merge it manually", verbose)
+        return False
+
+    def merge(self, verbose=False):
+        """
+        Merge the fetched peer branch into the checked out branch.
+        """
+        if GitRefs.resolve(self.path, self._get_remote_ref()) is None:
+            self._save_logs("pull", 0, "", "", verbose)
+            return
+        result = subprocess.run(["git", "merge", self._get_remote_ref()],
+                                cwd=self.path, text=True, capture_output=True)
+        self._save_result_logs("pull", result, verbose)
+
+    def save_status(self):
+        self.cache.cache_status(self.errors, self.stderr,
+                                self.stdout, self.peer.is_down)
+        self.report_progress()
+
+    def sync(self, verbose=False, fetch_result=None):
+        """
+        Sync the branch with the peer. fetch_result is the result of a fetch
+        already done for this branch by the parent, with the remote added;
+        without it the branch adds the remote and fetches by itself.
+        """
         current_branch = self._checkout(self.name)
-        self._add_remote(verbose)
-        self._fetch()
+        if fetch_result is None:
+            self._add_remote(verbose)
+            fetch_result = self._fetch()
         if self.node_config.auto_commit and self._status() != 0:
             self._commit()
         self._push(verbose)
-        self._pull(verbose)
+        if fetch_result.returncode == 0:
+            self.merge(verbose)
+        else:
+            self._save_result_logs("pull", fetch_result, verbose)
         self._status(verbose)
-        self.cache.cache_status(self.errors, self.stderr,
-                                self.stdout, self.peer.is_down)
+        self.save_status()
 
         # restore branch
         self._checkout(current_branch)
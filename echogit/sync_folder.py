@@ -1,18 +1,22 @@
 import subprocess
 import argparse
 import os
+from concurrent.futures import ThreadPoolExecutor
 from echogit.git_project import GitProject
 from echogit.rsync_project import RsyncProject
 from echogit.bare_git_repo import BareGitRepo
 from echogit.bare_rsync_repo import BareRsyncRepo
 from echogit.node import Node
 from echogit.config import Config
+from echogit.sync_pool import SyncPool
+from echogit.scan_index import ScanIndex
 
 
 class SyncFolder(Node):
     def __init__(self, path, *, config=None, parent=None):
         _path = self._get_folder_name(path)
         super().__init__(_path, path=path, parent=parent, config=config)
+        self.scanned = False
 
     def get_type(self):
         return Node.NodeType.SYNC_FOLDER
@@ -20,14 +24,46 @@ class SyncFolder(Node):
     def is_folder(self):
         return True
 
-    def scan(self):
+    def scan(self, jobs=None):
+        jobs = jobs or self.config.scan_jobs
+        index = ScanIndex()
+        index.load()
+        if jobs > 1:
+            # Peers are shared by all projects: load them before any thread
+            self.config.get_peers()
+            self._scan_parallel(index, jobs)
+        else:
+            self._scan(index)
+        index.save(self.path)
+
+    def scan_shallow(self, index=None):
+        """
+        Scan the direct children of the folder only. Sub-folders are not
+        scanned, and are kept even if they turn out to have no project.
+        """
+        save = index is None
+        if save:
+            index = ScanIndex()
+            index.load()
+        children = self._get_children(index)
+        for child in children:
+            if not child.is_folder():
+                child.scan()
+        # Swapped in at once: a user interface reads the children while
+        # they are scanned on another thread
+        self.children = children
+        self.invalidate_errors()
+        self.scanned = True
+        if save:
+            index.save()
+
+    def _get_children(self, index):
+        """Create the child nodes of the folder, without scanning them."""
         conf = self.config
-        for item in os.listdir(self.path):
-            child = None
+        children = []
+        for item, node_type in index.get_entries(self.path):
             full_path = os.path.join(self.path, item)
 
-            node_type = Node.get_type_from_folder(full_path)
-
             if node_type == Node.NodeType.GIT_PROJECT:
                 child = GitProject(full_path, config=conf, parent=self)
             elif node_type == Node.NodeType.RSYNC_PROJECT:
@@ -40,16 +76,95 @@ class SyncFolder(Node):
                 child = SyncFolder(full_path, config=conf, parent=self)
             else:
                 continue
+            children.append(child)
+        return children
 
-            if child:
+    def _add_children(self, children):
+        """Add scanned children, dropping folders without any project."""
+        for child in children:
+            if child.is_folder() and not child.children:
+                continue
+            self.add_child(child)
+
+    def _scan(self, index):
+        children = self._get_children(index)
+        for child in children:
+            if child.is_folder():
+                child._scan(index)
+            else:
                 child.scan()
-                if child.is_folder() and not child.children:
-                    continue
-                self.add_child(child)
+        self._add_children(children)
+        self.scanned = True
+
+    def _scan_parallel(self, index, jobs):
+        """
+        Scan sibling subtrees concurrently. The first levels of the tree are
+        expanded until there are enough folders to keep the workers busy,
+        then each of these folders is scanned by one worker. Children are
+        added in the same order as a serial scan, so the tree is identical.
+        """
+        expanded = []
+        others = []
+        frontier = [self]
+        while frontier and len(frontier) < jobs:
+            next_frontier = []
+            for folder in frontier:
+                children = folder._get_children(index)
+                expanded.append((folder, children))
+                for child in children:
+                    if child.is_folder():
+                        next_frontier.append(child)
+                    else:
+                        others.append(child)
+            frontier = next_frontier
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(folder._scan, index)
+                       for folder in frontier]
+            futures += [executor.submit(child.scan) for child in others]
+            for future in futures:
+                future.result()
+
+        # Deepest folders first, so that empty folders are known
+        for folder, children in reversed(expanded):
+            folder._add_children(children)
+            folder.scanned = True
+
+    def get_errors(self):
+        """
+        Return the errors of the subtree. They are cached, since the user
+        interface reads them for every row it draws, until a node below
+        reports progress or the folder is scanned again.
+        """
+        with Node._errors_lock:
+            errors, version = self._errors, self._errors_version
+        if errors is None:
+            errors = super().get_errors()
+            with Node._errors_lock:
+                # Not if a sync reported progress meanwhile
+                if self._errors_version == version:
+                    self._errors = errors
+        return errors
+
+    def has_error(self):
+        return bool(self.get_errors())
+
+    def get_projects(self):
+        """Return all GitProject/RsyncProject nodes of this folder tree."""
+        projects = []
+        for child in self.children:
+            if child.is_folder():
+                projects.extend(child.get_projects())
+            elif child.get_type() in (Node.NodeType.GIT_PROJECT,
+                                      Node.NodeType.RSYNC_PROJECT):
+                projects.append(child)
+        return projects
+
+    def sync(self, verbose=False, jobs=1):
+        if jobs > 1:
+            return SyncPool(jobs, verbose=verbose).sync(self.get_projects())
 
-    def sync(self, verbose=False):
         success, total = 0, 0
-        # for child_success, child_total in (child.sync(verbose=verbose) for child in self.children):
         for child in self.children:
             child_success, child_total = child.sync(
                 verbose=verbose)
@@ -126,6 +241,12 @@ class SyncFolder(Node):
             tree.update(child_tree)
         return tree
 
+    def get_project_records(self):
+        records = []
+        for child in self.children:
+            records.extend(child.get_project_records())
+        return records
+
 
 if __name__ == "__main__":
     # Setup argument parser
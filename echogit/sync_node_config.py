@@ -1,5 +1,5 @@
 import os
-import configparser
+import threading
 from echogit.base_config import BaseConfig
 from echogit.config import Config
 
@@ -9,12 +9,19 @@ class SyncNodeConfig(BaseConfig):
     SYNC_TYPE_RSYNC = 'rsync'
     SYNC_TYPE_UNKNOWN = None
 
+    # Process-wide cache of parsed configs: config file => (mtime, config)
+    _cache = {}
+    _cache_lock = threading.Lock()
+
     def __init__(self, project_path, config_file=None, config_string=None):
         super().__init__(config_file, config_string)
         self.project_path = project_path
         self.sync_type = self.config.get(
             "ECHOGIT", "sync_type", fallback=SyncNodeConfig.SYNC_TYPE_GIT)
         self.auto_commit = self.config.getboolean("DEFAULT", "auto_commit", fallback=False)
+        # sync branches which are not checked out without touching the work tree
+        self.checkout_free = self.config.getboolean(
+            "ECHOGIT", "checkout_free", fallback=False)
         self.sync_branches = self.get_list(
             "BRANCHES", "sync_branches", fallback=[])
         self.sync_remotes = self.get_list(
@@ -22,13 +29,35 @@ class SyncNodeConfig(BaseConfig):
         self.upstream = self.config.get(
             "BRANCHES", "upstream", fallback="upstream")
 
+    @classmethod
+    def from_file(cls, project_path, config_file):
+        """
+        Return the config of config_file, or None if there is none.
+        Each file is parsed once per process, and again only if its mtime
+        changed.
+        """
+        try:
+            mtime = os.stat(config_file).st_mtime_ns
+        except OSError:
+            return None
+
+        with cls._cache_lock:
+            cached = cls._cache.get(config_file)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+
+        config = cls(project_path, config_file)
+        with cls._cache_lock:
+            cls._cache[config_file] = (mtime, config)
+        return config
+
     @staticmethod
     def get_sync_type_from_config(config_file):
-        if not os.path.exists(config_file):
+        project_path = os.path.dirname(os.path.dirname(config_file))
+        config = SyncNodeConfig.from_file(project_path, config_file)
+        if config is None:
             return SyncNodeConfig.SYNC_TYPE_UNKNOWN
-        config = configparser.ConfigParser()
-        config.read(config_file)
-        return config.get("ECHOGIT", "sync_type", fallback=SyncNodeConfig.SYNC_TYPE_UNKNOWN)
+        return config.config.get("ECHOGIT", "sync_type", fallback=SyncNodeConfig.SYNC_TYPE_UNKNOWN)
 
     @staticmethod
     def create_default_config(project_path, sync_type=SYNC_TYPE_GIT):
@@ -66,3 +95,4 @@ class SyncNodeConfig(BaseConfig):
 
     def print(self):
         print(f"Auto commit: {self.auto_commit}")
+        print(f"Checkout free: {self.checkout_free}")
@@ -0,0 +1,97 @@
+import json
+import os
+import re
+from echogit.status_store import StatusStore
+
+
+class SyncOrder:
+    """
+    Order projects by the value of syncing them when time is limited
+    ('sync --deadline'), and remember the projects which could not be
+    synced in time, in $XDG_STATE_HOME/echogit/deferred.json.
+
+    Projects come in this order:
+      - deferred by the previous run,
+      - changed locally since their last successful sync,
+      - most recently changed on a peer,
+      - closest peer first, from the latency measured by PeerProbe.
+    """
+    UNITS = {"": 1, "s": 1, "m": 60, "h": 3600}
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(StatusStore.get_state_dir(),
+                                         "deferred.json")
+
+    @staticmethod
+    def parse_duration(text):
+        """Parse '90', '90s', '5m' or '1h' into seconds."""
+        match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smh]?)\s*", text)
+        if match is None:
+            raise ValueError(f"invalid duration: {text}")
+        return float(match.group(1)) * SyncOrder.UNITS[match.group(2)]
+
+    def load_deferred(self):
+        """Return the paths of the projects deferred by the last run."""
+        try:
+            with open(self.path) as f:
+                return set(json.load(f))
+        except (OSError, ValueError):
+            return set()
+
+    def save_deferred(self, deferred_projects, projects):
+        """
+        Save the projects deferred by a run of projects. Projects deferred
+        by a previous run and not part of this one stay deferred.
+        """
+        deferred = self.load_deferred() - {project.path
+                                           for project in projects}
+        deferred |= {project.path for project in deferred_projects}
+        with open(self.path, "w") as f:
+            json.dump(sorted(deferred), f)
+
+    @staticmethod
+    def _is_dirty(project):
+        """True if the project changed since its last successful sync."""
+        last_success = StatusStore.get_instance().get_last_success(
+            project.path)
+        if last_success is None:
+            return True
+        try:
+            return project.get_mtime() > last_success
+        except OSError:
+            return True
+
+    @staticmethod
+    def _get_peers(project):
+        return [child.peer for child in project.children
+                if not child.peer.is_down]
+
+    @staticmethod
+    def _get_remote_mtime(project):
+        mtimes = []
+        for peer in SyncOrder._get_peers(project):
+            try:
+                mtime = peer.get_remote_mtime(project.path)
+            except ValueError:
+                mtime = None
+            if mtime is not None:
+                mtimes.append(mtime)
+        return max(mtimes, default=0)
+
+    @staticmethod
+    def _get_latency(project):
+        latencies = [peer.latency for peer in SyncOrder._get_peers(project)
+                     if peer.latency is not None]
+        return min(latencies, default=float("inf"))
+
+    def sort(self, projects):
+        """Return projects sorted by decreasing value of their sync."""
+        deferred = self.load_deferred()
+
+        def key(project):
+            return (project.path not in deferred,
+                    not self._is_dirty(project),
+                    -self._get_remote_mtime(project),
+                    self._get_latency(project))
+
+        return sorted(projects, key=key)
@@ -0,0 +1,199 @@
+import contextlib
+import io
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class _ThreadOutput:
+    """
+    Stream proxy that redirects writes of worker threads into a per-thread
+    buffer. Writes from other threads go straight to the wrapped stream.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+
+    def begin(self):
+        self._local.buffer = io.StringIO()
+
+    def end(self):
+        buffer = self._local.buffer
+        self._local.buffer = None
+        return buffer.getvalue()
+
+    def write(self, text):
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            return self._stream.write(text)
+        return buffer.write(text)
+
+    def flush(self):
+        if getattr(self._local, "buffer", None) is None:
+            self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class SyncPool:
+    """
+    Sync independent projects on a pool of worker threads.
+
+    Each project subtree (all its peers and branches) is synced by a single
+    worker, so a git work tree is never touched by two threads at once.
+    Output of a project is buffered and printed as one block when the
+    project is done, to keep the console readable. Projects whose peers
+    have no free session (see Peer.max_sessions) are started later, when a
+    project syncing with the same peer is done.
+    """
+
+    def __init__(self, jobs, verbose=False):
+        self.jobs = max(1, jobs)
+        self.verbose = verbose
+        # Projects not started because of the deadline
+        self.deferred = []
+        self._durations = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _thread_streams():
+        """
+        Replace sys.stdout and sys.stderr with _ThreadOutput proxies while
+        the block runs, and yield the proxies.
+        """
+        stdout, stderr = sys.stdout, sys.stderr
+        out, err = _ThreadOutput(stdout), _ThreadOutput(stderr)
+        try:
+            sys.stdout, sys.stderr = out, err
+            yield out, err
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+
+    @staticmethod
+    @contextlib.contextmanager
+    def quiet():
+        """
+        Discard the output of the calling thread while the block runs.
+        Other threads, like the main loop of a user interface, keep
+        printing as usual.
+        """
+        with SyncPool._thread_streams() as (out, err):
+            out.begin()
+            err.begin()
+            try:
+                yield
+            finally:
+                out.end()
+                err.end()
+
+    @staticmethod
+    def _get_limited_peers(project):
+        """Return the peers of project which limit their sessions."""
+        return {child.peer for child in project.children
+                if child.peer.max_sessions}
+
+    @staticmethod
+    def _has_free_sessions(project, peer_jobs):
+        """
+        True if each peer of project limiting its sessions has less than
+        max_sessions projects running with it. A project syncs with its
+        peers one at a time, so it holds one session at most.
+        """
+        return all(peer_jobs.get(peer, 0) < peer.max_sessions
+                   for peer in SyncPool._get_limited_peers(project))
+
+    def _has_time(self, deadline):
+        """
+        True if a project can start and, taking as long as the average
+        project so far, be done before deadline (a time.monotonic() value).
+        """
+        with self._lock:
+            durations = list(self._durations)
+        expected = sum(durations) / len(durations) if durations else 0
+        return time.monotonic() + expected <= deadline
+
+    def sync(self, projects, progress=None, deadline=None):
+        """
+        Sync all projects and return (success, total) like Node.sync.
+
+        @param projects: list of GitProject/RsyncProject nodes, started in
+                         this order unless a peer is busy.
+        @param progress: optional callable(project, success, total) called
+                         from the calling thread as each project finishes.
+        @param deadline: optional time.monotonic() value after which no
+                         project is started. Projects which are not started
+                         are listed in self.deferred, and not counted.
+        """
+        success, total = 0, 0
+        self.deferred = []
+        self._durations = []
+        if not projects:
+            return success, total
+
+        stdout, stderr = sys.stdout, sys.stderr
+
+        def run(project):
+            if deadline is not None and not self._has_time(deadline):
+                return None, "", ""
+            start = time.monotonic()
+            out.begin()
+            err.begin()
+            try:
+                result = project.sync(verbose=self.verbose)
+            except Exception as e:
+                print(f"{project.name}: sync failed: {e}", file=sys.stderr)
+                result = (0, 1)
+            finally:
+                # Output of a worker dying on anything else is dropped
+                text, errors = out.end(), err.end()
+            with self._lock:
+                self._durations.append(time.monotonic() - start)
+            return result, text, errors
+
+        pending = list(projects)
+        running = {}
+        peer_jobs = {}
+        with self._thread_streams() as (out, err), \
+                ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            while pending or running:
+                # A project waiting for a busy peer is skipped, so that no
+                # worker blocks on it while other peers are idle
+                while len(running) < self.jobs:
+                    project = next((project for project in pending
+                                    if self._has_free_sessions(project,
+                                                               peer_jobs)),
+                                   None)
+                    if project is None:
+                        break
+                    pending.remove(project)
+                    for peer in self._get_limited_peers(project):
+                        peer_jobs[peer] = peer_jobs.get(peer, 0) + 1
+                    running[executor.submit(run, project)] = project
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    project = running.pop(future)
+                    for peer in self._get_limited_peers(project):
+                        peer_jobs[peer] -= 1
+                    result, text, errors = future.result()
+                    if result is None:
+                        self.deferred.append(project)
+                        continue
+                    child_success, child_total = result
+                    stdout.write(text)
+                    stdout.flush()
+                    stderr.write(errors)
+                    stderr.flush()
+                    success += child_success
+                    total += child_total
+                    if progress:
+                        progress(project, child_success, child_total)
+
+        deferred = set(self.deferred)
+        self.deferred = [project for project in projects
+                         if project in deferred]
+        return success, total
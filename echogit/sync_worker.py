@@ -0,0 +1,154 @@
+import queue
+import threading
+from echogit.manifest import Manifest
+from echogit.peer_probe import PeerProbe
+from echogit.scan_index import ScanIndex
+from echogit.scheduler import SchedulerClient
+from echogit.sync_pool import SyncPool
+
+
+class SyncWorker:
+    """
+    Sync nodes on a background thread, one request at a time, so that a
+    user interface stays responsive.
+
+    Folders of a shallow-scanned tree are fully scanned before being synced.
+    on_change is called, from any thread, whenever a request is queued,
+    started or done, and each time a branch finishes syncing. The output of
+    the syncs is discarded: the result is read from the nodes.
+    """
+
+    def __init__(self, jobs=4, scan_index=None, on_change=None):
+        self.jobs = jobs
+        self.on_change = on_change
+        if scan_index is None:
+            scan_index = ScanIndex()
+            scan_index.load()
+        self.scan_index = scan_index
+        # The scan index and the node tree are shared with the caller
+        self.scan_lock = threading.Lock()
+        self.current = None
+        self.last_error = None
+        # Result of the last request to the scheduler daemon
+        self.notice = None
+        self._queue = queue.Queue()
+        self._pending = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _notify(self, _node=None):
+        if self.on_change:
+            self.on_change()
+
+    def scan_shallow(self, folder):
+        """
+        Scan the direct children of folder if it was not scanned yet, see
+        SyncFolder.scan_shallow.
+        """
+        with self.scan_lock:
+            if not folder.scanned:
+                folder.scan_shallow(self.scan_index)
+
+    def _scan_remaining(self, folder):
+        """
+        Scan the folders not scanned yet below folder. The lock is taken
+        for each folder, so the user can expand folders meanwhile.
+        """
+        self.scan_shallow(folder)
+        for child in folder.children:
+            if child.is_folder():
+                self._scan_remaining(child)
+
+    def save_index(self):
+        with self.scan_lock:
+            self.scan_index.save()
+
+    def sync(self, node):
+        """
+        Queue a sync of node. Return False if it is already queued or
+        running.
+        """
+        with self._lock:
+            if node in self._pending:
+                return False
+            self._pending.append(node)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        self._queue.put(node)
+        self._notify()
+        return True
+
+    def enqueue(self, node):
+        """
+        Queue a sync of node on the scheduler daemon instead of syncing it
+        here. Return False if no scheduler is running.
+        """
+        try:
+            count = SchedulerClient().enqueue(node.path)
+        except (OSError, RuntimeError, ValueError) as e:
+            self.notice = f"Scheduler unavailable: {e}"
+            self._notify()
+            return False
+        self.notice = f"{count} jobs queued on the scheduler for {node.name}"
+        self._notify()
+        return True
+
+    def is_pending(self, node):
+        with self._lock:
+            return node in self._pending
+
+    def get_status_str(self):
+        with self._lock:
+            current = self.current
+            queued = len(self._pending) - (current is not None)
+        if current is None:
+            if self.last_error is not None:
+                return f"Idle, last sync failed: {self.last_error}"
+            return "Idle" if self.notice is None else f"Idle. {self.notice}"
+        status = f"Syncing {current.name}: " \
+            f"{current.sync_done}/{current.sync_total} branches"
+        if queued:
+            status += f", {queued} queued"
+        return status
+
+    def _run(self):
+        while True:
+            node = self._queue.get()
+            with self._lock:
+                self.current = node
+            try:
+                self._sync(node)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+            finally:
+                node.progress_listener = None
+                with self._lock:
+                    self._pending.remove(node)
+                    self.current = None
+                self._notify()
+
+    def _sync(self, node):
+        # Only the output of this thread is discarded, not the one of the
+        # user interface
+        with SyncPool.quiet():
+            # Peers may have changed since the last sync: forget their
+            # listings and whether they were down
+            config = node.config
+            peers = config.get_peers().values()
+            for peer in peers:
+                peer.reset()
+            PeerProbe(config.probe_timeout).probe_all(peers)
+
+            if node.is_folder():
+                self._scan_remaining(node)
+                projects = node.get_projects()
+            else:
+                projects = [node]
+
+            node.start_progress()
+            node.progress_listener = self._notify
+            self._notify()
+            SyncPool(self.jobs).sync(projects)
+            Manifest(node.config).update_projects(projects)
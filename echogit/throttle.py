@@ -0,0 +1,87 @@
+"""
+Run a command with its standard input and output throttled.
+
+    python throttle.py RATE command [args...]
+
+RATE is in KiB per second, for each direction, like rsync --bwlimit. It is
+used as GIT_SSH_COMMAND to cap the bandwidth git uses over ssh: git talks
+to this process, which relays the data to and from ssh. Standard error is
+not throttled. This file only depends on the standard library, so it can
+run on its own.
+"""
+import os
+import subprocess
+import sys
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Allow rate bytes per second on average, with bursts of up to one
+    second of data.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, size):
+        """Wait until size bytes can be sent."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= size
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+def relay(source, destination, bucket, chunk_size):
+    """Copy source to destination (file descriptors) through bucket."""
+    try:
+        while True:
+            data = os.read(source, chunk_size)
+            if not data:
+                break
+            bucket.consume(len(data))
+            while data:
+                written = os.write(destination, data)
+                data = data[written:]
+    except OSError:
+        pass
+    finally:
+        os.close(destination)
+
+
+def main(argv):
+    if len(argv) < 3:
+        print(__doc__.strip(), file=sys.stderr)
+        return 2
+    rate = float(argv[1]) * 1024
+    chunk_size = int(max(1024, min(64 * 1024, rate / 10)))
+    input_read, input_write = os.pipe()
+    output_read, output_write = os.pipe()
+    process = subprocess.Popen(argv[2:], stdin=input_read,
+                               stdout=output_write)
+    os.close(input_read)
+    os.close(output_write)
+
+    # The input relay may block on a read forever once the command is done
+    threading.Thread(target=relay, daemon=True, args=(
+        sys.stdin.fileno(), input_write, TokenBucket(rate),
+        chunk_size)).start()
+    output = threading.Thread(target=relay, args=(
+        output_read, sys.stdout.fileno(), TokenBucket(rate), chunk_size))
+    output.start()
+    returncode = process.wait()
+    output.join()
+    return returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
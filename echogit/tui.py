@@ -1,6 +1,9 @@
+import os
 import urwid
 from echogit.config import Config
 from echogit.sync_folder import SyncFolder
+from echogit.sync_worker import SyncWorker
+from echogit.tui_tree import TreeWalker
 
 
 class ProjectWidget(urwid.WidgetWrap):
@@ -8,32 +11,23 @@ class ProjectWidget(urwid.WidgetWrap):
     FOLDER_CLOSED_ICON = "📁"
     FOLDER_OPEN_ICON = "📂"
 
-    def __init__(self, node, list_walker, depth=0, collapse_folder=False):
+    def __init__(self, node, tree_walker, depth=0, worker=None):
+        self.node = node
         self.project_name = node.name
         self.is_folder = node.is_folder()
-        self.collapse_folder = collapse_folder
-        self.list_walker = list_walker
-        self.children_widgets = []
-
-        # Get the status details and truncate if necessary
-        self.status_details = node.get_project_state_str()
-
+        self.tree_walker = tree_walker
+        self.worker = worker
         self.depth = depth
-        self.logs = node.get_logs()
-
-        # Set folder or file icon
-        if self.collapse_folder:
-            folder_icon = self.FOLDER_CLOSED_ICON
-        else:
-            folder_icon = self.FOLDER_OPEN_ICON
+        self.generation = tree_walker.generation
 
-        self.icon = folder_icon if self.is_folder else self.FILE_ICON
+        self.status_details = self._get_status_details()
         self.header = urwid.Text(self._get_header_text())
 
         # Create the status text widget and truncate if necessary
         self.status = urwid.Text(self.status_details, wrap='clip')
         status_attr = 'error' if node.has_error() else 'normal'
         status_widget = urwid.AttrMap(self.status, status_attr)
+        self.status_widget = status_widget
 
         # Build the content layout
         content = urwid.Columns([
@@ -52,56 +46,57 @@ class ProjectWidget(urwid.WidgetWrap):
             return name[:max_length - 3] + "..."
         return name
 
+    def _get_status_details(self):
+        """Return the status of the node, with its progress while syncing."""
+        node = self.node
+        if self.is_folder and not node.scanned:
+            details = ""
+        else:
+            details = node.get_project_state_str()
+        if node.sync_done < node.sync_total:
+            details = f"[{node.sync_done}/{node.sync_total}] {details}"
+        elif self.worker and self.worker.is_pending(node):
+            details = f"[queued] {details}"
+        return details
+
+    def refresh_status(self):
+        """Update the status from the node, which may be syncing."""
+        self.generation = self.tree_walker.generation
+        self.status_details = self._get_status_details()
+        status_attr = 'error' if self.node.has_error() else 'normal'
+        self.status_widget.set_attr_map({None: status_attr})
+        self.update_display()
+
+    def render(self, size, focus=False):
+        # Rows are only refreshed when they are drawn
+        if self.generation != self.tree_walker.generation:
+            self.refresh_status()
+        return super().render(size, focus)
+
     def _get_header_text(self):
+        if not self.is_folder:
+            icon = self.FILE_ICON
+        elif self.tree_walker.is_expanded(self.node):
+            icon = self.FOLDER_OPEN_ICON
+        else:
+            icon = self.FOLDER_CLOSED_ICON
         project = self._truncate_project_name(self.project_name, 10)
         prefix = "  " * (self.depth - 1) + "|-" if self.depth > 0 else ""
-        return f"{prefix}{self.icon} {project}"
+        return f"{prefix}{icon} {project}"
 
     def selectable(self):
         return True
 
-    def collapse_widget(self, widget):
-        widget.collapse_folder = True
-        if widget.is_folder:
-            widget.icon = self.FOLDER_CLOSED_ICON
-        widget.update_display()
-        for child in widget.children_widgets:
-            if child.item.original_widget in widget.list_walker:
-                widget.list_walker.remove(child.item.original_widget)
-            if child.item.original_widget.is_folder:
-                self.collapse_widget(child.item.original_widget)
-
     def toggle_expand(self):
-        my_widget = self.item.original_widget
-        if my_widget not in self.list_walker:
-            print(
-                f"Error: Widget '{self.project_name}' id={id(self.item)} not found in the list!")
+        if not self.is_folder:
             return
-
-        self.collapse_folder = not self.collapse_folder
-
-        if not self.collapse_folder:
-            if self.is_folder:
-                self.icon = self.FOLDER_OPEN_ICON
-            index = self.list_walker.index(my_widget)
-            for child in reversed(self.children_widgets):
-                if child.item.original_widget not in self.list_walker:
-                    self.list_walker.insert(
-                        index + 1, child.item.original_widget)
-        else:
-            if self.is_folder:
-                self.icon = self.FOLDER_CLOSED_ICON
-            self.collapse_widget(self)
-
-        self.update_display()
+        self.tree_walker.toggle(self.node)
+        self.refresh_status()
 
     def update_display(self):
         self.header.set_text(self._get_header_text())
         self.status.set_text(self.status_details)
 
-    def add_child(self, widget):
-        self.children_widgets.append(widget)
-
     def keypress(self, size, key):
         if key in ('enter', ' '):
             self.toggle_expand()
@@ -112,11 +107,20 @@ class ProjectWidget(urwid.WidgetWrap):
                 return None
             self.show_logs()
             return None
+        if key in ('s', 'S') and self.worker:
+            # Sync in background, the status is updated as it goes
+            self.worker.sync(self.node)
+            self.refresh_status()
+            return None
+        if key in ('e', 'E') and self.worker:
+            # Let the scheduler daemon sync it
+            self.worker.enqueue(self.node)
+            return None
 
         return key
 
     def show_logs(self):
-        log_text = urwid.Text(self.logs)
+        log_text = urwid.Text(self.node.get_logs())
         log_fill = urwid.Filler(log_text, valign='top')
         log_box = urwid.LineBox(log_fill)
         log_overlay = urwid.Overlay(log_box, urwid.SolidFill(' '), align='center', width=('relative', 80),
@@ -125,52 +129,43 @@ class ProjectWidget(urwid.WidgetWrap):
         def exit_logs(key):
             if key in ('q', 'Q', 'esc'):
                 main_loop.widget = main_widget
-                main_loop.unhandled_input = None
+                main_loop.unhandled_input = unhandled_input
 
         main_widget = main_loop.widget
+        unhandled_input = main_loop.unhandled_input
         main_loop.widget = log_overlay
         main_loop.unhandled_input = exit_logs
 
 
-def build_ui_project(node, list_walker, parent_widget=None, depth=0):
+def build_ui(root, worker=None):
     """
-    Recursively build the UI for each project or folder node.
-
-    :param node: A project or folder node.
-    :param list_walker: The list walker to which the UI elements are appended.
-    :param parent_widget: The parent ProjectWidget if this is a subproject.
+    Construct the UI for the application using the root folder containing
+    all projects. Only the top level is shown, folders are scanned when
+    they are expanded.
     """
-    widget = ProjectWidget(node, list_walker, depth, node.collapse)
-    list_walker.append(widget)
+    def make_widget(node, depth):
+        return ProjectWidget(node, tree_walker, depth, worker)
 
-    if parent_widget:
-        parent_widget.add_child(widget)
+    def load_children(folder):
+        if worker:
+            worker.scan_shallow(folder)
+        elif not folder.scanned:
+            folder.scan_shallow()
 
-    if node.is_folder():
-        for project in node.children:
-            build_ui_project(project, list_walker, parent_widget=widget,
-                             depth=depth+1)
+    tree_walker = TreeWalker(root, make_widget, load_children)
+    tree_walker.expand(root)
+    return urwid.ListBox(tree_walker)
 
-    # Collapse only after all children are added
-    if node.collapse:
-        widget.collapse_widget(widget)
 
-
-def build_ui(root):
+def run_ui(sync=True, jobs=4):
     """
-    Construct the UI for the application using the root folder containing all projects.
+    Show the status of the last sync right away, and sync in background
+    unless sync is False. 's' syncs the focused project or folder again,
+    'e' queues it on the scheduler daemon.
     """
-    list_walker = urwid.SimpleFocusListWalker([])
-    build_ui_project(root, list_walker)
-    return urwid.ListBox(list_walker)
-
-
-def run_ui():
     global main_loop
     config = Config.get_local_instance()
     root = SyncFolder(config.projects_path, config=config)
-    root.scan()
-    root.sync()
 
     palette = [
         ('reversed', 'standout', ''),
@@ -180,9 +175,37 @@ def run_ui():
         ('hidden', 'black', 'black'),
     ]
 
-    listbox = build_ui(root)
-    main_loop = urwid.MainLoop(listbox, palette)
-    main_loop.run()
+    # Sync threads only wake up the main loop through a pipe, widgets are
+    # refreshed from the main loop
+    refresh_pending = []
+
+    def on_change():
+        if not refresh_pending:
+            refresh_pending.append(True)
+            os.write(refresh_fd, b"r")
+
+    def refresh(_data):
+        refresh_pending.clear()
+        listbox.body.refresh()
+        footer.set_text(worker.get_status_str())
+        return True
+
+    def exit_on_q(key):
+        if key in ('q', 'Q'):
+            raise urwid.ExitMainLoop()
+
+    worker = SyncWorker(jobs, on_change=on_change)
+    listbox = build_ui(root, worker)
+    footer = urwid.Text(worker.get_status_str())
+    main_loop = urwid.MainLoop(urwid.Frame(listbox, footer=footer), palette,
+                               unhandled_input=exit_on_q)
+    refresh_fd = main_loop.watch_pipe(refresh)
+    if sync:
+        worker.sync(root)
+    try:
+        main_loop.run()
+    finally:
+        worker.save_index()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,150 @@
+import urwid
+
+
+class TreeWalker(urwid.ListWalker):
+    """
+    List walker over the visible rows of a Node tree.
+
+    Positions are the nodes themselves. The rows before and after a node
+    are computed from the tree and the set of expanded folders, so
+    expanding or collapsing a folder doesn't touch any list, and only the
+    rows actually drawn are visited. Row widgets are created by
+    make_widget(node, depth) the first time a row is drawn.
+    """
+
+    def __init__(self, root, make_widget, load_children=None):
+        self.root = root
+        self.focus = root
+        self.make_widget = make_widget
+        # Called before a folder is expanded for the first time
+        self.load_children = load_children
+        self.expanded = set()
+        self._widgets = {}
+        # node => index in its parent's children
+        self._indexes = {}
+        # Incremented to make visible widgets refresh their status
+        self.generation = 0
+
+    def get_widget(self, node):
+        widget = self._widgets.get(node)
+        if widget is None:
+            widget = self.make_widget(node, self.get_depth(node))
+            self._widgets[node] = widget
+        return widget
+
+    def get_depth(self, node):
+        depth = 0
+        while node is not self.root:
+            node = node.parent
+            depth += 1
+        return depth
+
+    def _get_index(self, node):
+        index = self._indexes.get(node)
+        if index is None:
+            for i, child in enumerate(node.parent.children):
+                self._indexes[child] = i
+            index = self._indexes[node]
+        return index
+
+    def _get_sibling(self, node, offset):
+        if node is self.root:
+            return None
+        siblings = node.parent.children
+        index = self._get_index(node) + offset
+        if 0 <= index < len(siblings):
+            return siblings[index]
+        return None
+
+    def _get_visible_children(self, node):
+        return node.children if node in self.expanded else []
+
+    def _get_last_descendant(self, node):
+        """Return the last visible row of the subtree of node."""
+        children = self._get_visible_children(node)
+        while children:
+            node = children[-1]
+            children = self._get_visible_children(node)
+        return node
+
+    def next_position(self, node):
+        children = self._get_visible_children(node)
+        if children:
+            return children[0]
+        while node is not self.root:
+            sibling = self._get_sibling(node, 1)
+            if sibling is not None:
+                return sibling
+            node = node.parent
+        return None
+
+    def prev_position(self, node):
+        if node is self.root:
+            return None
+        sibling = self._get_sibling(node, -1)
+        if sibling is None:
+            return node.parent
+        return self._get_last_descendant(sibling)
+
+    def get_focus(self):
+        return self.get_widget(self.focus), self.focus
+
+    def set_focus(self, node):
+        self.focus = node
+        self._modified()
+
+    def get_next(self, node):
+        node = self.next_position(node)
+        if node is None:
+            return None, None
+        return self.get_widget(node), node
+
+    def get_prev(self, node):
+        node = self.prev_position(node)
+        if node is None:
+            return None, None
+        return self.get_widget(node), node
+
+    def is_expanded(self, node):
+        return node in self.expanded
+
+    def expand(self, node):
+        if self.load_children:
+            self.load_children(node)
+        self.expanded.add(node)
+        self._modified()
+
+    def collapse(self, node):
+        """
+        Collapse node. Expanded sub-folders stay expanded, and show up again
+        with it.
+        """
+        self.expanded.discard(node)
+        # Don't leave the focus on a hidden row
+        parent = self.focus
+        while parent is not self.root:
+            parent = parent.parent
+            if parent is node:
+                self.focus = node
+                break
+        self._modified()
+
+    def toggle(self, node):
+        if self.is_expanded(node):
+            self.collapse(node)
+        else:
+            self.expand(node)
+
+    def refresh(self):
+        """Make the visible rows read the status of their node again."""
+        self.generation += 1
+        self._modified()
+
+    def rows(self, start=None, count=None):
+        """Yield up to count visible nodes from start (the root by default)."""
+        node = self.root if start is None else start
+        while node is not None and count != 0:
+            yield node
+            node = self.next_position(node)
+            if count is not None:
+                count -= 1
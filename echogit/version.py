@@ -4,6 +4,9 @@ class Version:
     MINOR = 0  # incremented on feature modification/addition
     RELEASE = 1  # incremented on bug fix and minor update
 
+    # Features a peer can rely on when talking to this version
+    CAPABILITIES = ["handshake", "agent", "list-json", "token"]
+
     @staticmethod
     def __str__():
         return f"{Version.MAJOR}.{Version.MINOR}.{Version.RELEASE}"
@@ -0,0 +1,342 @@
+import os
+import time
+from echogit.config import Config
+from echogit.fs_watch import create_watcher, IN_CREATE, IN_DELETE_SELF, \
+    IN_IGNORED, IN_ISDIR, IN_MOVED_TO, IN_MOVE_SELF, IN_Q_OVERFLOW
+from echogit.git_refs import GitRefs
+from echogit.manifest import Manifest
+from echogit.node import Node
+from echogit.node_factory import NodeFactory
+from echogit.peer_probe import PeerProbe
+from echogit.sync_pool import SyncPool
+
+
+class Watcher:
+    """
+    Sync projects when they change, instead of syncing everything on a
+    timer.
+
+    Only what a sync depends on is watched:
+      - folders of the projects tree, to notice new or removed projects,
+      - HEAD, packed-refs and refs/heads of git projects, so commits, not
+        work tree edits, trigger a sync,
+      - the work tree of auto_commit git projects, since their sync commits
+        the edits,
+      - the whole tree of rsync projects,
+      - the .echogit/config.ini file of each project,
+      - the local bare repository of each project under git_path, for
+        incoming pushes.
+    Changes are collected until nothing changed for debounce seconds (or
+    max_delay seconds passed), then only the changed projects are synced.
+    Events caused by the sync itself are dropped, those of branches changed
+    from outside meanwhile are not. Everything is synced at start and then
+    every full_sync seconds, to get the changes of the peers which don't
+    push to this host.
+    """
+    FOLDER, GIT_DIR, REFS, TREE, CONFIG = range(5)
+    GIT_DIR_NAMES = {"HEAD", "packed-refs"}
+
+    def __init__(self, folder, *, config=None, jobs=1, debounce=2.0,
+                 max_delay=30.0, full_sync=3600, poll=False,
+                 poll_interval=5.0, verbose=False):
+        self.folder = folder
+        self.config = config or Config.get_local_instance()
+        self.jobs = jobs
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.full_sync = full_sync
+        self.verbose = verbose
+        self.backend = create_watcher(poll, poll_interval)
+        # wd => (path, project path or None, kind)
+        self._watches = {}
+        self._watched_paths = set()
+        # path => project
+        self.projects = {}
+        # Paths of the projects to sync
+        self.dirty = set()
+        self.rescan_needed = False
+        self.first_event = None
+        self.last_event = None
+        self.next_full_sync = None
+
+    def load(self):
+        """Scan the folder and watch its projects."""
+        for wd in self._watches:
+            self.backend.rm_watch(wd)
+        self._watches = {}
+        self._watched_paths = set()
+
+        root = NodeFactory.from_folder(self.folder, self.config)
+        root.scan()
+        if root.is_folder():
+            projects = root.get_projects()
+            self._watch_folder(root.path)
+        else:
+            projects = [root]
+        old_projects = self.projects
+        self.projects = {os.path.normpath(project.path): project
+                         for project in projects}
+        for path, project in self.projects.items():
+            self._watch_project(path, project)
+        self.dirty &= set(self.projects)
+        # New projects are synced with the changed ones
+        if old_projects:
+            self.dirty |= set(self.projects) - set(old_projects)
+        self.rescan_needed = False
+
+    def _watch(self, path, project, kind):
+        if path in self._watched_paths:
+            return
+        wd = self.backend.add_watch(path)
+        if wd is not None:
+            self._watches[wd] = (path, project, kind)
+            self._watched_paths.add(path)
+
+    def _watch_tree(self, path, project, kind, exclude=()):
+        self._watch(path, project, kind)
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.name not in exclude and \
+                    entry.is_dir(follow_symlinks=False):
+                self._watch_tree(entry.path, project, kind)
+
+    def _watch_folder(self, path):
+        """
+        Watch a folder and its sub-folders down to the projects. Plain git
+        repositories are watched too: they become projects when a
+        .echogit folder is added.
+        """
+        self._watch(path, None, Watcher.FOLDER)
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.name.startswith(".") or \
+                    not entry.is_dir(follow_symlinks=False):
+                continue
+            node_type = Node.get_type_from_folder(entry.path)
+            if node_type == Node.NodeType.SYNC_FOLDER:
+                self._watch_folder(entry.path)
+            elif node_type == Node.NodeType.UNKNOWN:
+                self._watch(entry.path, None, Watcher.FOLDER)
+
+    def _watch_git_dir(self, git_dir, project):
+        self._watch(git_dir, project, Watcher.GIT_DIR)
+        self._watch_tree(os.path.join(git_dir, "refs", "heads"), project,
+                         Watcher.REFS)
+
+    def _get_bare_path(self, project):
+        """
+        Return the path of the local bare repository of project, without
+        its .git or .rsync suffix, or None without git_path.
+        """
+        if not self.config.git_path:
+            return None
+        relative_path = project.get_relative_path().rstrip(os.sep)
+        return os.path.join(self.config.git_path, relative_path)
+
+    def _watch_project(self, path, project):
+        self._watch(os.path.join(path, ".echogit"), path, Watcher.CONFIG)
+        is_git = project.get_type() == Node.NodeType.GIT_PROJECT
+        if is_git:
+            self._watch_git_dir(os.path.join(path, ".git"), path)
+            if project.node_config.auto_commit:
+                self._watch_tree(path, path, Watcher.TREE,
+                                 exclude={".git", ".echogit"})
+        else:
+            self._watch_tree(path, path, Watcher.TREE, exclude={".echogit"})
+
+        bare_path = self._get_bare_path(project)
+        if bare_path is None:
+            return
+        if is_git:
+            if os.path.isdir(bare_path + ".git"):
+                self._watch_git_dir(bare_path + ".git", path)
+        elif os.path.isdir(bare_path + ".rsync"):
+            self._watch_tree(bare_path + ".rsync", path, Watcher.TREE)
+
+    def _handle_event(self, wd, name, mask):
+        """
+        Update the dirty projects with one event. Return True if the event
+        is relevant.
+        """
+        if mask & IN_Q_OVERFLOW:
+            self.dirty.update(self.projects)
+            self.rescan_needed = True
+            return True
+        watch = self._watches.get(wd)
+        if watch is None:
+            return False
+        path, project, kind = watch
+        if mask & IN_IGNORED:
+            del self._watches[wd]
+            self._watched_paths.discard(path)
+            return False
+
+        if kind == Watcher.FOLDER:
+            if mask & (IN_ISDIR | IN_DELETE_SELF | IN_MOVE_SELF):
+                self.rescan_needed = True
+                return True
+            return False
+        if name.endswith(".lock"):
+            return False
+        if kind == Watcher.GIT_DIR and name not in Watcher.GIT_DIR_NAMES:
+            return False
+        if kind == Watcher.CONFIG:
+            if name != "config.ini":
+                return False
+            # Remotes or branches may have changed
+            self.rescan_needed = True
+
+        if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and \
+                kind in (Watcher.REFS, Watcher.TREE):
+            self._watch_tree(os.path.join(path, name), project, kind)
+        self.dirty.add(project)
+        return True
+
+    def _handle_events(self, events):
+        relevant = False
+        for wd, name, mask in events:
+            relevant = self._handle_event(wd, name, mask) or relevant
+        if relevant:
+            self.last_event = time.monotonic()
+            if self.first_event is None:
+                self.first_event = self.last_event
+
+    def _get_timeout(self, now):
+        timeouts = []
+        if self.full_sync:
+            timeouts.append(self.next_full_sync - now)
+        if self.first_event is not None:
+            timeouts.append(min(self.last_event + self.debounce,
+                                self.first_event + self.max_delay) - now)
+        return max(0, min(timeouts)) if timeouts else None
+
+    def _is_ready(self, now):
+        if self.first_event is None:
+            return False
+        return now - self.last_event >= self.debounce or \
+            now - self.first_event >= self.max_delay
+
+    def _get_refs(self, path):
+        """
+        Return the branches of the git project at path and of its local
+        bare repository as (local heads, bare heads), or None for an rsync
+        project.
+        """
+        project = self.projects[path]
+        if project.get_type() != Node.NodeType.GIT_PROJECT:
+            return None
+        bare_path = self._get_bare_path(project)
+        bare_heads = {}
+        if bare_path is not None and os.path.isdir(bare_path + ".git"):
+            bare_heads = GitRefs.get_heads(bare_path + ".git", bare=True)
+        return GitRefs.get_heads(path), bare_heads
+
+    def _is_changed_outside(self, path, before, after):
+        """
+        True if branches of a synced project were changed by something
+        else than its sync: since the sync ended, or during the sync to a
+        commit the sync didn't exchange with a peer. before and after are
+        _get_refs() results taken before and when the sync ended.
+        """
+        if after is None:
+            return False
+        if self._get_refs(path) != after:
+            return True
+        if self.projects[path].node_config.auto_commit and \
+                not GitRefs.is_clean(path):
+            # Edited after the sync committed the work tree
+            return True
+        local, bare = after
+        tracked = set(GitRefs.get_remote_heads(path).values())
+        for heads, old_heads, synced in [(local, before[0], bare),
+                                         (bare, before[1], local)]:
+            for branch, sha in heads.items():
+                if sha != old_heads.get(branch) and sha not in tracked and \
+                        sha != synced.get(branch):
+                    return True
+        return False
+
+    def sync(self, paths):
+        """
+        Sync the projects at paths, and drop the events they cause, but
+        not those of changes made meanwhile.
+        """
+        self.first_event = None
+        self.last_event = None
+        if self.rescan_needed:
+            self.load()
+            paths = set(paths) | self.dirty
+        paths = [path for path in paths if path in self.projects]
+        self.dirty.difference_update(paths)
+        if not paths:
+            return
+
+        peers = self.config.get_peers().values()
+        for peer in peers:
+            peer.reset()
+        PeerProbe(self.config.probe_timeout).probe_all(peers)
+        projects = []
+        for path in paths:
+            # Branches of peers which were down are missing
+            project = self.projects[path]
+            project.children = []
+            project.scan()
+            projects.append(project)
+
+        before = {path: self._get_refs(path) for path in paths}
+        after = {}
+
+        def snapshot(project, _success, _total):
+            path = os.path.normpath(project.path)
+            after[path] = self._get_refs(path)
+
+        print(f"Syncing {', '.join(project.name for project in projects)}")
+        success, total = SyncPool(self.jobs, self.verbose).sync(projects,
+                                                                snapshot)
+        print(f"done on {success}/{total}...")
+        Manifest(self.config).update_projects(projects)
+
+        self._handle_events(self.backend.drain())
+        for path in paths:
+            if path in self.dirty and not self._is_changed_outside(
+                    path, before[path], after.get(path)):
+                self.dirty.discard(path)
+        if not self.dirty and not self.rescan_needed:
+            self.first_event = None
+            self.last_event = None
+
+    def sync_all(self):
+        self.load()
+        self.sync(list(self.projects))
+        if self.full_sync:
+            self.next_full_sync = time.monotonic() + self.full_sync
+
+    def wait(self, timeout=None):
+        """Wait up to timeout seconds for changes."""
+        self._handle_events(self.backend.read_events(timeout))
+
+    def run_once(self):
+        """Wait for changes, and sync if it is time to."""
+        self.wait(self._get_timeout(time.monotonic()))
+        now = time.monotonic()
+        if self.full_sync and now >= self.next_full_sync:
+            self.sync_all()
+        elif self._is_ready(now):
+            self.sync(list(self.dirty))
+
+    def run(self):
+        self.sync_all()
+        print(f"Watching {len(self.projects)} projects in {self.folder}")
+        try:
+            while True:
+                self.run_once()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.backend.close()
@@ -0,0 +1,93 @@
+import os
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+from echogit.config import Config
+from echogit.git_project import GitProject
+from echogit.git_refs import GitRefs
+from echogit.status_store import StatusStore
+
+
+class LocalPeerTestCase(unittest.TestCase):
+    """
+    Test case with real git projects and the 'local' peer on 127.0.0.1,
+    whose bare repositories are under git_path: syncs run git without
+    ssh. Caches, statuses and the local config are isolated in a
+    temporary folder.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        env = mock.patch.dict(os.environ, {
+            "XDG_CACHE_HOME": os.path.join(self.tmp.name, "cache"),
+            "XDG_STATE_HOME": os.path.join(self.tmp.name, "state"),
+            "GIT_AUTHOR_NAME": "t", "GIT_AUTHOR_EMAIL": "t@t",
+            "GIT_COMMITTER_NAME": "t", "GIT_COMMITTER_EMAIL": "t@t"})
+        env.start()
+        self.addCleanup(env.stop)
+        store = mock.patch.object(StatusStore, "_instance", StatusStore(
+            os.path.join(self.tmp.name, "status.db")))
+        store.start()
+        self.addCleanup(store.stop)
+
+        self.root = os.path.join(self.tmp.name, "projects")
+        self.git_path = os.path.join(self.tmp.name, "git")
+        self.config = Config(config_string=(
+            f"[DEFAULT]\nprojects_path = {self.root}\n"
+            f"git_path = {self.git_path}\n\n"
+            "[PEERS]\npeers = local:127.0.0.1:0\n"))
+        local_config = mock.patch.object(Config, "_local_instance",
+                                         self.config)
+        local_config.start()
+        self.addCleanup(local_config.stop)
+        self.peer = self.config.get_peer("local")
+
+    @staticmethod
+    def git(path, *args):
+        return subprocess.run(["git", *args], cwd=path, check=True,
+                              capture_output=True, text=True).stdout
+
+    def commit(self, path, name):
+        """Commit a new file and return the new HEAD."""
+        with open(os.path.join(path, name), "w") as f:
+            f.write(name)
+        self.git(path, "add", name)
+        self.git(path, "commit", "-q", "-m", name)
+        return GitRefs.resolve(path, "HEAD")
+
+    def add_project(self, name, branches=("master",), options=""):
+        """
+        Create a git project synced with the local peer, with one commit
+        on each branch, and its empty bare repository. Return its path.
+        """
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.join(path, ".echogit"))
+        with open(os.path.join(path, ".echogit", "config.ini"), "w") as f:
+            f.write(f"[ECHOGIT]\nsync_type = git\n{options}\n[BRANCHES]\n"
+                    f"sync_branches = {', '.join(branches)}\n"
+                    "sync_remotes = local\n")
+        self.git(path, "init", "-q", "-b", branches[0])
+        self.git(path, "add", ".echogit")
+        self.git(path, "commit", "-q", "-m", "init")
+        for branch in branches[1:]:
+            self.git(path, "branch", branch)
+
+        bare_path = os.path.join(self.git_path, f"{name}.git")
+        os.makedirs(bare_path)
+        self.git(bare_path, "init", "-q", "--bare", "-b", branches[0])
+        return path
+
+    def clone(self, name):
+        """Clone the bare repository of a project, as another host would."""
+        path = os.path.join(self.tmp.name, "clones", name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.git(self.tmp.name, "clone", "-q",
+                 os.path.join(self.git_path, f"{name}.git"), path)
+        return path
+
+    def load_project(self, path):
+        project = GitProject(path, config=self.config)
+        project.scan()
+        return project
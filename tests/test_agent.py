@@ -0,0 +1,152 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+from echogit.agent import Agent
+from echogit.agent_client import AgentClient, AgentError, AgentOpError
+from echogit.config import Config
+from echogit.peer import Peer
+from echogit.version import Version
+
+
+class TestAgent(unittest.TestCase):
+
+    def setUp(self):
+        test_path = os.path.dirname(os.path.realpath(__file__))
+        test_path = os.path.join(
+            test_path, "../test_dir/config/config_test.ini")
+        self.agent = Agent(Config(test_path))
+
+    def _serve(self, requests):
+        stdin = io.StringIO("".join(json.dumps(r) + "\n" for r in requests))
+        stdout = io.StringIO()
+        self.agent.serve(stdin, stdout)
+        return [json.loads(line) for line in stdout.getvalue().splitlines()]
+
+    def test_version(self):
+        responses = self._serve([{"id": 1, "op": "version"}])
+        self.assertEqual(responses, [{"id": 1,
+                                      "result": Version.full_version()}])
+
+    def test_unknown_op(self):
+        responses = self._serve([{"id": 2, "op": "unknown"}])
+        self.assertIn("error", responses[0])
+        self.assertEqual(responses[0]["id"], 2)
+
+    def test_invalid_request(self):
+        response = self.agent.handle("not json")
+        self.assertIsNone(response["id"])
+        self.assertIn("error", response)
+
+    def test_dir_exists(self):
+        responses = self._serve([
+            {"id": 3, "op": "dir_exists", "args": {"path": "/"}},
+            {"id": 4, "op": "dir_exists", "args": {"path": "/nonexistent"}},
+        ])
+        self.assertTrue(responses[0]["result"])
+        self.assertFalse(responses[1]["result"])
+
+    def test_refs(self):
+        with tempfile.TemporaryDirectory() as git_path:
+            repo = os.path.join(git_path, "a.git")
+            subprocess.run(["git", "init", "-q", "--bare", repo], check=True)
+            tree = subprocess.run(
+                ["git", f"--git-dir={repo}", "mktree"], input="",
+                capture_output=True, text=True, check=True).stdout.strip()
+            commit = subprocess.run(
+                ["git", f"--git-dir={repo}", "-c", "user.name=t", "-c",
+                 "user.email=t@t", "commit-tree", "-m", "c", tree],
+                capture_output=True, text=True, check=True).stdout.strip()
+            subprocess.run(["git", f"--git-dir={repo}", "update-ref",
+                            "refs/heads/feature/x", commit], check=True)
+            self.agent.config.git_path = git_path
+            response = self.agent.handle(json.dumps({
+                "id": 5, "op": "refs",
+                "args": {"paths": ["a.git/", "missing.git/"]}}))
+        self.assertEqual(response["result"],
+                         {"a.git/": {"feature/x": commit}})
+
+
+class TestAgentClient(unittest.TestCase):
+    # Agent answering "ok" to each request, an error to "fail", or never
+    # answering "hang"
+    STUB = ("import json, sys, time\n"
+            "for line in sys.stdin:\n"
+            "    request = json.loads(line)\n"
+            "    if request['op'] == 'hang':\n"
+            "        time.sleep(30)\n"
+            "    if request['op'] == 'fail':\n"
+            "        error = {'id': request['id'], 'error': 'bad'}\n"
+            "        print(json.dumps(error), flush=True)\n"
+            "        continue\n"
+            "    print(json.dumps({'id': request['id'], 'result': 'ok'}),\n"
+            "          flush=True)\n")
+
+    def setUp(self):
+        self.client = AgentClient([sys.executable, "-c", self.STUB],
+                                  timeout=0.5)
+        self.addCleanup(self.client.close)
+
+    def test_requests(self):
+        self.assertEqual(self.client.request("version"), "ok")
+        self.assertEqual(self.client.request("list"), "ok")
+
+    def test_timeout(self):
+        self.client.request("version")
+        start = time.monotonic()
+        with self.assertRaises(AgentError):
+            self.client.request("hang")
+        self.assertLess(time.monotonic() - start, 5)
+        # A new session is started for the next request
+        self.assertEqual(self.client.request("version"), "ok")
+
+    def test_peer_falls_back_on_timeout(self):
+        peer = Peer("test", "remote")
+        peer._get_agent = mock.Mock(return_value=self.client)
+        with mock.patch("sys.stderr", io.StringIO()):
+            self.assertEqual(peer._query_agent("hang"), (False, None))
+        self.assertIs(peer._agent, False)
+
+    def test_peer_keeps_agent_on_op_error(self):
+        peer = Peer("test", "remote")
+        peer._get_agent = mock.Mock(return_value=self.client)
+        with self.assertRaises(AgentOpError):
+            self.client.request("fail")
+        with mock.patch("sys.stderr", io.StringIO()):
+            self.assertEqual(peer._query_agent("fail"), (False, None))
+        self.assertIsNone(peer._agent)
+        # The same session answers the next request
+        process = self.client._process
+        self.assertEqual(peer._query_agent("version"), (True, "ok"))
+        self.assertIs(self.client._process, process)
+
+
+class TestPeerAgentHeads(unittest.TestCase):
+
+    def test_heads_are_read_in_one_request(self):
+        with tempfile.TemporaryDirectory() as cache:
+            with mock.patch.dict(os.environ, {"XDG_CACHE_HOME": cache}):
+                peer = Peer("test", "remote")
+        peer._is_localhost = False
+        peer.config = Config(config_string="[DEFAULT]\n")
+        peer._set_remote_projects({"a.git/": "a", "b.git/": "b",
+                                   "c.rsync/": "c"})
+        peer._query_agent = mock.Mock(return_value=(True, {
+            "a.git/": {"master": "1" * 40}}))
+        local = mock.Mock(projects_path="/data/")
+        with mock.patch.object(Config, "get_local_instance",
+                               return_value=local):
+            self.assertEqual(peer.get_remote_heads("/data/a"),
+                             {"master": "1" * 40})
+            self.assertIsNone(peer.get_remote_heads("/data/b"))
+        peer._query_agent.assert_called_once_with(
+            "refs", paths=["a.git/", "b.git/"])
+
+
+if __name__ == "__main__":
+    unittest.main()
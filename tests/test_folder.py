@@ -1,12 +1,25 @@
 import os
+import tempfile
 import unittest
+from unittest import mock
+from echogit.sync_branch import SyncBranch
 from echogit.sync_folder import SyncFolder
 from echogit.config import Config
+from tests.local_peer import LocalPeerTestCase
 
 
 class TestSyncFolder(unittest.TestCase):
 
     def setUp(self):
+        # Keep the scan index and statuses out of the user's home
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        env = mock.patch.dict(os.environ, {
+            "XDG_CACHE_HOME": os.path.join(self.tmp.name, "cache"),
+            "XDG_STATE_HOME": os.path.join(self.tmp.name, "state")})
+        env.start()
+        self.addCleanup(env.stop)
+
         test_path = os.path.dirname(os.path.realpath(__file__))
         test_path = os.path.join(
             test_path, "../test_dir/config/config_test.ini")
@@ -24,6 +37,39 @@ class TestSyncFolder(unittest.TestCase):
         # Sync should run without errors
         self.folder.sync()
 
+    def test_sync_jobs(self):
+        # Concurrent sync must report the same totals as a serial one
+        self.folder.scan()
+        self.assertEqual(self.folder.sync(jobs=4), self.folder.sync())
+
+
+class TestSyncFolderState(LocalPeerTestCase):
+
+    def test_state_is_cached_until_progress(self):
+        self.add_project("a/p1")
+        self.add_project("b/p2", branches=("master", "dev"))
+        folder = SyncFolder(self.root, config=self.config)
+        folder.scan()
+        with mock.patch.object(SyncBranch, "get_errors",
+                               autospec=True,
+                               side_effect=lambda branch: branch.errors) \
+                as get_errors:
+            self.assertEqual(folder.get_project_state_str(), "OK")
+            self.assertEqual(get_errors.call_count, 3)
+            self.assertEqual(folder.get_project_state_str(), "OK")
+            self.assertFalse(folder.has_error())
+            self.assertEqual(get_errors.call_count, 3)
+
+            p2, = [project for project in folder.get_projects()
+                   if project.name == "p2"]
+            branch = p2.children[0].children[1]
+            branch.errors["push"] = 1
+            branch.report_progress()
+            self.assertEqual(folder.get_project_state_str(), "P")
+            self.assertTrue(folder.has_error())
+            # Only the subtree of b/ is read again
+            self.assertEqual(get_errors.call_count, 5)
+
 
 if __name__ == "__main__":
     unittest.main()
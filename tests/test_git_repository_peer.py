@@ -0,0 +1,185 @@
+import os
+import subprocess
+import unittest
+from unittest import mock
+from echogit.git_refs import GitRefs
+from echogit.status_cache import StatusCache
+from echogit.status_store import StatusStore
+from tests.local_peer import LocalPeerTestCase
+
+
+class TestUpToDateSkip(LocalPeerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = self.add_project("p", branches=("master", "dev"))
+        self.assertEqual(self.load_project(self.path).sync(), (1, 1))
+
+    def _sync(self):
+        """Sync the project and return the git fetch commands it ran."""
+        with mock.patch("echogit.git_repository_peer.subprocess.run",
+                        wraps=subprocess.run) as run:
+            self.load_project(self.path).sync()
+        return [call.args[0][2:] for call in run.call_args_list
+                if call.args[0][:2] == ["git", "fetch"]]
+
+    def _get_state(self, branch):
+        return StatusStore.get_instance().get(self.path, "local",
+                                              branch)["state"]
+
+    def _push_from_clone(self):
+        clone = self.clone("p")
+        commit = self.commit(clone, "remote")
+        self.git(clone, "push", "-q", "origin", "master")
+        return commit
+
+    def test_identical_branches_are_skipped(self):
+        self.assertEqual(self._sync(), [])
+        self.assertEqual(self._get_state("master"),
+                         StatusCache.STATE_UP_TO_DATE)
+        self.assertEqual(self._get_state("dev"),
+                         StatusCache.STATE_UP_TO_DATE)
+
+    def test_fetch_is_narrowed_to_changed_branches(self):
+        commit = self._push_from_clone()
+        self.assertEqual(self._sync(), [[
+            "local", "+refs/heads/master:refs/remotes/local/master"]])
+        self.assertEqual(GitRefs.resolve(self.path, "master"), commit)
+        self.assertEqual(self._get_state("dev"),
+                         StatusCache.STATE_UP_TO_DATE)
+
+    def test_empty_listing_is_not_trusted(self):
+        commit = self._push_from_clone()
+        with mock.patch.object(self.peer, "get_remote_heads",
+                               return_value={}):
+            fetches = self._sync()
+        # Both branches are fetched, none is skipped
+        self.assertEqual(len(fetches), 1)
+        self.assertEqual(len(fetches[0]), 3)
+        self.assertEqual(GitRefs.resolve(self.path, "master"), commit)
+        self.assertEqual(self._get_state("dev"), StatusCache.STATE_SYNCED)
+
+    def test_branches_missing_on_peer(self):
+        commit = self._push_from_clone()
+        with mock.patch.object(self.peer, "get_remote_heads",
+                               return_value={"other": commit}):
+            # Nothing the peer has is synced: there is nothing to fetch
+            self.assertEqual(self._sync(), [])
+        self.assertEqual(self._get_state("master"), StatusCache.STATE_SYNCED)
+
+    def test_stale_listing_refetches_present_branches(self):
+        commit = self._push_from_clone()
+        self.git(os.path.join(self.git_path, "p.git"), "branch", "-D", "dev")
+        with mock.patch.object(self.peer, "get_remote_heads",
+                               return_value={"master": commit,
+                                             "dev": commit}):
+            fetches = self._sync()
+        master = "+refs/heads/master:refs/remotes/local/master"
+        dev = "+refs/heads/dev:refs/remotes/local/dev"
+        self.assertEqual(fetches, [["local", master, dev],
+                                   ["local", master]])
+        self.assertEqual(GitRefs.resolve(self.path, "master"), commit)
+        # The branch missing on the peer is pushed again
+        self.assertEqual(
+            GitRefs.resolve(os.path.join(self.git_path, "p.git"), "dev"),
+            GitRefs.resolve(self.path, "dev"))
+
+
+class TestCheckoutFreeSync(LocalPeerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = self.add_project("p", branches=("master", "dev"),
+                                     options="checkout_free = true\n")
+        self.assertEqual(self.load_project(self.path).sync(), (1, 1))
+        self.bare = os.path.join(self.git_path, "p.git")
+        self.clone_path = self.clone("p")
+        self.git(self.clone_path, "checkout", "-q", "-b", "dev",
+                 "origin/dev")
+
+    def _sync(self, statuses=1):
+        """
+        Sync the project, checking that no branch is checked out and that
+        the work tree status is read statuses times, whatever the number
+        of branches.
+        """
+        with mock.patch("echogit.sync_branch.subprocess.run",
+                        wraps=subprocess.run) as run:
+            result = self.load_project(self.path).sync()
+        commands = [call.args[0][:2] for call in run.call_args_list]
+        self.assertNotIn(["git", "checkout"], commands)
+        self.assertEqual(commands.count(["git", "status"]), statuses)
+        return result
+
+    def _push_from_clone(self, branch):
+        self.git(self.clone_path, "checkout", "-q", branch)
+        commit = self.commit(self.clone_path, f"remote-{branch}")
+        self.git(self.clone_path, "push", "-q", "origin", branch)
+        return commit
+
+    def _commit_on(self, branch):
+        """Commit on a local branch, then check master out again."""
+        self.git(self.path, "checkout", "-q", branch)
+        commit = self.commit(self.path, f"local-{branch}")
+        self.git(self.path, "checkout", "-q", "master")
+        return commit
+
+    def _get_errors(self, branch):
+        return StatusStore.get_instance().get(self.path, "local",
+                                              branch)["errors"]
+
+    def test_fast_forward(self):
+        commit = self._push_from_clone("dev")
+        self.assertEqual(self._sync(), (1, 1))
+        self.assertEqual(GitRefs.resolve(self.path, "dev"), commit)
+        self.assertEqual(GitRefs.get_current_branch(self.path), "master")
+        # The work tree is untouched
+        self.assertFalse(os.path.exists(os.path.join(self.path,
+                                                     "remote-dev")))
+        self.assertTrue(GitRefs.is_clean(self.path))
+
+    def test_local_ahead_is_pushed(self):
+        commit = self._commit_on("dev")
+        self.assertEqual(self._sync(), (1, 1))
+        self.assertEqual(GitRefs.get_heads(self.bare, bare=True)["dev"],
+                         commit)
+        self.assertEqual(self._get_errors("dev")["push"], 0)
+
+    def test_diverged_branch_is_a_pull_error(self):
+        remote = self._push_from_clone("dev")
+        local = self._commit_on("dev")
+        self.assertEqual(self._sync(), (0, 1))
+        self.assertEqual(GitRefs.resolve(self.path, "dev"), local)
+        self.assertEqual(GitRefs.get_heads(self.bare, bare=True)["dev"],
+                         remote)
+        self.assertEqual(self._get_errors("dev")["pull"], 1)
+        self.assertIn("non-fast-forward", StatusStore.get_instance().get(
+            self.path, "local", "dev")["stderr"]["pull"])
+        self.assertEqual(self._get_errors("master"),
+                         {"remote_add": 0, "push": 0, "pull": 0,
+                          "status": 0})
+
+    def test_dirty_work_tree_is_a_status_error_of_current_branch(self):
+        self._push_from_clone("dev")
+        with open(os.path.join(self.path, "untracked"), "w") as f:
+            f.write("x")
+        # Read again for the log of the checked out branch only
+        self.assertEqual(self._sync(statuses=2), (0, 1))
+        self.assertNotEqual(self._get_errors("master")["status"], 0)
+        self.assertEqual(self._get_errors("dev")["status"], 0)
+
+    def test_current_branch_is_merged_and_pushed(self):
+        remote = self._push_from_clone("master")
+        local = self.commit(self.path, "local-master")
+        self.assertEqual(self._sync(), (1, 1))
+        head = GitRefs.resolve(self.path, "HEAD")
+        self.assertTrue(GitRefs.is_ancestor(self.path, remote, head))
+        self.assertTrue(GitRefs.is_ancestor(self.path, local, head))
+        self.assertEqual(GitRefs.get_heads(self.bare, bare=True)["master"],
+                         head)
+        self.assertTrue(os.path.exists(os.path.join(self.path,
+                                                    "remote-master")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from echogit.config import Config
+from echogit.manifest import Manifest
+
+
+class TestManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        env = mock.patch.dict(os.environ, {"XDG_CACHE_HOME": self.tmp.name})
+        env.start()
+        self.addCleanup(env.stop)
+        self.addCleanup(self.tmp.cleanup)
+
+        test_path = os.path.dirname(os.path.realpath(__file__))
+        test_path = os.path.join(
+            test_path, "../test_dir/config/config_test.ini")
+        self.config = Config(test_path)
+
+    def test_records(self):
+        records = Manifest(self.config).get_records()
+        paths = sorted(record["path"] for record in records)
+        self.assertEqual(paths, ["test1.git/", "testd/test2.git/"])
+
+    def test_token_is_stable(self):
+        token = Manifest(self.config).get_token()
+        manifest = Manifest(self.config)
+        self.assertTrue(manifest.load())
+        self.assertTrue(manifest.is_valid())
+        self.assertEqual(manifest.get_token(), token)
+
+
+class TestManifestRefs(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        env = mock.patch.dict(os.environ, {
+            "XDG_CACHE_HOME": os.path.join(self.tmp.name, "cache")})
+        env.start()
+        self.addCleanup(env.stop)
+
+        git_path = os.path.join(self.tmp.name, "git")
+        self.repo = os.path.join(git_path, "a.git")
+        self._git("init", "-q", "--bare", self.repo)
+        self.first = self._new_commit("first")
+        self._git("update-ref", "refs/heads/feature/x", self.first)
+        # Older than the manifest, whatever the mtime granularity
+        old = time.time() - 10
+        for root, _dirs, _files in os.walk(git_path):
+            os.utime(root, (old, old))
+        self.config = Config(config_string=(
+            f"[DEFAULT]\nprojects_path = {self.tmp.name}\n"
+            f"git_path = {git_path}\n"))
+
+    def _git(self, *args):
+        return subprocess.run(
+            ["git", f"--git-dir={self.repo}", "-c", "user.name=t", "-c",
+             "user.email=t@t", *args], check=True, capture_output=True,
+            text=True, input="").stdout.strip()
+
+    def _new_commit(self, message):
+        tree = self._git("mktree")
+        return self._git("commit-tree", "-m", message, tree)
+
+    def test_nested_branch_update(self):
+        manifest = Manifest(self.config)
+        records = manifest.get_records()
+        self.assertEqual(records[0]["heads"], {"feature/x": self.first})
+        token = manifest.get_token()
+
+        second = self._new_commit("second")
+        self._git("update-ref", "refs/heads/feature/x", second)
+        manifest = Manifest(self.config)
+        self.assertTrue(manifest.load())
+        self.assertFalse(manifest.is_valid())
+        self.assertNotEqual(manifest.get_token(), token)
+        self.assertEqual(manifest.records[0]["heads"],
+                         {"feature/x": second})
+
+    def test_concurrent_updates(self):
+        Manifest(self.config).refresh()
+
+        def update(i):
+            for j in range(5):
+                self._git("update-ref", f"refs/heads/b{i}-{j}", self.first)
+                Manifest(self.config).update_repo(self.repo)
+
+        threads = [threading.Thread(target=update, args=(i,))
+                   for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        manifest = Manifest(self.config)
+        manifest.load()
+        # No update was lost
+        self.assertEqual(len(manifest.records[0]["heads"]), 41)
+
+    def test_update_reads_only_synced_repos(self):
+        manifest = Manifest(self.config)
+        token = manifest.get_token()
+        second = self._new_commit("second")
+        self._git("update-ref", "refs/heads/master", second)
+        with mock.patch("echogit.manifest.NodeFactory") as factory:
+            manifest.update_repos([self.repo])
+            # Unchanged: the token stays
+            manifest.update_repos([self.repo])
+        factory.from_folder.assert_not_called()
+        self.assertEqual(manifest.records[0]["heads"],
+                         {"feature/x": self.first, "master": second})
+        self.assertNotEqual(manifest.get_token(), token)
+        token = manifest.get_token()
+        manifest.update_repos([self.repo])
+        self.assertEqual(manifest.get_token(), token)
+
+    def test_recent_mtime_is_checked_again(self):
+        manifest = Manifest(self.config)
+        token = manifest.get_token()
+        # A ref changed within the same mtime tick: the mtime doesn't move
+        mtime = manifest.records[0]["mtime"]
+        manifest.checked[manifest.records[0]["path"]] = mtime
+        manifest.save()
+        second = self._new_commit("second")
+        self._git("update-ref", "refs/heads/feature/x", second)
+        for root, _dirs, _files in os.walk(self.repo):
+            os.utime(root, (mtime, mtime))
+
+        manifest = Manifest(self.config)
+        self.assertTrue(manifest.load())
+        self.assertTrue(manifest.is_valid())
+        self.assertEqual(len(manifest.get_recent_records()), 1)
+        self.assertNotEqual(manifest.get_token(), token)
+        self.assertEqual(manifest.records[0]["heads"],
+                         {"feature/x": second})
+        self.assertEqual(manifest.get_recent_records(), [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,249 @@
+import contextlib
+import io
+import json
+import os
+import stat
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from echogit.config import Config
+from echogit.peer import Peer
+
+
+class TestPeerCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        env = mock.patch.dict(os.environ, {"XDG_CACHE_HOME": self.tmp.name})
+        env.start()
+        self.addCleanup(env.stop)
+        self.addCleanup(self.tmp.cleanup)
+
+        self.peer = Peer("test", "127.0.0.1")
+        self.peer._set_remote_projects({"a.git/": "a", "b/c.rsync/": "c"})
+        self.peer._save_cache("token1")
+
+    def _new_peer(self, token):
+        peer = Peer("test", "127.0.0.1")
+        peer._fetch_remote_token = mock.Mock(return_value=token)
+        return peer
+
+    def test_fresh_cache(self):
+        peer = self._new_peer("token2")
+        projects = peer._get_cached_projects()
+        self.assertEqual(projects, {"a.git/": "a", "b/c.rsync/": "c"})
+        peer._fetch_remote_token.assert_not_called()
+
+    def test_stale_cache_same_token(self):
+        peer = self._new_peer("token1")
+        peer.cache_ttl = -1
+        self.assertIsNotNone(peer._get_cached_projects())
+        peer._fetch_remote_token.assert_called_once()
+
+    def test_stale_cache_new_token(self):
+        peer = self._new_peer("token2")
+        peer.cache_ttl = -1
+        self.assertIsNone(peer._get_cached_projects())
+
+    def test_records_are_cached(self):
+        peer = self._new_peer("token1")
+        peer._get_cached_projects()
+        self.assertEqual(peer.get_remote_record("a.git/")["name"], "a")
+
+
+class TestPeerBudgets(unittest.TestCase):
+
+    def setUp(self):
+        self.config = Config(config_string=(
+            "[DEFAULT]\nprojects_path = /tmp\n\n"
+            "[PEERS]\npeers = pi:pi:0, nas:nas:0\nmax_sessions = 1\n"
+            "bwlimit = 500\n\n[PEER:nas]\nmax_sessions = 4\nbwlimit = 0\n"))
+        self.peers = self.config.get_peers()
+
+    def test_options(self):
+        pi, nas = self.peers["pi"], self.peers["nas"]
+        self.assertEqual((pi.max_sessions, pi.bwlimit), (1, 500))
+        self.assertEqual((nas.max_sessions, nas.bwlimit), (4, 0))
+
+        for peer in [pi, nas]:
+            peer._is_localhost = False
+            peer.get_ssh_command = mock.Mock(return_value=["ssh", "host"])
+        self.assertEqual(pi.get_rsync_options(),
+                         ["--bwlimit=500", "-e", "ssh host"])
+        self.assertEqual(nas.get_rsync_options(), ["-e", "ssh host"])
+        self.assertIn(f"{Peer.THROTTLE_PATH} 500 ssh host",
+                      pi.get_git_env()["GIT_SSH_COMMAND"])
+        self.assertEqual(nas.get_git_env()["GIT_SSH_COMMAND"], "ssh host")
+
+    def test_max_sessions(self):
+        peer = self.peers["nas"]
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def work():
+            with peer.session():
+                with lock:
+                    running.append(1)
+                    peak.append(len(running))
+                time.sleep(0.02)
+                with lock:
+                    running.pop()
+
+        threads = [threading.Thread(target=work) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(max(peak), 4)
+
+
+class TestPeerSyncTypes(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        env = mock.patch.dict(os.environ, {"XDG_CACHE_HOME": self.tmp.name})
+        env.start()
+        self.addCleanup(env.stop)
+        self.peer = Peer("test", "remote")
+        self.peer._is_localhost = False
+        self.peer.config = Config(config_string=(
+            "[DEFAULT]\ngit_path = /srv/git/\n"))
+        self.peer._remote_directory_exists = mock.Mock(
+            side_effect=lambda path: path == "/srv/git/b/c.rsync")
+
+    def test_bulk_listing_is_memoized(self):
+        self.peer.get_remote_projects = mock.Mock(
+            return_value={"a.git/": "a", "b/c.rsync/": "c"})
+        self.assertEqual(self.peer._determine_sync_type("a", "/srv/git/a"),
+                         "git")
+        self.assertEqual(
+            self.peer._determine_sync_type("b/c", "/srv/git/b/c"), "rsync")
+        self.assertIsNone(self.peer._determine_sync_type("d", "/srv/git/d"))
+        self.peer.get_remote_projects.assert_called_once_with(cached=False)
+        self.peer._remote_directory_exists.assert_not_called()
+
+    def test_probe_without_listing(self):
+        self.peer.get_remote_projects = mock.Mock(return_value={})
+        self.assertEqual(
+            self.peer._determine_sync_type("b/c", "/srv/git/b/c"), "rsync")
+        self.assertIsNone(self.peer._determine_sync_type("d", "/srv/git/d"))
+        self.peer.get_remote_projects.assert_called_once_with(cached=False)
+        # .git then .rsync for each project
+        self.assertEqual(self.peer._remote_directory_exists.call_count, 4)
+
+    def test_local_bare_repos(self):
+        git_path = os.path.join(self.tmp.name, "git")
+        for path in ["a.git/refs", "b/c.rsync/d.git", "b/e"]:
+            os.makedirs(os.path.join(git_path, path))
+        self.assertEqual(Peer._list_local_bare_repos(git_path),
+                         {"a.git/": "a", "b/c.rsync/": "c"})
+
+
+class TestPeerHandshake(unittest.TestCase):
+    """Handshake with a stub ssh answering like an old or a new peer."""
+    CONFIG = "[DEFAULT]\ngit_path = /srv/git/\nechogit_bin = /e.py\n"
+    STUB = """import json, sys
+command = sys.argv[-1]
+if "handshake" in command:
+    if NEW_PEER:
+        print(json.dumps({"config": CONFIG, "version": "0.0.1",
+                          "projects": {"a.git/": "a"}, "token": "t1",
+                          "capabilities": ["handshake"]}))
+        sys.exit(0)
+    print("echogit.py: error: invalid choice: 'handshake'", file=sys.stderr)
+    sys.exit(2)
+if command.startswith("cat "):
+    print(CONFIG, end="")
+elif command.endswith(" version"):
+    print("0.0.1")
+else:
+    sys.exit(1)
+"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        env = mock.patch.dict(os.environ, {"XDG_CACHE_HOME": self.tmp.name})
+        env.start()
+        self.addCleanup(env.stop)
+
+    def _create_peer(self, new_peer):
+        stub = os.path.join(self.tmp.name, "ssh.py")
+        with open(stub, "w") as f:
+            f.write(f"NEW_PEER = {new_peer}\nCONFIG = {self.CONFIG!r}\n")
+            f.write(self.STUB)
+        os.chmod(stub, stat.S_IRWXU)
+        peer = Peer("old", "oldhost")
+        peer._is_localhost = False
+        peer.get_ssh_command = mock.Mock(return_value=[sys.executable, stub])
+        return peer
+
+    def _fetch_config(self, peer):
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            peer.fetch_config()
+        return stderr.getvalue()
+
+    def test_old_peer_fallback_is_quiet(self):
+        peer = self._create_peer(new_peer=False)
+        self.assertEqual(self._fetch_config(peer), "")
+        self.assertFalse(peer.is_down)
+        self.assertEqual(peer.config.git_path, "ssh://old:/srv/git/")
+        self.assertEqual(peer.remote_version, "0.0.1")
+        self.assertEqual(peer.capabilities, [])
+        # Handshake, then config and version
+        self.assertEqual(peer.get_ssh_command.call_count, 3)
+
+    def test_handshake(self):
+        peer = self._create_peer(new_peer=True)
+        self.assertEqual(self._fetch_config(peer), "")
+        self.assertEqual(peer.config.git_path, "ssh://old:/srv/git/")
+        self.assertEqual(peer.capabilities, ["handshake"])
+        self.assertEqual(peer.get_ssh_command.call_count, 1)
+        self.assertEqual(peer._remote_projects, {"a.git/": "a"})
+        with open(peer._get_cache_file()) as f:
+            self.assertEqual(json.load(f)["token"], "t1")
+
+
+class TestPeerStream(unittest.TestCase):
+    """Streamed remote commands, with a stub ssh running the command."""
+
+    def setUp(self):
+        self.peer = Peer("peer", "host")
+        self.peer._is_localhost = False
+        self.peer.get_ssh_command = mock.Mock(
+            return_value=[sys.executable, "-c",
+                          "import sys; exec(sys.argv[-1])"])
+
+    def _stream(self, command, timeout=Peer.STREAM_TIMEOUT):
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            lines = list(self.peer._stream_remote_command(command, timeout))
+        return lines, stderr.getvalue()
+
+    def test_large_stderr_does_not_block(self):
+        lines, errors = self._stream(
+            "import sys\n"
+            "sys.stderr.write('warning\\n' * 100000)\n"
+            "print('a')\nprint('b', end='')\nsys.exit(1)")
+        self.assertEqual(lines, ["a\n", "b"])
+        # The error is reported with the whole stderr
+        self.assertGreaterEqual(errors.count("warning\n"), 100000)
+
+    def test_silent_command_times_out(self):
+        start = time.monotonic()
+        lines, errors = self._stream(
+            "import time\nprint('a', flush=True)\ntime.sleep(30)",
+            timeout=0.5)
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(lines, ["a\n"])
+        self.assertIn("sent nothing", errors)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import contextlib
+import io
+import os
+import socket
+import stat
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from echogit.peer import Peer
+from echogit.peer_probe import PeerProbe
+
+
+class TestPeerProbe(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        # Stub ssh: -G prints ssh_G, other calls run ssh_run
+        bin_path = os.path.join(self.tmp.name, "bin")
+        os.makedirs(bin_path)
+        ssh = os.path.join(bin_path, "ssh")
+        with open(ssh, "w") as f:
+            f.write(f'#!/bin/sh\nif [ "$1" = "-G" ]; then\n'
+                    f'  cat {self.tmp.name}/ssh_G; exit 0\nfi\n'
+                    f'echo "$@" >> {self.tmp.name}/ssh.log\n'
+                    f'. {self.tmp.name}/ssh_run\n')
+        os.chmod(ssh, stat.S_IRWXU)
+        env = mock.patch.dict(os.environ, {
+            "PATH": f"{bin_path}{os.pathsep}{os.environ['PATH']}",
+            "XDG_CACHE_HOME": self.tmp.name})
+        env.start()
+        self.addCleanup(env.stop)
+
+        self.server = socket.socket()
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen()
+        self.addCleanup(self.server.close)
+        self.port = self.server.getsockname()[1]
+        self.peer = Peer("peer", "alias")
+        self.peer._is_localhost = False
+        self.probe = PeerProbe(timeout=0.3)
+
+    def _stub(self, name, content):
+        with open(os.path.join(self.tmp.name, name), "w") as f:
+            f.write(content)
+
+    def _serve_banner(self, banner):
+        def serve():
+            conn, _address = self.server.accept()
+            with conn:
+                conn.sendall(banner)
+                time.sleep(0.5)
+
+        thread = threading.Thread(target=serve, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+
+    def _probe(self):
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            self.probe.probe(self.peer)
+        return stderr.getvalue()
+
+    def test_direct_probe(self):
+        self._stub("ssh_G", f"hostname 127.0.0.1\nport {self.port}\n"
+                            "proxycommand none\n")
+        self._serve_banner(b"SSH-2.0-stub\r\n")
+        self.assertEqual(self._probe(), "")
+        self.assertFalse(self.peer.is_down)
+        self.assertIsNotNone(self.peer.latency)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.tmp.name, "ssh.log")))
+
+    def test_direct_probe_timeout(self):
+        # The connection is accepted by the backlog, no banner comes
+        self._stub("ssh_G", f"hostname 127.0.0.1\nport {self.port}\n")
+        start = time.monotonic()
+        self.assertIn("is down", self._probe())
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertTrue(self.peer.is_down)
+        self.assertIsNone(self.peer.latency)
+
+    def test_proxied_probe(self):
+        # The TCP connection would fail: the port is closed
+        self.server.close()
+        self._stub("ssh_G", f"hostname 10.0.0.1\nport {self.port}\n"
+                            "proxyjump jump\n")
+        self._stub("ssh_run", "exit 0\n")
+        self.assertEqual(self._probe(), "")
+        self.assertFalse(self.peer.is_down)
+        with open(os.path.join(self.tmp.name, "ssh.log")) as f:
+            self.assertEqual(f.read().split()[-2:], ["alias", "true"])
+
+    def test_proxied_probe_failure_and_timeout(self):
+        self._stub("ssh_G", "hostname 10.0.0.1\nproxycommand nc %h %p\n")
+        self._stub("ssh_run", "exit 255\n")
+        self.assertIn("is down", self._probe())
+        self.assertTrue(self.peer.is_down)
+
+        self.peer.is_down = False
+        self._stub("ssh_run", "exec sleep 5\n")
+        start = time.monotonic()
+        self.assertIn("timed out", self._probe())
+        self.assertLess(time.monotonic() - start, 3)
+        self.assertTrue(self.peer.is_down)
+
+
+if __name__ == "__main__":
+    unittest.main()
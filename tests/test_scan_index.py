@@ -0,0 +1,126 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+from echogit.config import Config
+from echogit.node import Node
+from echogit.scan_index import ScanIndex
+from echogit.sync_folder import SyncFolder
+
+
+class TestScanIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        env = mock.patch.dict(os.environ, {
+            "XDG_CACHE_HOME": os.path.join(self.tmp.name, "cache")})
+        env.start()
+        self.addCleanup(env.stop)
+
+        self.root = os.path.join(self.tmp.name, "projects")
+        self._add_project("a/p1")
+        self.config = Config(
+            config_string=f"[DEFAULT]\nprojects_path = {self.root}\n")
+
+    def _add_project(self, path):
+        path = os.path.join(self.root, path)
+        os.makedirs(os.path.join(path, ".git"))
+        os.makedirs(os.path.join(path, ".echogit"))
+        with open(os.path.join(path, ".echogit", "config.ini"), "w") as f:
+            f.write("[ECHOGIT]\nsync_type = git\n")
+
+    def _scan(self):
+        folder = SyncFolder(self.root, config=self.config)
+        folder.scan()
+        return sorted(project.path for project in folder.get_projects())
+
+    def test_warm_scan_is_identical(self):
+        cold = self._scan()
+        index = ScanIndex()
+        self.assertTrue(index.load())
+        self.assertEqual(self._scan(), cold)
+
+    def test_changes_are_detected(self):
+        self._scan()
+        self._add_project("a/p2")
+        self._add_project("b/p3")
+        self.assertEqual(self._scan(), [
+            os.path.join(self.root, path) for path in ["a/p1", "a/p2",
+                                                       "b/p3"]])
+
+    def test_entry_type_change(self):
+        self._scan()
+        project = os.path.join(self.root, "a/p1")
+        os.rmdir(os.path.join(project, ".git"))
+        with open(os.path.join(project, ".echogit/config.ini"), "w") as f:
+            f.write("[ECHOGIT]\nsync_type = rsync\n")
+        index = ScanIndex()
+        index.load()
+        entries = dict(index.get_entries(os.path.join(self.root, "a")))
+        self.assertEqual(entries["p1"], Node.NodeType.RSYNC_PROJECT)
+
+    def test_change_within_mtime_granularity(self):
+        # On a coarse mtime file system, a change right after a scan may
+        # leave the folder mtime as it was
+        folder = os.path.join(self.root, "a")
+        self._scan()
+        mtime = os.stat(folder).st_mtime_ns
+        self._add_project("a/p2")
+        os.utime(folder, ns=(mtime, mtime))
+        self.assertIn(os.path.join(self.root, "a/p2"), self._scan())
+
+    def test_old_folders_are_not_listed_again(self):
+        old = time.time() - 10
+        for root, _dirs, files in os.walk(self.root):
+            for path in [root] + [os.path.join(root, f) for f in files]:
+                os.utime(path, (old, old))
+        cold = self._scan()
+        with mock.patch.object(ScanIndex, "_list_subdirs") as list_subdirs:
+            self.assertEqual(self._scan(), cold)
+        list_subdirs.assert_not_called()
+
+    def test_config_added_to_echogit_folder(self):
+        project = os.path.join(self.root, "a/p2")
+        os.makedirs(os.path.join(project, ".echogit"))
+        old = time.time() - 10
+        for root, _dirs, files in os.walk(self.root):
+            for path in [root] + [os.path.join(root, f) for f in files]:
+                os.utime(path, (old, old))
+        self._scan()
+        # Only the mtime of the .echogit folder moves
+        with open(os.path.join(project, ".echogit/config.ini"), "w") as f:
+            f.write("[ECHOGIT]\nsync_type = rsync\n")
+        self.assertIn(project, self._scan())
+
+    def _get_tree(self, node):
+        return (node.get_type(), node.path,
+                [self._get_tree(child) for child in node.children])
+
+    def test_parallel_scan_is_identical(self):
+        for path in ["a/p2", "b/c/p3", "b/d/p4", "b/d/e/p5"]:
+            self._add_project(path)
+        os.makedirs(os.path.join(self.root, "empty/folder"))
+        os.makedirs(os.path.join(self.root, "b/repo.git"))
+
+        trees = []
+        for jobs in [1, 4]:
+            folder = SyncFolder(self.root, config=self.config)
+            folder.scan(jobs)
+            trees.append(self._get_tree(folder))
+            os.remove(ScanIndex().path)
+        self.assertEqual(trees[0], trees[1])
+
+    def test_type_from_subdirs(self):
+        self._add_project("b/p2")
+        os.makedirs(os.path.join(self.root, "b/p3/.git"))
+        for name in os.listdir(os.path.join(self.root, "b")):
+            path = os.path.join(self.root, "b", name)
+            self.assertEqual(
+                Node.get_type_from_subdirs(path, os.listdir(path)),
+                Node.get_type_from_folder(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
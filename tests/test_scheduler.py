@@ -0,0 +1,200 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from echogit.config import Config
+from echogit.peer_probe import PeerProbe
+from echogit.scheduler import PeerCircuit, Scheduler, SchedulerClient
+from echogit.status_store import StatusStore
+
+
+class TestPeerCircuit(unittest.TestCase):
+
+    def test_backoff_and_circuit(self):
+        circuit = PeerCircuit(threshold=3, base_delay=10, max_delay=25)
+        circuit.record_failure(0)
+        self.assertEqual(circuit.retry_at, 10)
+        circuit.record_failure(10)
+        self.assertEqual(circuit.retry_at, 30)
+        self.assertEqual(circuit.get_state(10), PeerCircuit.CLOSED)
+        circuit.record_failure(30)
+        self.assertEqual(circuit.retry_at, 55)
+        self.assertEqual(circuit.get_state(54), PeerCircuit.OPEN)
+        self.assertEqual(circuit.get_state(55), PeerCircuit.HALF_OPEN)
+        circuit.record_success()
+        self.assertEqual(circuit.get_state(55), PeerCircuit.CLOSED)
+        self.assertTrue(circuit.is_available(55))
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        env = mock.patch.dict(os.environ, {
+            "XDG_CACHE_HOME": os.path.join(self.tmp.name, "cache")})
+        env.start()
+        self.addCleanup(env.stop)
+        store = mock.patch.object(StatusStore, "_instance", StatusStore(
+            os.path.join(self.tmp.name, "status.db")))
+        store.start()
+        self.addCleanup(store.stop)
+
+        self.root = os.path.join(self.tmp.name, "projects")
+        self.p1 = self._add_project("p1")
+        self.p2 = self._add_project("p2")
+        self.config = Config(config_string=(
+            f"[DEFAULT]\nprojects_path = {self.root}\n\n"
+            "[PEERS]\npeers = slow:10.0.0.1:0, nas:10.0.0.2:5\n"))
+        self.scheduler = Scheduler(
+            self.root, config=self.config,
+            socket_path=os.path.join(self.tmp.name, "scheduler.sock"))
+        self.scheduler.load()
+
+    def _add_project(self, path):
+        path = os.path.join(self.root, path)
+        os.makedirs(os.path.join(path, ".git", "refs", "heads"))
+        os.makedirs(os.path.join(path, ".echogit"))
+        with open(os.path.join(path, ".echogit", "config.ini"), "w") as f:
+            f.write("[ECHOGIT]\nsync_type = git\n\n[BRANCHES]\n"
+                    "sync_branches = master\nsync_remotes = slow, nas\n")
+        return path
+
+    def _pop_all(self, now=0):
+        jobs = []
+        while True:
+            job, _wait = self.scheduler._pop(now)
+            if job is None:
+                return jobs
+            jobs.append(job)
+
+    def test_peer_priority_and_urgent_jobs(self):
+        self.assertEqual(self.scheduler.enqueue(self.root), 4)
+        # Already queued
+        self.assertEqual(self.scheduler.enqueue(self.p1), 0)
+        self.assertEqual(self.scheduler.enqueue(self.p2, "slow", True), 1)
+        jobs = self._pop_all()
+        self.assertEqual(jobs[0], (self.p2, "slow"))
+        self.assertEqual({peer for _path, peer in jobs[1:3]}, {"nas"})
+        self.assertEqual(jobs[3], (self.p1, "slow"))
+
+    def test_backoff_defers_peer_jobs(self):
+        self.scheduler.enqueue(self.root)
+        self.scheduler._get_circuit("nas").record_failure(0)
+        job, _wait = self.scheduler._pop(0)
+        self.assertEqual(job[1], "slow")
+        job, _wait = self.scheduler._pop(0)
+        self.assertEqual(job[1], "slow")
+        job, wait = self.scheduler._pop(0)
+        self.assertIsNone(job)
+        self.assertEqual(wait, 30)
+
+        # Jobs of a peer whose circuit is open are dropped
+        for now in [30, 90]:
+            self.scheduler._get_circuit("nas").record_failure(now)
+        self.assertEqual(self._pop_all(100), [])
+        self.assertEqual(self.scheduler.get_status()["queued"], 0)
+
+    def test_control_socket(self):
+        self.scheduler.start_server()
+        self.addCleanup(self.scheduler.stop_server)
+        client = SchedulerClient(self.scheduler.socket_path)
+        self.assertEqual(client.enqueue(self.p1, "nas"), 1)
+        self.assertEqual(client.request("status")["queued"], 1)
+        with self.assertRaises(RuntimeError):
+            client.request("unknown")
+        self.assertIn("invalid request",
+                      self.scheduler.handle("not json")["error"])
+        self.assertIn("error", self.scheduler.handle(
+            json.dumps({"id": 2, "op": "enqueue"})))
+
+    def test_probe_does_not_reset_peer(self):
+        peer = self.config.get_peer("nas")
+        peer.is_down = True
+        listing = peer._remote_projects = ["p1"]
+        probed = []
+
+        def probe(_probe, target, down=False):
+            probed.append(target)
+            target.is_down = down
+            return target
+
+        with mock.patch.object(PeerProbe, "probe", probe):
+            self.assertTrue(self.scheduler._check_peer(peer))
+        self.assertIsNot(probed[0], peer)
+        self.assertEqual(probed[0].host, peer.host)
+        self.assertFalse(peer.is_down)
+        # The listing used by running jobs is kept
+        self.assertIs(peer._remote_projects, listing)
+
+        def probe_down(_probe, target):
+            return probe(_probe, target, down=True)
+
+        with mock.patch.object(PeerProbe, "probe", probe_down):
+            self.assertFalse(self.scheduler._check_peer(
+                self.config.get_peer("slow")))
+        self.assertEqual(self.scheduler._get_circuit("slow").failures, 1)
+
+    def test_peer_listings_are_reset_each_round(self):
+        peer = self.config.get_peer("nas")
+        peer.config = Config(config_string="[DEFAULT]\ngit_path = /srv/\n")
+        heads = {"master": "a"}
+
+        def query_agent(op, **_args):
+            if op != "list":
+                return False, None
+            return True, [{"path": "p1.git/", "name": "p1",
+                           "heads": dict(heads)}]
+
+        peer._query_agent = query_agent
+        peer._fetch_remote_token = mock.Mock(return_value=None)
+        with mock.patch.object(Config, "_local_instance", self.config):
+            self.assertEqual(peer.get_remote_heads(self.p1), {"master": "a"})
+            heads["master"] = "b"
+            # The listing is read once per round
+            self.assertEqual(peer.get_remote_heads(self.p1), {"master": "a"})
+            self.scheduler.reset_peers()
+            self.assertEqual(peer.get_remote_heads(self.p1), {"master": "b"})
+
+            # Not while a job runs with the peer, but once it is done
+            heads["master"] = "c"
+            self.scheduler._running.add(self.p1)
+            self.scheduler._peer_jobs["nas"] = 1
+            self.scheduler.reset_peers()
+            self.assertEqual(peer.get_remote_heads(self.p1), {"master": "b"})
+            self.scheduler._job_done(self.p1, "nas")
+            self.assertEqual(peer.get_remote_heads(self.p1), {"master": "c"})
+
+    def test_stop_waits_for_running_jobs(self):
+        self.scheduler.jobs = 1
+        started, release = threading.Event(), threading.Event()
+        ran = []
+
+        def run_job(path, peer_name):
+            ran.append((path, peer_name))
+            started.set()
+            release.wait(10)
+
+        self.assertEqual(self.scheduler.enqueue(self.root), 4)
+        with mock.patch.object(self.scheduler, "run_job", run_job), \
+                contextlib.redirect_stdout(io.StringIO()):
+            self.scheduler.start_workers()
+            self.assertTrue(started.wait(10))
+            stopper = threading.Thread(target=self.scheduler.stop_workers)
+            stopper.start()
+            stopper.join(0.2)
+            # The running job is not killed
+            self.assertTrue(stopper.is_alive())
+            release.set()
+            stopper.join(10)
+        self.assertFalse(stopper.is_alive())
+        self.assertEqual(len(ran), 1)
+        self.assertEqual(self.scheduler.get_status()["queued"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
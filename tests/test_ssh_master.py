@@ -0,0 +1,74 @@
+import os
+import stat
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from echogit.ssh_master import SshMaster
+
+
+class TestSshMaster(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        # Stub ssh logging its arguments, one call per line
+        bin_path = os.path.join(self.tmp.name, "bin")
+        os.makedirs(bin_path)
+        self.log = os.path.join(self.tmp.name, "ssh.log")
+        ssh = os.path.join(bin_path, "ssh")
+        with open(ssh, "w") as f:
+            f.write(f'#!/bin/sh\necho "$@" >> {self.log}\n')
+        os.chmod(ssh, stat.S_IRWXU)
+        env = mock.patch.dict(os.environ, {
+            "PATH": f"{bin_path}{os.pathsep}{os.environ['PATH']}",
+            "XDG_RUNTIME_DIR": self.tmp.name})
+        env.start()
+        self.addCleanup(env.stop)
+
+    def _get_calls(self):
+        with open(self.log) as f:
+            return f.read().splitlines()
+
+    def test_start_and_stop(self):
+        master = SshMaster("peer", "host")
+        self.assertEqual(master.ssh_command(), [
+            "ssh", "-o", "ControlMaster=no", "-o",
+            f"ControlPath={master.control_path}"])
+        self.assertTrue(master.is_running)
+        calls = self._get_calls()
+        self.assertEqual(len(calls), 1)
+        self.assertIn("-M", calls[0].split())
+        self.assertIn(f"ControlPersist={SshMaster.CONTROL_PERSIST}",
+                      calls[0])
+
+        # The master is started once
+        master.ssh_command()
+        self.assertEqual(len(self._get_calls()), 1)
+
+        master.stop()
+        self.assertFalse(master.is_running)
+        self.assertEqual(self._get_calls()[1],
+                         f"-O exit -o ControlPath={master.control_path} host")
+        # Stopped once, even when stop is called again at exit
+        master.stop()
+        self.assertEqual(len(self._get_calls()), 2)
+
+    def test_concurrent_sessions_are_counted(self):
+        master = SshMaster("peer", "host")
+        self.addCleanup(master.stop)
+
+        def open_sessions():
+            for _ in range(200):
+                master.ssh_command()
+
+        threads = [threading.Thread(target=open_sessions) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(master.sessions, 1600)
+
+
+if __name__ == "__main__":
+    unittest.main()
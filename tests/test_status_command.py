@@ -0,0 +1,103 @@
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import unittest
+from unittest import mock
+from echogit.status_store import StatusStore
+from tests.local_peer import LocalPeerTestCase
+
+# The command line script is shadowed by the echogit package
+spec = importlib.util.spec_from_file_location(
+    "echogit_cli", os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                                "echogit.py"))
+echogit_cli = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(echogit_cli)
+
+
+class TestStatusCommand(LocalPeerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.p1 = self.add_project("p1", branches=("master", "dev"))
+        self.p2 = self.add_project("p2")
+        self._put(self.p1, "master", "2026-01-01T00:00:00", state="up-to-date")
+        self._put(self.p1, "dev", "2026-01-02T00:00:00", push=1)
+        self._put(self.p2, "master", "2026-01-03T00:00:00", peer_down=True)
+
+    def _put(self, path, branch, cache_date, push=0, peer_down=False,
+             state="synced"):
+        StatusStore.get_instance().put(path, "local", branch, {
+            "errors": {"remote_add": 0, "push": push, "pull": 0,
+                       "status": 0},
+            "stderr": {"push": "rejected" if push else ""}, "stdout": {},
+            "peer_down": peer_down, "cache_date": cache_date,
+            "state": state})
+
+    def _status(self, output_format):
+        """Run the status command, checking that it runs no command."""
+        output = io.StringIO()
+        with mock.patch("subprocess.run") as run, \
+                mock.patch("subprocess.Popen") as popen, \
+                contextlib.redirect_stdout(output):
+            echogit_cli.handle_status_command(self.root, output_format)
+        run.assert_not_called()
+        popen.assert_not_called()
+        return output.getvalue()
+
+    def test_tree(self):
+        # Projects are listed in the order of the folder
+        root, *projects = self._status("tree").splitlines()
+        self.assertEqual(root, "projects/")
+        self.assertEqual(sorted(projects), [
+            "  p1 [P] last sync: 2026-01-02T00:00:00",
+            "  p2 [OK] last sync: 2026-01-03T00:00:00 down: local"])
+
+    def test_table(self):
+        header, *rows = [line.split()
+                         for line in self._status("table").splitlines()]
+        self.assertEqual(header, ["PROJECT", "STATE", "LAST", "SYNC",
+                                  "DOWN"])
+        self.assertEqual(sorted(rows), [
+            ["p1/", "P", "2026-01-02T00:00:00"],
+            ["p2/", "OK", "2026-01-03T00:00:00", "local"]])
+
+    def test_json(self):
+        records = {record["name"]: record
+                   for record in json.loads(self._status("json"))}
+        p1, p2 = records["p1"], records["p2"]
+        self.assertEqual(p1["path"], "p1/")
+        self.assertEqual(p1["sync_type"], "git")
+        self.assertEqual(p1["state"], "P")
+        self.assertTrue(p1["has_error"])
+        self.assertEqual(p1["last_sync"], "2026-01-02T00:00:00")
+        self.assertEqual(p1["peers_down"], [])
+        branches = {branch["branch"]: branch for branch in p1["branches"]}
+        self.assertEqual(branches["master"]["state"], "up-to-date")
+        self.assertEqual(branches["dev"], {
+            "peer": "local", "branch": "dev",
+            "errors": {"remote_add": 0, "push": 1, "pull": 0, "status": 0},
+            "state": "synced", "cache_date": "2026-01-02T00:00:00",
+            "peer_down": False})
+        self.assertFalse(p2["has_error"])
+        self.assertEqual(p2["peers_down"], ["local"])
+        self.assertTrue(p2["branches"][0]["peer_down"])
+
+    def test_json_messages_go_to_stderr(self):
+        # A peer missing from the configuration cannot be synced
+        config = os.path.join(self.add_project("p3"), ".echogit/config.ini")
+        with open(config) as f:
+            text = f.read()
+        with open(config, "w") as f:
+            f.write(text.replace("sync_remotes = local",
+                                 "sync_remotes = local, missing"))
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            records = json.loads(self._status("json"))
+        self.assertEqual(len(records), 3)
+        self.assertIn("cant sync missing", stderr.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from echogit.status_store import StatusStore
+
+
+class TestStatusStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db = os.path.join(self.tmp.name, "status.db")
+        self.store = StatusStore(self.db)
+
+    def _status(self, push=0):
+        return {"errors": {"push": push}, "stderr": {"push": ""},
+                "stdout": {"push": ""}, "peer_down": False,
+                "cache_date": "2026-01-01T00:00:00", "state": "synced"}
+
+    def test_branches_are_independent(self):
+        self.store.put("/p", "peer", "master", self._status(0))
+        self.store.put("/p", "peer", "dev", self._status(1))
+        store = StatusStore(self.db)
+        self.assertEqual(store.get("/p", "peer", "master")["errors"],
+                         {"push": 0})
+        self.assertEqual(store.get("/p", "peer", "dev")["errors"],
+                         {"push": 1})
+        self.assertIsNone(store.get("/p", "other", "master"))
+        self.assertEqual(len(store.get_all("/p")), 2)
+        self.assertEqual(store.get_all("/other"), {})
+
+    def test_changes_of_other_processes_are_read(self):
+        self.assertIsNone(self.store.get("/p", "peer", "master"))
+        other = StatusStore(self.db)
+        other.put("/p", "peer", "master", self._status(1))
+        self.assertEqual(self.store.get("/p", "peer", "master")["errors"],
+                         {"push": 1})
+        other.put("/p", "peer", "master", self._status(0))
+        self.assertEqual(self.store.get_all("/p")[
+            ("/p", "peer", "master")]["errors"], {"push": 0})
+
+    def _run_thread(self, target):
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join()
+
+    def test_own_commits_are_not_read_again(self):
+        self.store.get("/p", "peer", "master")
+        with mock.patch.object(self.store, "_load",
+                               wraps=self.store._load) as load:
+            self._run_thread(lambda: self.store.put(
+                "/p", "peer", "master", self._status(1)))
+            self.assertEqual(self.store.get("/p", "peer", "master")
+                             ["errors"], {"push": 1})
+        load.assert_not_called()
+
+    def test_new_thread_reads_changes_of_other_processes(self):
+        self.assertIsNone(self.store.get("/p", "peer", "master"))
+        StatusStore(self.db).put("/p", "peer", "master", self._status(1))
+        statuses = []
+        self._run_thread(lambda: statuses.append(
+            self.store.get("/p", "peer", "master")))
+        self.assertEqual(statuses[0]["errors"], {"push": 1})
+
+    def test_concurrent_writers(self):
+        def write(peer):
+            for i in range(20):
+                self.store.put("/p", peer, f"b{i}", self._status())
+
+        threads = [threading.Thread(target=write, args=(f"peer{i}",))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(StatusStore(self.db).get_all()), 80)
+
+    def test_import_status_cache(self):
+        project = os.path.join(self.tmp.name, "project")
+        os.makedirs(os.path.join(project, ".echogit"))
+        with open(os.path.join(project, ".echogit/status_cache.ini"),
+                  "w") as f:
+            f.write("[Errors]\npush = 1\n\n[Stderr]\npush = rejected\n\n"
+                    "[Stdout]\npush =\n\n[Meta]\npeer_down = False\n"
+                    "cache_date = 2026-01-01T00:00:00\n")
+        self.assertTrue(self.store.import_status_cache(
+            project, "peer", ["master", "dev"]))
+        status = StatusStore(self.db).get(project, "peer", "dev")
+        self.assertEqual(status["errors"], {"push": 1})
+        self.assertEqual(status["stderr"], {"push": "rejected"})
+        self.assertFalse(self.store.import_status_cache(
+            self.tmp.name, "peer", ["master"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import os
+import tempfile
+import unittest
+from echogit.sync_node_config import SyncNodeConfig
+
+
+class TestSyncNodeConfig(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.config_file = os.path.join(self.tmp.name, ".echogit",
+                                        "config.ini")
+        os.makedirs(os.path.dirname(self.config_file))
+        self._write("git")
+
+    def _write(self, sync_type):
+        with open(self.config_file, "w") as f:
+            f.write(f"[ECHOGIT]\nsync_type = {sync_type}\n")
+
+    def test_config_is_shared(self):
+        config = SyncNodeConfig.from_file(self.tmp.name, self.config_file)
+        self.assertIs(
+            SyncNodeConfig.from_file(self.tmp.name, self.config_file), config)
+        self.assertEqual(
+            SyncNodeConfig.get_sync_type_from_config(self.config_file), "git")
+
+    def test_modified_config_is_reloaded(self):
+        SyncNodeConfig.from_file(self.tmp.name, self.config_file)
+        self._write("rsync")
+        os.utime(self.config_file, ns=(0, 0))
+        config = SyncNodeConfig.from_file(self.tmp.name, self.config_file)
+        self.assertEqual(config.sync_type, "rsync")
+
+    def test_missing_config(self):
+        os.remove(self.config_file)
+        self.assertIsNone(
+            SyncNodeConfig.from_file(self.tmp.name, self.config_file))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+from echogit.status_store import StatusStore
+from echogit.sync_order import SyncOrder
+from echogit.sync_pool import SyncPool
+
+
+class FakeProject:
+
+    def __init__(self, path, mtime, duration=0):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.mtime = mtime
+        self.duration = duration
+        self.children = []
+
+    def get_mtime(self):
+        return self.mtime
+
+    def sync(self, verbose=False):
+        time.sleep(self.duration)
+        return 1, 1
+
+
+class TestSyncOrder(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = StatusStore(os.path.join(self.tmp.name, "status.db"))
+        patch = mock.patch.object(StatusStore, "_instance", self.store)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.order = SyncOrder(os.path.join(self.tmp.name, "deferred.json"))
+
+    def _synced(self, project, errors=0):
+        self.store.put(project.path, "peer", "master", {
+            "errors": {"push": errors}, "stderr": {}, "stdout": {},
+            "peer_down": False, "cache_date": "2026-01-01T00:00:00",
+            "state": "synced"})
+
+    def test_parse_duration(self):
+        self.assertEqual(SyncOrder.parse_duration("90"), 90)
+        self.assertEqual(SyncOrder.parse_duration("60s"), 60)
+        self.assertEqual(SyncOrder.parse_duration("5m"), 300)
+        self.assertEqual(SyncOrder.parse_duration("1.5h"), 5400)
+        with self.assertRaises(ValueError):
+            SyncOrder.parse_duration("soon")
+
+    def test_deferred_then_dirty_first(self):
+        clean, dirty, failed, deferred = [
+            FakeProject(f"/p/{name}", 0)
+            for name in ["clean", "dirty", "failed", "deferred"]]
+        for project in [clean, failed, deferred]:
+            self._synced(project, errors=project is failed)
+        dirty.mtime = time.time()
+        self.order.save_deferred([deferred], [deferred])
+
+        projects = self.order.sort([clean, dirty, failed, deferred])
+        self.assertEqual(projects[0], deferred)
+        self.assertEqual(set(projects[1:3]), {dirty, failed})
+        self.assertEqual(projects[3], clean)
+
+        # Projects outside of a run stay deferred
+        self.order.save_deferred([clean], [clean, dirty])
+        self.assertEqual(self.order.load_deferred(),
+                         {clean.path, deferred.path})
+
+    def test_deadline_defers_projects(self):
+        projects = [FakeProject(f"/p/{i}", 0, duration=0.05)
+                    for i in range(6)]
+        pool = SyncPool(1)
+        success, total = pool.sync(projects,
+                                   deadline=time.monotonic() + 0.12)
+        self.assertEqual(success, total)
+        self.assertEqual(total + len(pool.deferred), 6)
+        self.assertLess(total, 6)
+        self.assertEqual(pool.deferred, projects[total:])
+
+
+if __name__ == "__main__":
+    unittest.main()
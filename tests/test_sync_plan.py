@@ -0,0 +1,94 @@
+import os
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+from echogit.config import Config
+from echogit.git_refs import GitRefs
+from echogit.peer import Peer
+from echogit.rsync_repository_peer import RsyncRepositoryPeer
+from echogit.status_store import StatusStore
+from echogit.sync_branch import SyncBranch
+
+
+class TestSyncPlan(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        store = mock.patch.object(StatusStore, "_instance", StatusStore(
+            os.path.join(self.tmp.name, "status.db")))
+        store.start()
+        self.addCleanup(store.stop)
+
+        self.path = os.path.join(self.tmp.name, "project")
+        os.makedirs(self.path)
+        self._git("init", "-q", "-b", "master")
+        self.base = self._commit("base")
+        config = Config(config_string=f"[DEFAULT]\nprojects_path = "
+                                      f"{self.tmp.name}\n")
+        self.branch = SyncBranch("master", path=self.path,
+                                 peer=Peer("peer", "host"), config=config)
+
+    def _git(self, *args):
+        subprocess.run(["git", "-c", "user.name=t", "-c", "user.email=t@t",
+                        *args], cwd=self.path, check=True,
+                       capture_output=True)
+
+    def _commit(self, name):
+        with open(os.path.join(self.path, name), "w") as f:
+            f.write(name)
+        self._git("add", name)
+        self._git("commit", "-q", "-m", name)
+        return GitRefs.resolve(self.path, "HEAD")
+
+    def _get_state(self, local, remote, clean=True):
+        record = self.branch.get_plan_record(
+            {"master": local} if local else {},
+            {"master": remote} if remote else {}, "master", clean)
+        return record["state"], record["ahead"], record["behind"]
+
+    def test_states(self):
+        local = self._commit("local")
+        self.assertEqual(self._get_state(local, local), ("up-to-date", None,
+                                                         None))
+        self.assertEqual(self._get_state(local, self.base), ("ahead", 1, 0))
+        self.assertEqual(self._get_state(self.base, local), ("behind", 0, 1))
+        self.assertEqual(self._get_state(local, None)[0], "ahead")
+        self.assertEqual(self._get_state(None, local)[0], "behind")
+        self.assertEqual(self._get_state(local, local, clean=False)[0],
+                         "dirty")
+
+        self._git("checkout", "-q", "-b", "other", self.base)
+        other = self._commit("other")
+        self.assertEqual(self._get_state(local, other), ("diverged", 1, 1))
+
+    def test_unknown_remote_commit(self):
+        unknown = "1" * 40
+        # Nothing fetched from the peer yet
+        self.assertEqual(self._get_state(self.base, unknown)[0], "diverged")
+        self._git("update-ref", "refs/remotes/peer/master", self.base)
+        self.assertEqual(self._get_state(self.base, unknown)[0], "behind")
+        self._commit("local")
+        local = GitRefs.resolve(self.path, "HEAD")
+        self.assertEqual(self._get_state(local, unknown)[0], "diverged")
+
+    def test_rsync_stats(self):
+        output = ("Number of files: 12 (reg: 10, dir: 2)\n"
+                  "Number of regular files transferred: 3\n"
+                  "Total file size: 45,678 bytes\n"
+                  "Total transferred file size: 1,234 bytes\n")
+        self.assertEqual(RsyncRepositoryPeer._parse_stats(output),
+                         (3, 1234))
+        # Older rsync versions
+        output = ("Number of files: 12\n"
+                  "Number of files transferred: 4\n"
+                  "Total transferred file size: 1,234 bytes\n")
+        self.assertEqual(RsyncRepositoryPeer._parse_stats(output),
+                         (4, 1234))
+        with self.assertRaises(ValueError):
+            RsyncRepositoryPeer._parse_stats("Total file size: 0 bytes\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
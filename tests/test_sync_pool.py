@@ -0,0 +1,116 @@
+import contextlib
+import io
+import sys
+import threading
+import unittest
+from unittest import mock
+from echogit.config import Config
+from echogit.git_repository_peer import GitRepositoryPeer
+from echogit.peer import Peer
+from echogit.sync_pool import SyncPool
+from tests.local_peer import LocalPeerTestCase
+
+
+class RaisingProject:
+    name = "raising"
+    children = []
+
+    def sync(self, verbose=False):
+        print("partial output")
+        raise SystemExit(1)
+
+
+class SessionProject:
+    """Project syncing with one peer, holding one of its sessions."""
+
+    def __init__(self, name, peer, started, release=None):
+        self.name = name
+        self.peer = peer
+        self.children = [self]
+        self.started = started
+        self.release = release
+        self.released = None
+
+    def sync(self, verbose=False):
+        with self.peer.session():
+            self.started.append(self.name)
+            if self.release is not None:
+                self.released = self.release.wait(5)
+        return 1, 1
+
+
+class TestSyncPool(LocalPeerTestCase):
+
+    def test_projects_sync_concurrently_with_grouped_output(self):
+        projects = [self.load_project(self.add_project(name))
+                    for name in ["p1", "p2"]]
+        # Both projects must be fetching at the same time to get through
+        barrier = threading.Barrier(2, timeout=10)
+        fetch = GitRepositoryPeer._fetch
+
+        def concurrent_fetch(repository, *args):
+            print(f"{repository.parent.name} fetching")
+            barrier.wait()
+            return fetch(repository, *args)
+
+        output = io.StringIO()
+        with mock.patch.object(GitRepositoryPeer, "_fetch",
+                               concurrent_fetch), \
+                contextlib.redirect_stdout(output):
+            result = SyncPool(2, verbose=True).sync(projects)
+        self.assertEqual(result, (2, 2))
+
+        # Each project prints its marker, then its git output and its
+        # summary, without lines of the other project in between
+        current = None
+        summaries = []
+        for line in output.getvalue().splitlines():
+            if line.endswith(" fetching"):
+                self.assertIsNone(current)
+                current = line.split()[0]
+            elif line.endswith(": 1/1"):
+                self.assertEqual(line, f"{current}: 1/1")
+                summaries.append(current)
+                current = None
+        self.assertEqual(sorted(summaries), ["p1", "p2"])
+
+    def test_streams_restored_when_a_worker_dies(self):
+        stdout, stderr = sys.stdout, sys.stderr
+        with self.assertRaises(SystemExit):
+            SyncPool(2).sync([RaisingProject()])
+        self.assertIs(sys.stdout, stdout)
+        self.assertIs(sys.stderr, stderr)
+
+
+class TestSyncPoolSessions(unittest.TestCase):
+
+    def _get_peer(self, name, max_sessions):
+        peer = Peer(name, "host")
+        peer.load_options(Config(config_string=(
+            f"[PEERS]\nmax_sessions = {max_sessions}\n")))
+        return peer
+
+    def test_busy_peer_is_skipped(self):
+        weak = self._get_peer("weak", 1)
+        other = self._get_peer("other", 0)
+        started = []
+        release = threading.Event()
+        projects = [SessionProject("w1", weak, started, release),
+                    SessionProject("w2", weak, started),
+                    SessionProject("o1", other, started),
+                    SessionProject("o2", other, started)]
+
+        def progress(project, success, total):
+            # The weak peer is released once the other peer is done
+            if project.name == "o2":
+                release.set()
+
+        result = SyncPool(2).sync(projects, progress)
+        self.assertEqual(result, (4, 4))
+        # w2 waited for w1 without holding the second worker
+        self.assertTrue(projects[0].released)
+        self.assertEqual(started, ["w1", "o1", "o2", "w2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import contextlib
+import io
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+from echogit.git_project import GitProject
+from echogit.sync_worker import SyncWorker
+from tests.local_peer import LocalPeerTestCase
+
+
+class TestSyncWorker(LocalPeerTestCase):
+
+    def _wait(self, worker, node):
+        deadline = time.monotonic() + 10
+        while worker.is_pending(node):
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_only_the_sync_output_is_discarded(self):
+        project = self.load_project(self.add_project("p"))
+        syncing, printed = threading.Event(), threading.Event()
+        sync = GitProject.sync
+
+        def noisy_sync(node, verbose=False):
+            print("sync output")
+            print("sync errors", file=sys.stderr)
+            syncing.set()
+            printed.wait(10)
+            return sync(node, verbose)
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        worker = SyncWorker(jobs=2)
+        with mock.patch.object(GitProject, "sync", noisy_sync), \
+                contextlib.redirect_stdout(stdout), \
+                contextlib.redirect_stderr(stderr):
+            self.assertTrue(worker.sync(project))
+            self.assertTrue(syncing.wait(10))
+            # The user interface keeps printing while the sync runs
+            print("main output")
+            print("main errors", file=sys.stderr)
+            printed.set()
+            self._wait(worker, project)
+        self.assertIsNone(worker.last_error)
+        self.assertEqual(project.sync_done, 1)
+        self.assertEqual(stdout.getvalue(), "main output\n")
+        self.assertEqual(stderr.getvalue(), "main errors\n")
+
+    def test_peers_are_reset_before_each_sync(self):
+        project = self.load_project(self.add_project("p"))
+        worker = SyncWorker()
+        with mock.patch.object(self.peer, "reset",
+                               wraps=self.peer.reset) as reset, \
+                mock.patch("echogit.sync_worker.PeerProbe") as probe:
+            for count in [1, 2]:
+                self.assertTrue(worker.sync(project))
+                self._wait(worker, project)
+                self.assertEqual(reset.call_count, count)
+                self.assertEqual(probe.return_value.probe_all.call_count,
+                                 count)
+        self.assertIsNone(worker.last_error)
+        self.assertEqual(project.sync_done, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
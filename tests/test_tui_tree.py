@@ -0,0 +1,115 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from echogit import tui
+from echogit.config import Config
+from echogit.node import Node
+from echogit.status_store import StatusStore
+from echogit.sync_folder import SyncFolder
+from echogit.tui_tree import TreeWalker
+
+
+class TestTreeWalker(unittest.TestCase):
+
+    def setUp(self):
+        # root: a (a1, a2), b (b1), c
+        self.root = Node("root", path="/nonexistent")
+        self.nodes = {"root": self.root}
+        for parent, names in [("root", "abc"), ("a", ["a1", "a2"]),
+                              ("b", ["b1"])]:
+            for name in names:
+                node = Node(name, path="/nonexistent")
+                self.nodes[parent].add_child(node)
+                self.nodes[name] = node
+        self.walker = TreeWalker(self.root, lambda node, depth: None)
+
+    def _names(self):
+        return [node.name for node in self.walker.rows()]
+
+    def test_expand_and_collapse(self):
+        self.assertEqual(self._names(), ["root"])
+        self.walker.expand(self.root)
+        self.walker.expand(self.nodes["a"])
+        self.walker.expand(self.nodes["b"])
+        self.assertEqual(self._names(),
+                         ["root", "a", "a1", "a2", "b", "b1", "c"])
+        self.walker.collapse(self.nodes["a"])
+        self.assertEqual(self._names(), ["root", "a", "b", "b1", "c"])
+
+    def test_prev_position(self):
+        for name in ["root", "a", "b"]:
+            self.walker.expand(self.nodes[name])
+        rows = list(self.walker.rows())
+        for prev, node in zip(rows, rows[1:]):
+            self.assertIs(self.walker.prev_position(node), prev)
+
+    def test_collapse_moves_focus(self):
+        self.walker.expand(self.root)
+        self.walker.expand(self.nodes["a"])
+        self.walker.set_focus(self.nodes["a2"])
+        self.walker.collapse(self.nodes["a"])
+        self.assertIs(self.walker.focus, self.nodes["a"])
+
+
+class TestLazyTui(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        env = mock.patch.dict(os.environ, {
+            "XDG_CACHE_HOME": os.path.join(self.tmp.name, "cache")})
+        env.start()
+        self.addCleanup(env.stop)
+        store = mock.patch.object(StatusStore, "_instance", StatusStore(
+            os.path.join(self.tmp.name, "status.db")))
+        store.start()
+        self.addCleanup(store.stop)
+
+        self.root_path = os.path.join(self.tmp.name, "projects")
+        for path in ["a/p1", "b/c/p2"]:
+            path = os.path.join(self.root_path, path)
+            os.makedirs(os.path.join(path, ".git"))
+            os.makedirs(os.path.join(path, ".echogit"))
+            with open(os.path.join(path, ".echogit", "config.ini"),
+                      "w") as f:
+                f.write("[ECHOGIT]\nsync_type = git\n")
+        config = Config(config_string=(
+            f"[DEFAULT]\nprojects_path = {self.root_path}\n"))
+        self.root = SyncFolder(self.root_path, config=config)
+        self.listbox = tui.build_ui(self.root)
+        self.walker = self.listbox.body
+
+    def _get_child(self, folder, name):
+        return next(child for child in folder.children if child.name == name)
+
+    def test_expanding_a_folder_scans_only_that_folder(self):
+        # Only the top level is scanned to show the root
+        self.assertTrue(self.root.scanned)
+        a = self._get_child(self.root, "a")
+        b = self._get_child(self.root, "b")
+        self.assertFalse(a.scanned or b.scanned)
+        self.assertEqual(a.children + b.children, [])
+
+        self.walker.expand(a)
+        self.assertTrue(a.scanned)
+        self.assertEqual([child.name for child in a.children], ["p1"])
+        self.assertFalse(b.scanned)
+        self.assertEqual(b.children, [])
+
+    def test_logs_are_loaded_on_demand(self):
+        a = self._get_child(self.root, "a")
+        self.walker.expand(a)
+        project = a.children[0]
+        project.get_logs = mock.Mock(return_value="logs")
+        self.listbox.render((80, 10))
+        project.get_logs.assert_not_called()
+
+        widget = self.walker.get_widget(project)
+        with mock.patch.object(tui, "main_loop", create=True):
+            self.assertIsNone(widget.keypress((80,), "l"))
+        project.get_logs.assert_called_once_with()
+
+
+if __name__ == "__main__":
+    unittest.main()
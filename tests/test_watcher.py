@@ -0,0 +1,170 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+from echogit.config import Config
+from echogit.fs_watch import PollWatcher
+from echogit.git_project import GitProject
+from echogit.git_refs import GitRefs
+from echogit.watcher import Watcher
+from tests.local_peer import LocalPeerTestCase
+
+
+class TestWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        env = mock.patch.dict(os.environ, {
+            "XDG_CACHE_HOME": os.path.join(self.tmp.name, "cache")})
+        env.start()
+        self.addCleanup(env.stop)
+
+        self.root = os.path.join(self.tmp.name, "projects")
+        self.git_path = os.path.join(self.tmp.name, "git")
+        self.p1 = self._add_project("a/p1")
+        os.makedirs(os.path.join(self.git_path, "a/p1.git/refs/heads"))
+        self.config = Config(config_string=(
+            f"[DEFAULT]\nprojects_path = {self.root}\n"
+            f"git_path = {self.git_path}\n"))
+
+    def _add_project(self, path):
+        path = os.path.join(self.root, path)
+        os.makedirs(os.path.join(path, ".git", "refs", "heads"))
+        os.makedirs(os.path.join(path, ".echogit"))
+        with open(os.path.join(path, ".echogit", "config.ini"), "w") as f:
+            f.write("[ECHOGIT]\nsync_type = git\n")
+        return path
+
+    def _write(self, path, data="x"):
+        with open(path, "w") as f:
+            f.write(data)
+
+    def _create_watchers(self):
+        for poll in [False, True]:
+            watcher = Watcher(self.root, config=self.config, poll=poll,
+                              full_sync=0)
+            if poll:
+                watcher.backend = PollWatcher(interval=0)
+            self.addCleanup(watcher.backend.close)
+            watcher.load()
+            yield watcher
+
+    def _wait(self, watcher):
+        watcher.wait(0.2)
+        while watcher.backend.drain():
+            pass
+
+    def test_commit_marks_project_dirty(self):
+        for watcher in self._create_watchers():
+            self._write(os.path.join(self.p1, "file"))
+            self._write(os.path.join(self.p1, ".git", "FETCH_HEAD"))
+            self._wait(watcher)
+            self.assertEqual(watcher.dirty, set())
+
+            self._write(os.path.join(self.p1, ".git/refs/heads/master"))
+            self._wait(watcher)
+            self.assertEqual(watcher.dirty, {self.p1})
+            watcher.dirty.clear()
+
+    def test_push_to_bare_repo_marks_project_dirty(self):
+        for watcher in self._create_watchers():
+            self._write(os.path.join(self.git_path,
+                                     "a/p1.git/refs/heads/master"))
+            self._wait(watcher)
+            self.assertEqual(watcher.dirty, {self.p1})
+            watcher.dirty.clear()
+
+    def test_work_tree_of_auto_commit_project(self):
+        self._write(os.path.join(self.p1, ".echogit", "config.ini"),
+                    "[DEFAULT]\nauto_commit = true\n\n"
+                    "[ECHOGIT]\nsync_type = git\n")
+        os.makedirs(os.path.join(self.p1, "src"))
+        for watcher in self._create_watchers():
+            self._write(os.path.join(self.p1, ".git", "index"))
+            self._wait(watcher)
+            self.assertEqual(watcher.dirty, set())
+
+            self._write(os.path.join(self.p1, "src", "file"))
+            self._wait(watcher)
+            self.assertEqual(watcher.dirty, {self.p1})
+            watcher.dirty.clear()
+
+    def test_new_project(self):
+        for i, watcher in enumerate(self._create_watchers()):
+            path = self._add_project(f"b/p{i}")
+            self._wait(watcher)
+            self.assertTrue(watcher.rescan_needed)
+            watcher.load()
+            self.assertIn(path, watcher.dirty)
+
+
+class TestWatcherSync(LocalPeerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = self.add_project("p")
+        self.bare = os.path.join(self.git_path, "p.git")
+        self.watcher = Watcher(self.root, config=self.config, full_sync=0)
+        self.addCleanup(self.watcher.backend.close)
+        self._sync(self.watcher.sync_all)
+        self.assertEqual(self.watcher.dirty, set())
+
+    def _sync(self, sync, *args):
+        with contextlib.redirect_stdout(io.StringIO()):
+            sync(*args)
+
+    def test_events_of_the_sync_are_dropped(self):
+        commit = self.commit(self.path, "local")
+        self.watcher.wait(0.2)
+        self.assertEqual(self.watcher.dirty, {self.path})
+        self._sync(self.watcher.sync, list(self.watcher.dirty))
+        self.assertEqual(GitRefs.get_heads(self.bare, bare=True)["master"],
+                         commit)
+        self.assertEqual(self.watcher.dirty, set())
+        self.assertIsNone(self.watcher.first_event)
+
+    def test_commit_during_sync_is_synced_again(self):
+        sync = GitProject.sync
+
+        def sync_and_commit(project, verbose=False):
+            result = sync(project, verbose)
+            self.commit(self.path, "during sync")
+            return result
+
+        with mock.patch.object(GitProject, "sync", sync_and_commit):
+            self._sync(self.watcher.sync, [self.path])
+        self.assertEqual(self.watcher.dirty, {self.path})
+        self.assertIsNotNone(self.watcher.first_event)
+
+        self._sync(self.watcher.sync, list(self.watcher.dirty))
+        self.assertEqual(GitRefs.get_heads(self.bare, bare=True)["master"],
+                         GitRefs.resolve(self.path, "HEAD"))
+        self.assertEqual(self.watcher.dirty, set())
+
+    def test_edit_of_auto_commit_project_is_synced(self):
+        path = self.add_project("q")
+        config = os.path.join(path, ".echogit", "config.ini")
+        with open(config) as f:
+            text = f.read()
+        with open(config, "w") as f:
+            f.write("[DEFAULT]\nauto_commit = true\n\n" + text)
+        self._sync(self.watcher.sync_all)
+
+        with open(os.path.join(path, "file"), "w") as f:
+            f.write("edit")
+        self.watcher.wait(0.2)
+        self.assertEqual(self.watcher.dirty, {path})
+        self._sync(self.watcher.sync, list(self.watcher.dirty))
+        self.assertEqual(self.git(path, "status", "--porcelain"), "")
+        self.assertEqual(
+            GitRefs.get_heads(os.path.join(self.git_path, "q.git"),
+                              bare=True)["master"],
+            GitRefs.resolve(path, "HEAD"))
+        self.assertEqual(self.watcher.dirty, set())
+
+
+if __name__ == "__main__":
+    unittest.main()